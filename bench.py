@@ -0,0 +1,193 @@
+"""
+    Scale benchmarks for the world simulator.
+
+    Times the hot paths on synthetic worlds of increasing size and prints
+    one JSON document with throughput and peak memory per case, e.g.
+
+        python bench.py --sizes 1000 10000 --output bench_output.txt
+        python bench.py --compare old.json new.json
+"""
+import argparse
+import json
+import multiprocessing
+import Queue
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import synth
+from linkathon import point_in_triangle, triangle_hits
+from worldsim import World
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def timed(results, case, ops, function, *args):
+    start = time.time()
+    function(*args)
+    seconds = max(time.time() - start, 1e-9)
+    results.append({
+        'case': case,
+        'ops': ops,
+        'seconds': seconds,
+        'ops_per_sec': ops / seconds,
+        'peak_rss_kb': peak_rss(),
+    })
+
+
+def run_size(distribution, size, seed, queries):
+    rng = random.Random(seed)
+    records = synth.DISTRIBUTIONS[distribution](size, seed=seed)
+    results = []
+    world = World()
+    portals = []
+    timed(
+        results, 'add_portal', size,
+        lambda: portals.extend(synth.populate(world, records))
+    )
+    links = synth.random_link_plan(portals, min(size, queries), seed=seed)
+
+    def create_links():
+        for (portal_from, portal_to) in links:
+            world.create_link(portal_from, portal_to)
+
+    timed(results, 'create_link', len(links), create_links)
+    pairs = [
+        (rng.choice(portals), rng.choice(portals)) for _ in xrange(queries)
+    ]
+    timed(
+        results, 'link_exists', queries,
+        lambda: [world.link_exists(a, b) for (a, b) in pairs]
+    )
+    triples = [tuple(rng.sample(portals, 3)) for _ in xrange(queries)]
+    timed(
+        results, 'field_exists', queries,
+        lambda: [world.field_exists(*triple) for triple in triples]
+    )
+    points = [rng.choice(portals).location for _ in xrange(queries)]
+    corners = [[p.location for p in triple] for triple in triples]
+    timed(
+        results, 'point_in_triangle', queries,
+        lambda: [
+            point_in_triangle(point, *triangle)
+            for (point, triangle) in zip(points, corners)
+        ]
+    )
+    triangles = corners[:100]
+    timed(
+        results, 'triangle_hits', size * len(triangles),
+        triangle_hits, [p.location for p in portals], triangles
+    )
+    for result in results:
+        result.update({'distribution': distribution, 'size': size})
+    return results
+
+
+def _run_in_child(args, queue):
+    queue.put(run_size(*args))
+
+
+def isolated(distribution, size, seed, queries, poll=1.0):
+    """
+        Run one size in a fresh process so peak memory is its own. A child
+        that dies without reporting, killed when out of memory say, raises
+        ValueError rather than leaving us waiting.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_run_in_child,
+        args=((distribution, size, seed, queries), queue)
+    )
+    process.start()
+    while True:
+        try:
+            results = queue.get(timeout=poll)
+            break
+        except Queue.Empty:
+            if process.exitcode is not None:
+                raise ValueError(
+                    "Benchmark of {} {} exited with code {}".format(
+                        distribution, size, process.exitcode
+                    )
+                )
+    process.join()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, distributions, seed=0, queries=20000):
+    return {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'seed': seed,
+        'results': [
+            result
+            for distribution in distributions
+            for size in sizes
+            for result in isolated(distribution, size, seed, queries)
+        ],
+    }
+
+
+def compare(old, new, tolerance=0.2):
+    """
+        Cases whose throughput in `new` fell by more than `tolerance`
+        against `old`, as `(distribution, size, case, old, new)` rows.
+    """
+    def keyed(report):
+        return dict(
+            ((r['distribution'], r['size'], r['case']), r['ops_per_sec'])
+            for r in report['results']
+        )
+
+    (before, after) = (keyed(old), keyed(new))
+    return [
+        key + (before[key], after[key])
+        for key in sorted(set(before) & set(after))
+        if after[key] < before[key] * (1 - tolerance)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument(
+        '--distributions', nargs='+', default=['uniform'],
+        choices=sorted(synth.DISTRIBUTIONS)
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--output')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+    if args.compare:
+        (old, new) = [json.load(open(path)) for path in args.compare]
+        regressions = compare(old, new, args.tolerance)
+        for row in regressions:
+            print "{} {} {}: {:.0f} -> {:.0f} ops/s".format(*row)
+        return 1 if regressions else 0
+    report = run(args.sizes, args.distributions, args.seed, args.queries)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            stream.write(text + '\n')
+    else:
+        print text
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
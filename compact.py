@@ -0,0 +1,592 @@
+from array import array
+
+import exact
+from resolver import NameIndex
+from spatial import GridIndex, LocalProjection, SegmentIndex
+from worldsim import World
+
+
+def pair_key(id_one, id_two):
+    if id_one > id_two:
+        (id_one, id_two) = (id_two, id_one)
+    return (id_one << 32) | id_two
+
+
+def triple_key(id1, id2, id3):
+    (id1, id2, id3) = sorted((id1, id2, id3))
+    return (id1 << 64) | (id2 << 32) | id3
+
+
+class built_on_access(object):
+    """
+        Attribute computed by the decorated method the first time it is
+        read and stored on the instance from then on.
+    """
+    def __init__(self, build):
+        self._build = build
+        self._name = build.__name__
+
+    def __get__(self, world, owner):
+        if world is None:
+            return self
+        value = self._build(world)
+        world.__dict__[self._name] = value
+        return value
+
+
+class StringColumn(object):
+    """
+        Strings packed end to end in a single bytearray.
+
+        Each entry costs its encoded bytes plus a start offset and a
+        length, where a length of -1 stands for None.
+    """
+    def __init__(self):
+        self._data = bytearray()
+        self._start = array('L')
+        self._length = array('i')
+
+    def __len__(self):
+        return len(self._length)
+
+    def _pack(self, value):
+        start = len(self._data)
+        if value is None:
+            return (start, -1)
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        self._data.extend(value)
+        return (start, len(value))
+
+    def append(self, value):
+        (start, length) = self._pack(value)
+        self._start.append(start)
+        self._length.append(length)
+
+    def extend(self, values):
+        packed = [self._pack(value) for value in values]
+        self._start.extend(start for (start, _) in packed)
+        self._length.extend(length for (_, length) in packed)
+
+    def __getitem__(self, ix):
+        length = self._length[ix]
+        if length < 0:
+            return None
+        start = self._start[ix]
+        value = str(self._data[start:start + length])
+        # Strings are stored as UTF-8; any past ASCII come back as unicode.
+        try:
+            value.decode('ascii')
+        except UnicodeDecodeError:
+            return value.decode('utf-8', 'replace')
+        return value
+
+    def __setitem__(self, ix, value):
+        # The previous bytes are left behind; renames are rare.
+        (self._start[ix], self._length[ix]) = self._pack(value)
+
+    def pop(self):
+        start = self._start.pop()
+        if start + self._length.pop() == len(self._data):
+            del self._data[start:]
+
+
+class ViewSequence(object):
+    __slots__ = ('_size', '_view')
+
+    def __init__(self, size, view):
+        self._size = size
+        self._view = view
+
+    def __len__(self):
+        return self._size()
+
+    def __getitem__(self, ix):
+        size = self._size()
+        if ix < 0:
+            ix += size
+        if not 0 <= ix < size:
+            raise IndexError(ix)
+        return self._view(ix)
+
+    def __iter__(self):
+        for ix in xrange(self._size()):
+            yield self._view(ix)
+
+
+class PortalView(object):
+    __slots__ = ('_world', 'id')
+
+    def __init__(self, world, id):
+        self._world = world
+        self.id = id
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, PortalView) and
+            other.id == self.id and
+            other._world is self._world
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.id
+
+    def __repr__(self):
+        return "PortalView(id={})".format(self.id)
+
+    @property
+    def name(self):
+        return self._world._names[self.id]
+
+    @property
+    def guid(self):
+        return self._world._guids[self.id]
+
+    @property
+    def location(self):
+        return self._world._location(self.id)
+
+    @property
+    def version(self):
+        return self._world._versions[self.id]
+
+    @property
+    def e6(self):
+        return self._world._e6(self.id)
+
+    @property
+    def xy(self):
+        x = self._world._x[self.id]
+        if x != x:
+            return None
+        return (x, self._world._y[self.id])
+
+    @name.setter
+    def name(self, val):
+        self._world._names[self.id] = val
+
+    @guid.setter
+    def guid(self, val):
+        self._world._guids[self.id] = val
+
+    @location.setter
+    def location(self, val):
+        self._world.move_portal(self, val)
+
+    @property
+    def outbound_links(self):
+        return self._world._views(self._world._outbound.get(self.id, ()))
+
+    @property
+    def inbound_links(self):
+        return self._world._views(self._world._inbound.get(self.id, ()))
+
+    @property
+    def neighbours(self):
+        return self.outbound_links | self.inbound_links
+
+    def is_linked_to(self, portal):
+        return self._world._is_linked_to(self.id, portal.id)
+
+    def is_linked_from(self, portal):
+        return self._world._is_linked_to(portal.id, self.id)
+
+    def is_linked(self, portal):
+        return pair_key(self.id, portal.id) in self._world._links
+
+    def add_link(self, portal):
+        self._world._add_link(self, portal)
+
+
+class LinkView(object):
+    __slots__ = ('_world', 'index')
+
+    def __init__(self, world, index):
+        self._world = world
+        self.index = index
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, LinkView) and
+            other.index == self.index and
+            other._world is self._world
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.index
+
+    @property
+    def portal_from(self):
+        return PortalView(self._world, self._world._link_from[self.index])
+
+    @property
+    def portal_to(self):
+        return PortalView(self._world, self._world._link_to[self.index])
+
+
+class FieldView(object):
+    __slots__ = ('_world', 'index')
+
+    def __init__(self, world, index):
+        self._world = world
+        self.index = index
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, FieldView) and
+            other.index == self.index and
+            other._world is self._world
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.index
+
+    @property
+    def portals(self):
+        start = 3 * self.index
+        return [
+            PortalView(self._world, id)
+            for id in self._world._field_portals[start:start + 3]
+        ]
+
+
+class CompactWorld(World):
+    """
+        World storing portals, links and fields in typed arrays.
+
+        Portals are integer ids into coordinate and string columns; links
+        and fields are parallel int arrays. `Portal`, `Link` and `Field`
+        objects are replaced by slot-only views created on access, so the
+        rest of the simulator works unchanged. The GUID and name lookups
+        are only built from the string columns when first used.
+    """
+    LOOKUPS = ('_guid_index', '_name_index')
+
+    def __init__(self, **kwargs):
+        super(CompactWorld, self).__init__(**kwargs)
+        for name in self.LOOKUPS:
+            del self.__dict__[name]
+        self._portals = None
+        self._portal_set = None
+        self._fields = None
+        self._lat = array('d')
+        self._lng = array('d')
+        self._x = array('d')
+        self._y = array('d')
+        self._versions = array('L')
+        # Never rewound by a rollback, so a re-added id gets a version of
+        # its own and no cached geometry of the portal undone.
+        self._clock = 0
+        self._e6_points = {}
+        self._names = StringColumn()
+        self._guids = StringColumn()
+        self._link_from = array('i')
+        self._link_to = array('i')
+        self._outbound = {}
+        self._inbound = {}
+        self._field_portals = array('i')
+        self._index = GridIndex(
+            location=self._location,
+            bucket=lambda: array('i')
+        )
+        self._segments = SegmentIndex(
+            endpoints=lambda ix: (
+                self._location(self._link_from[ix]),
+                self._location(self._link_to[ix])
+            )
+        )
+
+    def _location(self, id):
+        lat = self._lat[id]
+        if lat != lat:
+            return None
+        return (lat, self._lng[id])
+
+    @built_on_access
+    def _guid_index(self):
+        index = {}
+        for id in xrange(len(self._guids)):
+            guid = self._guids[id]
+            if guid is not None:
+                index.setdefault(guid, id)
+        return index
+
+    @built_on_access
+    def _name_index(self):
+        index = NameIndex()
+        for id in xrange(len(self._names)):
+            index.add(self._names[id], id)
+        return index
+
+    def _e6(self, id):
+        point = self._e6_points.get(id)
+        if point is None:
+            location = self._location(id)
+            if location is None:
+                return None
+            point = self._e6_points[id] = exact.to_e6(location)
+        return point
+
+    def _move(self, id, location):
+        self._e6_points.pop(id, None)
+        old = self._location(id)
+        if old is not None:
+            self._index.remove(id, old)
+        (self._lat[id], self._lng[id]) = location or (float('nan'),) * 2
+        (self._x[id], self._y[id]) = self._project(location)
+        self._versions[id] = self._tick()
+        if location is not None:
+            self._index.insert(id)
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def _project(self, location):
+        if location is None:
+            return (float('nan'),) * 2
+        if self.projection is None:
+            self.projection = LocalProjection(location)
+        return self.projection.project(location)
+
+    def _views(self, ids):
+        return set(PortalView(self, id) for id in ids)
+
+    def _is_linked_to(self, id_from, id_to):
+        ix = self._links.get(pair_key(id_from, id_to))
+        return ix is not None and self._link_from[ix] == id_from
+
+    @property
+    def portal(self):
+        return ViewSequence(
+            lambda: len(self._lat),
+            lambda id: PortalView(self, id)
+        )
+
+    @property
+    def fields(self):
+        return ViewSequence(
+            lambda: len(self._field_portals) // 3,
+            lambda ix: FieldView(self, ix)
+        )
+
+    @property
+    def links(self):
+        return ViewSequence(
+            lambda: len(self._link_from),
+            lambda ix: LinkView(self, ix)
+        )
+
+    def get_link(self, portal_one, portal_two):
+        ix = self._links.get(pair_key(portal_one.id, portal_two.id))
+        if ix is None:
+            return None
+        return LinkView(self, ix)
+
+    def has_portal(self, portal):
+        return (
+            isinstance(portal, PortalView) and
+            portal._world is self and
+            0 <= portal.id < len(self._lat)
+        )
+
+    def _portal_key(self, portal):
+        return portal.id
+
+    def _portal_of(self, id):
+        return PortalView(self, id)
+
+    def add_portal(self, name=None, guid=None, location=None):
+        id = len(self._lat)
+        (lat, lng) = location or (float('nan'),) * 2
+        self._lat.append(lat)
+        self._lng.append(lng)
+        (x, y) = self._project(location)
+        self._x.append(x)
+        self._y.append(y)
+        self._versions.append(self._tick())
+        self._names.append(name)
+        self._guids.append(guid)
+        portal = PortalView(self, id)
+        self._register(portal)
+        if location is not None:
+            self._index.insert(id)
+        self._record('portal', portal)
+        return portal
+
+    def add_portals(self, records):
+        records = list(records)
+        start = len(self._lat)
+        nan = float('nan')
+        locations = [location for (_, _, location) in records]
+        self._lat.extend(nan if l is None else l[0] for l in locations)
+        self._lng.extend(nan if l is None else l[1] for l in locations)
+        xy = [self._project(location) for location in locations]
+        self._x.extend(x for (x, _) in xy)
+        self._y.extend(y for (_, y) in xy)
+        self._versions.extend(self._tick() for _ in records)
+        self._names.extend(name for (name, _, _) in records)
+        self._guids.extend(guid for (_, guid, _) in records)
+        ids = xrange(start, len(self._lat))
+        self._register_records(ids, records)
+        self._index.extend(
+            id for (id, location) in zip(ids, locations)
+            if location is not None
+        )
+        return [PortalView(self, id) for id in ids]
+
+    def _located_links(self, portal):
+        if portal.location is None:
+            return []
+        return [
+            self._links[pair_key(portal.id, other.id)]
+            for other in portal.neighbours
+            if other.location is not None
+        ]
+
+    def move_portal(self, portal, location):
+        self._record('move', portal, portal.location)
+        links = self._located_links(portal)
+        for ix in links:
+            self._segments.remove(ix)
+        fields = self.fields_on(portal)
+        for field in fields:
+            self._field_tree.remove(field)
+        self._move(portal.id, location)
+        for ix in self._located_links(portal):
+            self._segments.insert(ix)
+        for field in fields:
+            self._field_tree.insert(field)
+
+    def portals_in_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        return [
+            PortalView(self, id)
+            for id in self._index.bbox(min_lat, min_lng, max_lat, max_lng)
+        ]
+
+    def portals_within(self, location, metres):
+        return [
+            PortalView(self, id)
+            for id in self._index.radius(location, metres)
+        ]
+
+    def portals_in_field(self, portal1, portal2, portal3):
+        corners = set((portal1.id, portal2.id, portal3.id))
+        return [
+            PortalView(self, id) for id in self._index.triangle(
+                portal1.location,
+                portal2.location,
+                portal3.location
+            ) if id not in corners
+        ]
+
+    def field_exists(self, portal1, portal2, portal3):
+        return triple_key(
+            portal1.id, portal2.id, portal3.id
+        ) in self._field_index
+
+    def get_field(self, portal1, portal2, portal3):
+        ix = self._field_index.get(
+            triple_key(portal1.id, portal2.id, portal3.id)
+        )
+        if ix is None:
+            return None
+        return FieldView(self, ix)
+
+    def fields_on(self, portal):
+        return [
+            FieldView(self, ix)
+            for ix in self._portal_fields.get(portal.id, ())
+        ]
+
+    def link_exists(self, portal_one, portal_two):
+        assert self.has_portal(portal_one), (
+            "Unknown portal, {}".format(portal_one)
+        )
+        assert self.has_portal(portal_two), (
+            "Unknown portal, {}".format(portal_two)
+        )
+        return pair_key(portal_one.id, portal_two.id) in self._links
+
+    def create_field(self, portal1, portal2, portal3):
+        key = triple_key(portal1.id, portal2.id, portal3.id)
+        ix = self._field_index.get(key)
+        if ix is None:
+            ix = len(self._field_portals) // 3
+            self._field_portals.extend((portal1.id, portal2.id, portal3.id))
+            self._field_index[key] = ix
+            for portal in (portal1, portal2, portal3):
+                self._portal_fields.setdefault(
+                    portal.id, array('i')
+                ).append(ix)
+            self._field_tree.insert(FieldView(self, ix))
+            self._record('field', portal1, portal2, portal3)
+        return FieldView(self, ix)
+
+    def _add_link(self, portal_one, portal_two):
+        (id_one, id_two) = (portal_one.id, portal_two.id)
+        key = pair_key(id_one, id_two)
+        if key in self._links:
+            return False
+        self._links[key] = len(self._link_from)
+        self._link_from.append(id_one)
+        self._link_to.append(id_two)
+        self._outbound.setdefault(id_one, array('i')).append(id_two)
+        self._inbound.setdefault(id_two, array('i')).append(id_one)
+        if None not in (portal_one.location, portal_two.location):
+            self._segments.insert(self._links[key])
+        self._record('link', portal_one, portal_two)
+        return True
+
+    def crossing_link(self, portal_one, portal_two):
+        if portal_one.location is None or portal_two.location is None:
+            return None
+        for ix in self._segments.crossing(
+                portal_one.location, portal_two.location):
+            return LinkView(self, ix)
+        return None
+
+    def _undo_portal(self, portal):
+        id = portal.id
+        if portal.location is not None:
+            self._index.remove(id)
+        self._unregister(portal)
+        self._e6_points.pop(id, None)
+        for column in (self._lat, self._lng, self._x, self._y,
+                       self._versions, self._names, self._guids):
+            column.pop()
+        assert id == len(self._lat)
+
+    def _undo_field(self, portal1, portal2, portal3):
+        ix = self._field_index.pop(
+            triple_key(portal1.id, portal2.id, portal3.id)
+        )
+        self._field_tree.remove(FieldView(self, ix))
+        del self._field_portals[3 * ix:]
+        for portal in (portal1, portal2, portal3):
+            fields = self._portal_fields[portal.id]
+            fields.pop()
+            if not fields:
+                del self._portal_fields[portal.id]
+
+    def _undo_link(self, portal_one, portal_two):
+        ix = self._links.pop(pair_key(portal_one.id, portal_two.id))
+        if None not in (portal_one.location, portal_two.location):
+            self._segments.remove(ix)
+        del self._link_from[ix:]
+        del self._link_to[ix:]
+        for (adjacency, id) in ((self._outbound, portal_one.id),
+                                (self._inbound, portal_two.id)):
+            adjacent = adjacency[id]
+            adjacent.pop()
+            if not adjacent:
+                del adjacency[id]
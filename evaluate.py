@@ -0,0 +1,134 @@
+import multiprocessing
+from collections import namedtuple
+
+from events import LINK_FAILED, MOVE, NullSink
+from mu import MUEstimator
+from spatial import distance
+from worldsim import LinkCommand, MoveCommand, Player, World
+
+
+Metrics = namedtuple(
+    'Metrics', 'fields field_area failed_links walk_distance mu'
+)
+
+
+class MetricsSink(NullSink):
+    def __init__(self):
+        self.failed_links = 0
+        self.walk_distance = 0.0
+        self._locations = {}
+
+    def emit(self, kind, *args):
+        if kind == LINK_FAILED:
+            self.failed_links += 1
+        elif kind == MOVE:
+            (player, location) = args
+            previous = self._locations.get(player)
+            if previous is not None and location != previous:
+                self.walk_distance += distance(previous, location)
+            self._locations[player] = location
+
+
+def portal_records(world):
+    return [(p.name, p.guid, p.location) for p in world.portal]
+
+
+def scenario_from_commands(world, commands):
+    """
+        Convert `MoveCommand`/`LinkCommand` objects into a picklable
+        scenario of `('move', location)` and `('link', ix, ix)` tuples,
+        where `ix` indexes `world.portal`.
+    """
+    index = dict((portal, ix) for (ix, portal) in enumerate(world.portal))
+    scenario = []
+    for command in commands:
+        if isinstance(command, MoveCommand):
+            scenario.append(('move', command.location))
+        elif isinstance(command, LinkCommand):
+            scenario.append((
+                'link',
+                index[command.portal1],
+                index[command.portal2]
+            ))
+    return scenario
+
+
+def evaluate_scenario(records, scenario, raster=None):
+    """
+        `Metrics` of replaying `scenario`. With a density `raster`, links
+        keep the field worth the most MU and `mu` totals the fields;
+        otherwise `mu` is None.
+    """
+    sink = MetricsSink()
+    (estimator, score) = (None, None)
+    if raster is not None:
+        estimator = MUEstimator(raster)
+        score = estimator.mu
+    world = World(events=sink, field_score=score)
+    portals = [
+        world.add_portal(name=name, guid=guid, location=location)
+        for (name, guid, location) in records
+    ]
+    player = Player()
+    world.add_player(player)
+    for step in scenario:
+        if step[0] == 'move':
+            player.add_command(MoveCommand(step[1]))
+        else:
+            player.add_command(LinkCommand(
+                portal1=portals[step[1]],
+                portal2=portals[step[2]]
+            ))
+    for command in player.commands:
+        command()
+    return Metrics(
+        fields=len(world.fields),
+        field_area=sum(
+            world.area_of_field(*field.portals) for field in world.fields
+        ),
+        failed_links=sink.failed_links,
+        walk_distance=sink.walk_distance,
+        mu=None if estimator is None else estimator.total(world.fields)
+    )
+
+
+_records = None
+_raster = None
+
+
+def _init_worker(records, raster=None):
+    global _records, _raster
+    (_records, _raster) = (records, raster)
+
+
+def _evaluate(scenario):
+    return evaluate_scenario(_records, scenario, _raster)
+
+
+class Evaluator(object):
+    """
+        Replays many scenarios of the same world on a process pool.
+
+        The portal set, and any density raster, is sent to each worker
+        once, when the pool starts; afterwards only the scenarios travel
+        between processes.
+    """
+    def __init__(self, world, processes=None, raster=None):
+        self._pool = multiprocessing.Pool(
+            processes,
+            initializer=_init_worker,
+            initargs=(portal_records(world), raster)
+        )
+
+    def evaluate(self, scenarios, chunksize=1):
+        return self._pool.map(_evaluate, scenarios, chunksize)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
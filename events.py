@@ -0,0 +1,112 @@
+import json
+from collections import deque
+
+
+LINK_CREATED = 'link-created'
+FIELD_CREATED = 'field-created'
+LINK_FAILED = 'link-failed'
+LINK_BLOCKED = 'link-blocked'
+MOVE = 'move'
+
+FIELDS = {
+    LINK_CREATED: ('portal_from', 'portal_to'),
+    FIELD_CREATED: ('portals',),
+    LINK_FAILED: ('player', 'portal_from', 'portal_to'),
+    LINK_BLOCKED: ('portal_from', 'portal_to', 'crossing'),
+    MOVE: ('player', 'location'),
+}
+
+
+class NullSink(object):
+    def emit(self, kind, *args):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RingBufferSink(NullSink):
+    """
+        Keeps the last `size` events as `(kind,) + args` tuples.
+    """
+    def __init__(self, size=65536):
+        self.events = deque(maxlen=size)
+
+    def emit(self, kind, *args):
+        self.events.append((kind,) + args)
+
+    def of_kind(self, kind):
+        return [event for event in self.events if event[0] == kind]
+
+
+def to_json(value):
+    if hasattr(value, 'portal_from'):
+        return [value.portal_from.name, value.portal_to.name]
+    if hasattr(value, 'name'):
+        return value.name
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    return value
+
+
+class JsonLinesSink(NullSink):
+    """
+        Writes events as JSON lines to `stream`.
+
+        Events are held as raw tuples and only formatted when `buffer_size`
+        of them have accumulated, or on `flush`. Portals and players are
+        written by name.
+    """
+    def __init__(self, stream, buffer_size=4096):
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._buffer = []
+
+    def emit(self, kind, *args):
+        self._buffer.append((kind,) + args)
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        for event in self._buffer:
+            record = {'event': event[0]}
+            record.update(zip(FIELDS[event[0]], to_json(event[1:])))
+            self._stream.write(json.dumps(record, sort_keys=True) + '\n')
+        self._buffer = []
+        self._stream.flush()
+
+    def close(self):
+        self.flush()
+        self._stream.close()
+
+
+class PrintSink(NullSink):
+    """ Human readable trace on stdout, for interactive runs """
+    def emit(self, kind, *args):
+        if kind == LINK_CREATED:
+            (portal_one, portal_two) = args
+            print "\nLinking {} to {}".format(portal_one.name, portal_two.name)
+            for portal in (portal_one, portal_two):
+                print "outbound_links for {}: {}".format(
+                    portal.name,
+                    ",".join(p.name for p in portal.outbound_links)
+                )
+        elif kind == FIELD_CREATED:
+            print "max size field created to: {}".format(args[0][2].name)
+        elif kind == LINK_BLOCKED:
+            (portal_one, portal_two, link) = args
+            print "Link {} to {} blocked by {} to {}".format(
+                portal_one.name,
+                portal_two.name,
+                link.portal_from.name,
+                link.portal_to.name
+            )
+        elif kind == LINK_FAILED:
+            portal = args[1]
+            print "Link failed - player not within range of {} ({})".format(
+                portal.name,
+                portal.location
+            )
@@ -0,0 +1,127 @@
+"""
+    Exact geometry on integer microdegree (E6) coordinates.
+
+    Locations are `(lat, lng)` pairs; `to_e6` rounds them onto the grid
+    the game stores portals on. The predicates only add, subtract and
+    multiply integers, so they never round, divide or raise, however
+    close to collinear the points are.
+"""
+import math
+
+import numpy as np
+
+
+SCALE = 1000000
+
+
+# Halves round up, here and in `points_in_triangles` alike, so that the
+# scalar and batch predicates see the same grid points.
+def to_e6(location):
+    return (
+        int(math.floor(location[0] * SCALE + 0.5)),
+        int(math.floor(location[1] * SCALE + 0.5))
+    )
+
+
+def array_to_e6(values):
+    """ `to_e6` of every coordinate in `values`, as int64 """
+    return np.floor(
+        np.asarray(values, dtype=float) * SCALE + 0.5
+    ).astype(np.int64)
+
+
+def from_e6(point):
+    return (point[0] / float(SCALE), point[1] / float(SCALE))
+
+
+def orientation(p, q, r):
+    """
+        Twice the signed area of p, q, r with lng as x and lat as y;
+        positive when the turn is counter-clockwise.
+    """
+    return (
+        (q[1] - p[1]) * (r[0] - p[0]) -
+        (q[0] - p[0]) * (r[1] - p[1])
+    )
+
+
+def turn(p, q, r):
+    value = orientation(p, q, r)
+    return (value > 0) - (value < 0)
+
+
+def doubled_area(p1, p2, p3):
+    return abs(orientation(p1, p2, p3))
+
+
+def contains(p1, p2, p3, p):
+    """ True when p is inside or on the edge of a non-degenerate triangle """
+    total = orientation(p1, p2, p3)
+    if total == 0:
+        return False
+    sides = (orientation(p1, p2, p), orientation(p2, p3, p),
+             orientation(p3, p1, p))
+    if total < 0:
+        return sides[0] <= 0 and sides[1] <= 0 and sides[2] <= 0
+    return sides[0] >= 0 and sides[1] >= 0 and sides[2] >= 0
+
+
+def segments_cross(a, b, c, d):
+    """
+        True when segments a-b and c-d cross at a point interior to both.
+        Segments sharing an endpoint never cross.
+    """
+    if a == c or a == d or b == c or b == d:
+        return False
+    return (
+        turn(a, b, c) * turn(a, b, d) < 0 and
+        turn(c, d, a) * turn(c, d, b) < 0
+    )
+
+
+def on_segment(a, b, p):
+    return (
+        orientation(a, b, p) == 0 and
+        min(a[0], b[0]) <= p[0] <= max(a[0], b[0]) and
+        min(a[1], b[1]) <= p[1] <= max(a[1], b[1])
+    )
+
+
+def segments_intersect(a, b, c, d):
+    """ True when segments a-b and c-d have any point in common """
+    (d1, d2) = (turn(c, d, a), turn(c, d, b))
+    (d3, d4) = (turn(a, b, c), turn(a, b, d))
+    if d1 * d2 < 0 and d3 * d4 < 0:
+        return True
+    return (
+        on_segment(c, d, a) or on_segment(c, d, b) or
+        on_segment(a, b, c) or on_segment(a, b, d)
+    )
+
+
+def points_in_triangles(points, triangles):
+    """
+        Exact form of `linkathon.points_in_triangles`.
+
+        Coordinates are rounded to E6 and held as int64; with latitudes
+        and longitudes within +-180 degrees every product stays below
+        2**60, so nothing overflows.
+    """
+    points = array_to_e6(points).reshape(-1, 2)
+    triangles = array_to_e6(triangles).reshape(-1, 3, 2)
+    (lat, lng) = (points[:, 0, None], points[:, 1, None])
+    corners = [(triangles[:, ix, 0], triangles[:, ix, 1]) for ix in range(3)]
+
+    def side(p, q, r_lat, r_lng):
+        return (q[1] - p[1]) * (r_lat - p[0]) - (q[0] - p[0]) * (r_lng - p[1])
+
+    (c1, c2, c3) = corners
+    total = side(c1, c2, c3[0], c3[1])
+    sides = [
+        side(c1, c2, lat, lng),
+        side(c2, c3, lat, lng),
+        side(c3, c1, lat, lng),
+    ]
+    positive = (sides[0] >= 0) & (sides[1] >= 0) & (sides[2] >= 0)
+    negative = (sides[0] <= 0) & (sides[1] <= 0) & (sides[2] <= 0)
+    return np.where(total > 0, positive, negative) & (total != 0)
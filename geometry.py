@@ -0,0 +1,156 @@
+import math
+from collections import OrderedDict
+
+import exact
+
+
+# When set, containment, orientation and crossing predicates here, in
+# `linkathon` and in `spatial` use the integer E6 kernel of `exact`.
+EXACT = False
+
+
+def use_exact(enabled=True):
+    global EXACT
+    EXACT = enabled
+
+
+def coordinates(portal):
+    xy = getattr(portal, 'xy', None)
+    if xy is None:
+        (lat, lng) = portal.location
+        return (lng, lat)
+    return xy
+
+
+def e6(portal):
+    point = getattr(portal, 'e6', None)
+    if point is None:
+        return exact.to_e6(portal.location)
+    return point
+
+
+def measured(portal):
+    return (coordinates(portal), e6(portal))
+
+
+def cross(p, q, r):
+    return (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+
+
+def triangle_area(p1, p2, p3):
+    return abs(cross(p1, p2, p3)) / 2.0
+
+
+def triangle_contains(p1, p2, p3, p):
+    total = cross(p1, p2, p3)
+    if total == 0:
+        return False
+    sides = (cross(p1, p2, p), cross(p2, p3, p), cross(p3, p1, p))
+    if total < 0:
+        return all(side <= 0 for side in sides)
+    return all(side >= 0 for side in sides)
+
+
+def exact_area(point1, point2, point3):
+    """
+        `triangle_area` of `measured` corners, exactly zero when their E6
+        points are collinear.
+    """
+    points = (point1, point2, point3)
+    if exact.doubled_area(*[point for (_, point) in points]) == 0:
+        return 0.0
+    return triangle_area(*[xy for (xy, _) in points])
+
+
+def segment_length(p1, p2):
+    return math.hypot(p2[0] - p1[0], p2[1] - p1[1])
+
+
+def canonical(portals):
+    # Ordering by position, then guid and name, rather than identity,
+    # keeps the arithmetic and so the results identical across processes.
+    return sorted(portals, key=lambda p: (coordinates(p), p.guid, p.name))
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+class GeometryCache(object):
+    """
+        Bounded LRU cache of per-portal geometry.
+
+        Entries are keyed on what was measured of the portals involved, in
+        a canonical order, rather than on the portals themselves. Moving a
+        portal changes its key, so stale entries are never hit again and
+        simply age out; no portal, and so no world, is kept alive; and the
+        same triangle in another world or another run is a hit. Portals
+        are measured in their projected `xy` metres when they have them,
+        otherwise in their raw location. With `EXACT` set, orientation and
+        containment are decided on the portals' E6 locations instead, and
+        areas of triangles collinear on that grid are zero; these are
+        cached apart from the floating point answers.
+    """
+    def __init__(self, size=65536):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _lookup(self, kind, compute, portals, measure=coordinates):
+        points = tuple(measure(p) for p in portals)
+        key = (kind,) + points
+        entries = self._entries
+        try:
+            value = entries.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = compute(*points)
+            self.misses += 1
+            if len(entries) >= self.size:
+                entries.popitem(last=False)
+        entries[key] = value
+        return value
+
+    def area(self, portal1, portal2, portal3):
+        portals = canonical((portal1, portal2, portal3))
+        if EXACT:
+            return self._lookup('area_e6', exact_area, portals, measured)
+        return self._lookup('area', triangle_area, portals)
+
+    def distance(self, portal_one, portal_two):
+        portals = canonical((portal_one, portal_two))
+        return self._lookup('distance', segment_length, portals)
+
+    def orientation(self, portal1, portal2, portal3):
+        """ -1, 0 or 1 for a clockwise, collinear or anticlockwise turn """
+        given = (portal1, portal2, portal3)
+        portals = canonical(given)
+        if EXACT:
+            turn = self._lookup('orientation_e6', exact.turn, portals, e6)
+        else:
+            turn = self._lookup(
+                'orientation', lambda *points: sign(cross(*points)), portals
+            )
+        moved = [portals.index(p) for p in given]
+        if moved in ([1, 0, 2], [0, 2, 1], [2, 1, 0]):
+            return -turn
+        return turn
+
+    def contains(self, portal1, portal2, portal3, portal):
+        corners = canonical((portal1, portal2, portal3))
+        if EXACT:
+            return self._lookup(
+                'contains_e6', exact.contains, corners + [portal], e6
+            )
+        return self._lookup('contains', triangle_contains, corners + [portal])
+
+
+# The cache `World`, `linkathon.Field` and the planners share by default.
+shared = GeometryCache()
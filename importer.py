@@ -0,0 +1,157 @@
+"""
+    Bulk import of portal exports.
+
+    Rows stream from CSV or JSON-lines files and are merged into a world
+    by GUID: new portals are added in batches, known ones are moved or
+    renamed in place, and unchanged or unusable rows are skipped. Only
+    one batch is held in memory besides the world itself.
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+
+from spatial import same_location
+
+
+ImportReport = namedtuple('ImportReport', ['inserted', 'updated', 'skipped'])
+
+NAME_KEYS = ('name', 'title')
+COORDINATE_KEYS = [
+    ('lat', 'lng', 1.0),
+    ('lat', 'lon', 1.0),
+    ('latitude', 'longitude', 1.0),
+    ('late6', 'lnge6', 1e6),
+]
+
+
+def location_of(row):
+    for (lat_key, lng_key, scale) in COORDINATE_KEYS:
+        if row.get(lat_key) not in (None, '') and \
+                row.get(lng_key) not in (None, ''):
+            return (float(row[lat_key]) / scale, float(row[lng_key]) / scale)
+    return None
+
+
+def portal_record(row):
+    """
+        `(name, guid, location)` from one row of an export, or None when
+        the row has no GUID or an unreadable location.
+    """
+    row = dict((key.strip().lower(), value) for (key, value) in row.items())
+    guid = row.get('guid')
+    if not guid:
+        return None
+    try:
+        location = location_of(row)
+    except (TypeError, ValueError):
+        return None
+    name = next((row[key] for key in NAME_KEYS if row.get(key)), None)
+    return (name, guid, location)
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        yield portal_record(row)
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield portal_record(row) if isinstance(row, dict) else None
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_jsonl,
+    '.jsonl': read_jsonl,
+}
+
+
+def read_file(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError("Unknown export format, {}".format(path))
+    with open(path, 'rb') as stream:
+        for record in READERS[extension](stream):
+            yield record
+
+
+class Importer(object):
+    """
+        Merges portal records into `world`, adding new portals
+        `batch_size` at a time.
+
+        A GUID the world already has is updated when its location or name
+        differs and skipped otherwise; a GUID seen again before its batch
+        is flushed is merged into the pending record and counted skipped,
+        the portal being inserted just once.
+    """
+    def __init__(self, world, batch_size=1000):
+        self.world = world
+        self.batch_size = batch_size
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self._batch = []
+        self._pending = {}
+
+    @property
+    def report(self):
+        return ImportReport(self.inserted, self.updated, self.skipped)
+
+    def add(self, record):
+        if record is None:
+            self.skipped += 1
+            return
+        (name, guid, location) = record
+        ix = self._pending.get(guid)
+        if ix is not None:
+            (old_name, _, old_location) = self._batch[ix]
+            self._batch[ix] = (
+                name or old_name, guid, location or old_location
+            )
+            self.skipped += 1
+            return
+        portal = self.world.get_portal(guid)
+        if portal is None:
+            self._pending[guid] = len(self._batch)
+            self._batch.append(record)
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+            return
+        changed = False
+        if location is not None and \
+                not same_location(location, portal.location):
+            self.world.move_portal(portal, location)
+            changed = True
+        if name is not None and name != portal.name:
+            self.world.rename_portal(portal, name)
+            changed = True
+        if changed:
+            self.updated += 1
+        else:
+            self.skipped += 1
+
+    def flush(self):
+        self.world.add_portals(self._batch)
+        self.inserted += len(self._batch)
+        self._batch = []
+        self._pending = {}
+
+    def run(self, records):
+        for record in records:
+            self.add(record)
+        self.flush()
+        return self.report
+
+
+def import_file(world, path, batch_size=1000):
+    """ Import the CSV or JSON-lines export at `path` into `world` """
+    return Importer(world, batch_size).run(read_file(path))
@@ -0,0 +1,193 @@
+"""
+    Opt-in timing of the simulator's hot paths.
+
+    `enable()` swaps each target for a timing wrapper and `disable()` puts
+    the original back, so there is no cost at all while instrumentation
+    is off. A module function is swapped in every module that imported
+    it by name as well as its own.
+"""
+import functools
+import gc
+import inspect
+import json
+import random
+import sys
+import threading
+from timeit import default_timer
+
+import compact
+import geometry
+import linkathon
+import spatial
+import worldsim
+
+
+TARGETS = [
+    (worldsim.Command, '__call__'),
+    (worldsim.LinkCommand, '__call__'),
+    (worldsim.MoveCommand, '__call__'),
+    (worldsim.World, 'create_link'),
+    (worldsim.World, 'create_field'),
+    (worldsim.World, 'field_exists'),
+    (worldsim.World, 'link_exists'),
+    (worldsim.World, 'crossing_link'),
+    (worldsim.World, 'area_of_field'),
+    (compact.CompactWorld, 'create_field'),
+    (compact.CompactWorld, 'field_exists'),
+    (compact.CompactWorld, 'link_exists'),
+    (compact.CompactWorld, 'crossing_link'),
+    (geometry.GeometryCache, 'area'),
+    (geometry.GeometryCache, 'distance'),
+    (geometry.GeometryCache, 'orientation'),
+    (geometry.GeometryCache, 'contains'),
+    (geometry, 'triangle_area'),
+    (geometry, 'triangle_contains'),
+    (linkathon, 'point_in_triangle'),
+    (linkathon, 'points_in_triangles'),
+    (spatial, 'distance'),
+    (spatial, 'segments_cross'),
+]
+
+
+class Stat(object):
+    """
+        Call count, cumulative time, a bounded uniform sample of call
+        times for percentiles, and net allocations of GC-tracked objects.
+    """
+    def __init__(self, samples=1024):
+        self._size = samples
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.total = 0.0
+        self.allocations = 0
+        self._samples = []
+        self._random = random.Random(0)
+
+    def record(self, elapsed, allocations):
+        self.calls += 1
+        self.total += elapsed
+        if allocations > 0:
+            self.allocations += allocations
+        if len(self._samples) < self._size:
+            self._samples.append(elapsed)
+        else:
+            ix = self._random.randrange(self.calls)
+            if ix < self._size:
+                self._samples[ix] = elapsed
+
+    def percentile(self, fraction):
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'total': self.total,
+            'mean': self.total / self.calls if self.calls else 0.0,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'allocations': self.allocations,
+        }
+
+
+def target_name(owner, attribute):
+    return "{}.{}".format(owner.__name__, attribute)
+
+
+def timed(function, stat):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        allocated = gc.get_count()[0]
+        start = default_timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stat.record(
+                default_timer() - start,
+                gc.get_count()[0] - allocated
+            )
+    return wrapper
+
+
+_originals = {}
+_stats = {}
+
+
+def bindings(function):
+    """ Every `(module, name)` global bound to `function` """
+    for module in sys.modules.values():
+        if module is None:
+            continue
+        for (name, value) in vars(module).items():
+            if value is function:
+                yield (module, name)
+
+
+def enable(targets=TARGETS):
+    for (owner, attribute) in targets:
+        key = (owner, attribute)
+        if key in _originals:
+            continue
+        original = owner.__dict__[attribute]
+        stat = _stats.setdefault(target_name(owner, attribute), Stat())
+        if inspect.ismodule(owner):
+            places = list(bindings(original))
+        else:
+            places = [key]
+        _originals[key] = (original, places)
+        wrapper = timed(original, stat)
+        for (place, name) in places:
+            setattr(place, name, wrapper)
+
+
+def disable():
+    for (original, places) in _originals.values():
+        for (place, name) in places:
+            setattr(place, name, original)
+    _originals.clear()
+
+
+def enabled():
+    return bool(_originals)
+
+
+def reset():
+    # In place: the wrappers of enabled targets hold their `Stat`.
+    for stat in _stats.itervalues():
+        stat.clear()
+
+
+def snapshot():
+    return dict(
+        (name, stat.snapshot())
+        for (name, stat) in _stats.iteritems()
+        if stat.calls
+    )
+
+
+class Dumper(threading.Thread):
+    """ Writes a JSON line snapshot to `stream` every `interval` seconds """
+    def __init__(self, stream, interval=10.0):
+        super(Dumper, self).__init__()
+        self.daemon = True
+        self._stream = stream
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def dump(self):
+        self._stream.write(json.dumps(snapshot(), sort_keys=True) + '\n')
+        self._stream.flush()
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self.dump()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.dump()
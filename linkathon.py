@@ -1,34 +1,86 @@
-def bary(p1, p2, p3, p):
-    (x1, y1) = p1
-    (x2, y2) = p2
-    (x3, y3) = p3
-    (x, y) = p
-    try:
-        a = (
-                (y2 - y3) * (x - x3) + (x3 - x2) * (y - y3)
-            ) / (
-                (y2 - y3) * (x1 - x3) + (x3 - x2) * (y1 - y3)
-            )
-        b = (
-                (y3 - y1) * (x - x3) + (x1 - x3) * (y - y3)
-            ) / (
-                (y2 - y3) * (x1 - x3) + (x3 - x2) * (y1 - y3)
-            )
-    except BaseException as err:
-        raise ValueError(err)
+import numpy as np
+
+import exact
+import geometry
+
+
+def point_in_triangle(p, p1, p2, p3):
+    """ Inclusive containment; degenerate triangles contain nothing """
+    if geometry.EXACT:
+        return exact.contains(*[exact.to_e6(l) for l in (p1, p2, p3, p)])
+    return geometry.triangle_contains(p1, p2, p3, p)
+
+
+def bary_batch(points, triangles):
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    triangles = np.asarray(triangles, dtype=float).reshape(-1, 3, 2)
+    x = points[:, 0, None]
+    y = points[:, 1, None]
+    (x1, y1) = (triangles[:, 0, 0], triangles[:, 0, 1])
+    (x2, y2) = (triangles[:, 1, 0], triangles[:, 1, 1])
+    (x3, y3) = (triangles[:, 2, 0], triangles[:, 2, 1])
+    denom = (y2 - y3) * (x1 - x3) + (x3 - x2) * (y1 - y3)
+    degenerate = denom == 0
+    # Degenerate triangles get a NaN denominator so every comparison on
+    # their coordinates is False, instead of raising per element.
+    denom = np.where(degenerate, np.nan, denom)
+    with np.errstate(invalid='ignore'):
+        a = ((y2 - y3) * (x - x3) + (x3 - x2) * (y - y3)) / denom
+        b = ((y3 - y1) * (x - x3) + (x1 - x3) * (y - y3)) / denom
     c = 1 - a - b
     return (a, b, c)
 
 
-def point_in_triangle(p, p1, p2, p3):
-    try:
-        (a, b, c) = bary(p1, p2, p3, p)
-    except:
-        print "Exception {} {} {} {}".format(p1, p2, p3, p)
-        return False
-    return (0 <= a <= 1 and
-            0 <= b <= 1 and
-            0 <= c <= 1)
+def bary(p1, p2, p3, p):
+    """ Barycentric coordinates of `p`; ValueError if degenerate """
+    (a, b, c) = bary_batch([p], [(p1, p2, p3)])
+    if np.isnan(a[0, 0]):
+        raise ValueError('degenerate triangle')
+    return (float(a[0, 0]), float(b[0, 0]), float(c[0, 0]))
+
+
+def points_in_triangles(points, triangles):
+    """
+        Containment matrix for many points against many triangles.
+
+        `points` is an (N, 2) array of locations and `triangles` an
+        (M, 3, 2) array of corner locations. Returns an (N, M) boolean
+        array; degenerate triangles contain nothing.
+    """
+    if geometry.EXACT:
+        return exact.points_in_triangles(points, triangles)
+    (a, b, c) = bary_batch(points, triangles)
+    with np.errstate(invalid='ignore'):
+        return (
+            (0 <= a) & (a <= 1) &
+            (0 <= b) & (b <= 1) &
+            (0 <= c) & (c <= 1)
+        )
+
+
+def triangle_hits(points, triangles, chunk_size=4096):
+    """
+        Sparse form of `points_in_triangles`.
+
+        Returns two index arrays `(point_ix, triangle_ix)` of every hit.
+        Points are processed `chunk_size` at a time so the dense matrix is
+        never built for the whole set.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    triangles = np.asarray(triangles, dtype=float).reshape(-1, 3, 2)
+    point_hits = []
+    triangle_ixs = []
+    for start in xrange(0, len(points), chunk_size):
+        inside = points_in_triangles(
+            points[start:start + chunk_size],
+            triangles
+        )
+        (p, t) = np.nonzero(inside)
+        point_hits.append(p + start)
+        triangle_ixs.append(t)
+    if not point_hits:
+        return (np.empty(0, dtype=int), np.empty(0, dtype=int))
+    return (np.concatenate(point_hits), np.concatenate(triangle_ixs))
 
 
 class Portal(object):
@@ -36,6 +88,8 @@ class Portal(object):
         self._name = None
         self._location = (None, None)
         self._id = None
+        self._guid = None
+        self._version = 0
 
     @property
     def id(self):
@@ -49,6 +103,14 @@ class Portal(object):
     def location(self):
         return self._location
 
+    @property
+    def guid(self):
+        return self._guid
+
+    @property
+    def version(self):
+        return self._version
+
     @id.setter
     def id(self, val):
         self._id = val
@@ -60,6 +122,11 @@ class Portal(object):
     @location.setter
     def location(self, val):
         self._location = val
+        self._version += 1
+
+    @guid.setter
+    def guid(self, val):
+        self._guid = val
 
 
 class Field(object):
@@ -71,9 +138,31 @@ class Field(object):
         return self._portals
 
     def portal_inside_field(self, portal):
-        (p1, p2, p3) = [p.location for p in self.portals]
-        p = portal.location
-        return point_in_triangle(p, p1, p2, p3)
+        (p1, p2, p3) = self.portals
+        return geometry.shared.contains(p1, p2, p3, portal)
+
+    def portals_inside_field(self, portals):
+        inside = points_in_triangles(
+            [portal.location for portal in portals],
+            [[p.location for p in self.portals]]
+        )
+        return inside[:, 0].tolist()
+
+
+def portals_inside_fields(portals, fields):
+    return points_in_triangles(
+        [portal.location for portal in portals],
+        [[p.location for p in field.portals] for field in fields]
+    )
+
+
+class Link(object):
+    def __init__(self, *portals):
+        self._portals = portals
+
+    @property
+    def portals(self):
+        return self._portals
 
 
 class Linkathon(object):
@@ -82,6 +171,8 @@ class Linkathon(object):
         self.portals = {}
         self.links = {}
         self.ids = {}
+        self.prerequisites = {}
+        self.sequences = []
         self._field_id = 0
         self._portal_id = 0
         self._link_id = 0
@@ -0,0 +1,117 @@
+"""
+    MU estimates for fields from a raster of population density.
+
+    A raster is a grid of MU per cell over a lat/lng box, row 0 at the
+    north edge as in a GeoTIFF. A field collects every cell whose centre
+    it covers: each row of cells under the field is one scanline, summed
+    with a lookup in that row's prefix sums.
+"""
+import math
+
+import numpy as np
+
+from geometry import GeometryCache, canonical
+
+
+class DensityRaster(object):
+    def __init__(self, density, south, west, north, east):
+        density = np.asarray(density, dtype=float)
+        if density.ndim != 2:
+            raise ValueError("Density raster must be two dimensional")
+        if not (south < north and west < east):
+            raise ValueError("Empty raster bounds {}".format(
+                (south, west, north, east)
+            ))
+        self.density = density
+        self.bounds = (south, west, north, east)
+        (self.rows, self.cols) = density.shape
+        self.cell_lat = (north - south) / float(self.rows)
+        self.cell_lng = (east - west) / float(self.cols)
+        self.prefix = np.zeros((self.rows, self.cols + 1))
+        np.cumsum(density, axis=1, out=self.prefix[:, 1:])
+
+    def triangle_sum(self, p1, p2, p3):
+        """ MU of the cells with their centre in the triangle p1 p2 p3 """
+        (south, west, north, east) = self.bounds
+        if (p2[1] - p1[1]) * (p3[0] - p1[0]) == \
+                (p2[0] - p1[0]) * (p3[1] - p1[1]):
+            return 0.0
+        lats = (p1[0], p2[0], p3[0])
+        top = int(math.ceil((north - max(lats)) / self.cell_lat - 0.5))
+        bottom = int(math.floor((north - min(lats)) / self.cell_lat - 0.5))
+        rows = np.arange(max(top, 0), min(bottom + 1, self.rows))
+        if not len(rows):
+            return 0.0
+        lat = north - (rows + 0.5) * self.cell_lat
+        lo = np.full(len(rows), np.inf)
+        hi = np.full(len(rows), -np.inf)
+        for (p, q) in ((p1, p2), (p2, p3), (p3, p1)):
+            if p[0] == q[0]:
+                # Level edges end on the other two, which cover them.
+                continue
+            t = (lat - p[0]) / (q[0] - p[0])
+            lng = p[1] + t * (q[1] - p[1])
+            on = (t >= 0) & (t <= 1)
+            lo = np.where(on, np.minimum(lo, lng), lo)
+            hi = np.where(on, np.maximum(hi, lng), hi)
+        first = np.ceil((lo - west) / self.cell_lng - 0.5)
+        last = np.floor((hi - west) / self.cell_lng - 0.5) + 1
+        first = first.clip(0, self.cols).astype(int)
+        last = last.clip(0, self.cols).astype(int)
+        last = np.maximum(first, last)
+        prefix = self.prefix
+        return float((prefix[rows, last] - prefix[rows, first]).sum())
+
+    def triangle_sums(self, triangles):
+        """ `triangle_sum` of each `(p1, p2, p3)` in `triangles` """
+        return np.array([self.triangle_sum(*t) for t in triangles])
+
+
+def load(path, bounds=None):
+    """
+        A `DensityRaster` from a `.npz` saved by `save`, or from a `.npy`
+        grid, which is mapped rather than read, with `bounds` given as
+        `(south, west, north, east)`.
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            density = data['density']
+            if bounds is None:
+                bounds = tuple(data['bounds'])
+    elif path.endswith('.npy'):
+        density = np.load(path, mmap_mode='r')
+    else:
+        raise ValueError("Unknown raster format {}".format(path))
+    if bounds is None:
+        raise ValueError("No bounds for raster {}".format(path))
+    return DensityRaster(density, *bounds)
+
+
+def save(raster, path):
+    np.savez(path, density=raster.density, bounds=np.array(raster.bounds))
+
+
+def location(portal):
+    return portal.location
+
+
+class MUEstimator(GeometryCache):
+    """
+        MU of fields on a `DensityRaster`, cached per field the way the
+        geometry is: keyed on the canonical corners' locations.
+
+        `mu` fits `World(field_score=...)`, so that a link closing two
+        fields at once keeps the one worth more MU.
+    """
+    def __init__(self, raster, size=65536):
+        super(MUEstimator, self).__init__(size)
+        self.raster = raster
+
+    def mu(self, portal1, portal2, portal3):
+        portals = canonical((portal1, portal2, portal3))
+        if any(p.location is None for p in portals):
+            return 0.0
+        return self._lookup('mu', self.raster.triangle_sum, portals, location)
+
+    def total(self, fields):
+        return sum(self.mu(*field.portals) for field in fields)
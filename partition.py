@@ -0,0 +1,288 @@
+"""
+    Splitting a plan's links between several players.
+
+    The links of a plan's sequence form a dependency graph: a link that
+    closes a field follows the two links it closes it with, a link from
+    inside a field is thrown before that field exists, and kicker links
+    follow the entries their comment names. The links are then list
+    scheduled: each ready link in turn goes to whichever player could
+    finish it soonest, walking included, and the best of a few orders
+    of taking ready links is kept.
+"""
+import heapq
+from collections import namedtuple
+
+import numpy
+
+from plan import sequence_links, world_portals
+from scheduler import LINK_TIME, WALKING_SPEED
+from spatial import FieldTree, LocalProjection, same_location
+from validate import topological_order
+from worldsim import LinkCommand, MoveCommand
+
+
+Partition = namedtuple('Partition', 'players syncs makespan')
+Sync = namedtuple('Sync', 'player command waits_for')
+
+
+def link_tasks(plan, sequence=None):
+    """
+        Each link of `sequence` once, as `(portal_from, portal_to)` plan
+        portals in throw order, and a map of each id in the sequence to
+        the indexes of its links.
+    """
+    if sequence is None:
+        sequence = [id for ids in plan.sequences for id in ids]
+    (links, index, owners) = ([], {}, {})
+    for id in sequence:
+        for pair in sequence_links(plan, [id]):
+            key = frozenset(pair)
+            if key not in index:
+                index[key] = len(links)
+                links.append(pair)
+            owners.setdefault(id, []).append(index[key])
+    return (links, owners)
+
+
+def link_graph(links):
+    """
+        Map of each index of `links`, `(portal_from, portal_to)` pairs in
+        throw order, to the set of indexes it must follow: a link closing
+        a field follows the two links it closes it with, and a link from
+        inside a field is thrown before that field exists.
+    """
+    def corners(field):
+        (ix, third) = field
+        return [p.location for p in links[ix] + (third,)]
+
+    graph = dict((ix, set()) for ix in xrange(len(links)))
+    thrown = {}
+    neighbours = {}
+    # Every field a link closes, keyed `(link index, third portal)`.
+    fields = FieldTree(corners=corners)
+    for (ix, (one, two)) in enumerate(links):
+        common = neighbours.get(one, set()) & neighbours.get(two, set())
+        for third in common:
+            graph[ix].add(thrown[frozenset((one, third))])
+            graph[ix].add(thrown[frozenset((two, third))])
+            fields.insert((ix, third))
+        thrown[frozenset((one, two))] = ix
+        neighbours.setdefault(one, set()).add(two)
+        neighbours.setdefault(two, set()).add(one)
+    for (ix, (origin, _)) in enumerate(links):
+        for (closing, third) in fields.covering(origin.location):
+            if closing > ix and origin not in links[closing] + (third,):
+                graph[closing].add(ix)
+    return graph
+
+
+def task_graph(plan, links, owners):
+    """
+        `link_graph` of `links`, with kicker links following the entries
+        their comment names.
+    """
+    graph = link_graph(links)
+    for (id, required) in plan.prerequisites.iteritems():
+        for ix in owners.get(id, ()):
+            for prerequisite in required:
+                graph[ix].update(owners.get(prerequisite, ()))
+            graph[ix].discard(ix)
+    return graph
+
+
+class Agent(object):
+    __slots__ = ('player', 'xy', 'free', 'tasks')
+
+    def __init__(self, player, xy):
+        self.player = player
+        self.xy = xy
+        self.free = 0.0
+        self.tasks = []
+
+
+class ListScheduler(object):
+    """
+        List scheduling of link tasks onto agents.
+
+        `graph` maps each task to those it must follow and `origins` holds
+        the projected place each is thrown from, None when unknown. Each
+        task takes `link_time` seconds, after walking there at `speed`.
+    """
+    def __init__(self, graph, origins, speed, link_time):
+        self.graph = graph
+        self.speed = speed
+        self.link_time = link_time
+        self.origins = origins
+        self.xy = numpy.array(
+            [o if o is not None else (numpy.nan, numpy.nan) for o in origins],
+            dtype=float
+        ).reshape(-1, 2)
+        self.dependents = dict((ix, []) for ix in graph)
+        for (ix, required) in graph.iteritems():
+            for prerequisite in required:
+                self.dependents[prerequisite].append(ix)
+        # Links on the longest chain still to come go first.
+        self.rank = numpy.zeros(len(origins))
+        for ix in reversed(topological_order(graph)):
+            self.rank[ix] = link_time + max(
+                [self.rank[j] for j in self.dependents[ix]] or [0.0]
+            )
+
+    def walks(self, agent, tasks):
+        if agent.xy is None:
+            return numpy.zeros(len(tasks))
+        walk = numpy.hypot(
+            self.xy[tasks, 0] - agent.xy[0], self.xy[tasks, 1] - agent.xy[1]
+        ) / self.speed
+        walk[numpy.isnan(walk)] = 0.0
+        return walk
+
+    def _assign(self, agent, ix, start, finish):
+        finish[ix] = agent.free = start + self.link_time
+        if self.origins[ix] is not None:
+            agent.xy = self.origins[ix]
+        agent.tasks.append(ix)
+
+    def by_priority(self, agents, priority):
+        """
+            The ready task of highest `priority`, to the agent that can
+            start it first; the finish time of every task.
+        """
+        graph = self.graph
+        finish = {}
+        waiting = dict((ix, len(required)) for (ix, required) in graph.items())
+        ready = [(-priority[ix], ix) for (ix, n) in waiting.items() if not n]
+        heapq.heapify(ready)
+        free = numpy.array([agent.free for agent in agents])
+        at = numpy.array(
+            [a.xy if a.xy is not None else (numpy.nan, numpy.nan)
+             for a in agents],
+            dtype=float
+        ).reshape(-1, 2)
+        while ready:
+            (_, ix) = heapq.heappop(ready)
+            release = max([finish[j] for j in graph[ix]] or [0.0])
+            walk = numpy.hypot(
+                at[:, 0] - self.xy[ix, 0], at[:, 1] - self.xy[ix, 1]
+            ) / self.speed
+            walk[numpy.isnan(walk)] = 0.0
+            start = numpy.maximum(free + walk, release)
+            tied = numpy.flatnonzero(start <= start.min())
+            n = int(tied[walk[tied].argmin()])
+            agent = agents[n]
+            self._assign(agent, ix, float(start[n]), finish)
+            free[n] = agent.free
+            if agent.xy is not None:
+                at[n] = agent.xy
+            for j in self.dependents[ix]:
+                waiting[j] -= 1
+                if not waiting[j]:
+                    heapq.heappush(ready, (-priority[j], j))
+        return finish
+
+    def by_rank(self, agents):
+        return self.by_priority(agents, self.rank)
+
+    def in_order(self, agents):
+        """ Tasks as early in the plan's own order as they can go """
+        return self.by_priority(agents, -numpy.arange(len(self.origins)))
+
+    def by_agent(self, agents):
+        """
+            The agent free first takes the ready task it can start soonest,
+            of highest rank among ties; the finish time of every task.
+        """
+        graph = self.graph
+        finish = {}
+        waiting = dict((ix, len(required)) for (ix, required) in graph.items())
+        release = numpy.full(len(self.origins), numpy.inf)
+        for (ix, count) in waiting.iteritems():
+            if not count:
+                release[ix] = 0.0
+        free = [(agent.free, n) for (n, agent) in enumerate(agents)]
+        heapq.heapify(free)
+        while len(finish) < len(release):
+            (_, n) = heapq.heappop(free)
+            agent = agents[n]
+            ready = numpy.flatnonzero(release < numpy.inf)
+            start = numpy.maximum(
+                agent.free + self.walks(agent, ready), release[ready]
+            )
+            tied = numpy.flatnonzero(start <= start.min() + 1e-9)
+            pick = tied[self.rank[ready[tied]].argmax()]
+            ix = int(ready[pick])
+            release[ix] = numpy.inf
+            self._assign(agent, ix, float(start[pick]), finish)
+            heapq.heappush(free, (agent.free, n))
+            for j in self.dependents[ix]:
+                waiting[j] -= 1
+                if not waiting[j]:
+                    release[j] = max(finish[k] for k in graph[j])
+        return finish
+
+
+def partition(plan, world, players, sequence=None, speed=WALKING_SPEED,
+              link_time=LINK_TIME):
+    """
+        Split the links of `sequence` between `players`, adding to each
+        the `MoveCommand`s and `LinkCommand`s it runs, and return the
+        `Partition`: the players, a `Sync` for every command that waits
+        on other players' commands and the estimated makespan, timed as
+        `scheduler.Simulation` would.
+
+        Links are handed out by rank, which favours the critical path when
+        many players share the work; nearest first, which keeps a player
+        from criss-crossing the area; and in the plan's own order. The
+        shortest of the three schedules is kept.
+    """
+    if not players:
+        raise ValueError("No players to partition the plan between")
+    (links, owners) = link_tasks(plan, sequence)
+    graph = task_graph(plan, links, owners)
+    portals = world_portals(plan, world)
+    located = [p.location for p in world.portal if p.location is not None]
+    projection = LocalProjection(located[0] if located else (0.0, 0.0))
+
+    def project(location):
+        return None if location is None else projection.project(location)
+
+    scheduler = ListScheduler(
+        graph, [project(portals[one].location) for (one, _) in links],
+        speed, link_time
+    )
+    best = None
+    for schedule in (scheduler.by_rank, scheduler.by_agent,
+                     scheduler.in_order):
+        agents = [Agent(p, project(p.location)) for p in players]
+        finish = schedule(agents)
+        makespan = max(finish.values()) if finish else 0.0
+        if best is None or makespan < best[0]:
+            best = (makespan, agents, finish)
+    (makespan, agents, finish) = best
+    agent_of = dict((ix, agent) for agent in agents for ix in agent.tasks)
+    commands = {}
+    for agent in agents:
+        location = agent.player.location
+        for ix in agent.tasks:
+            (one, two) = (portals[links[ix][0]], portals[links[ix][1]])
+            if one.location is not None and \
+                    not same_location(location, one.location):
+                location = one.location
+                agent.player.add_command(MoveCommand(location))
+            command = commands[ix] = LinkCommand(portal1=one, portal2=two)
+            agent.player.add_command(command)
+    syncs = []
+    for ix in sorted(commands, key=finish.get):
+        waits_for = [
+            commands[j] for j in sorted(graph[ix])
+            if agent_of[j] is not agent_of[ix]
+        ]
+        if waits_for:
+            syncs.append(Sync(agent_of[ix].player, commands[ix], waits_for))
+    return Partition(list(players), syncs, makespan)
+
+
+def synchronise(simulation, partition):
+    """ Hold each command of `partition` back until those it waits for """
+    for sync in partition.syncs:
+        simulation.require(sync.command, *sync.waits_for)
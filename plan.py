@@ -0,0 +1,352 @@
+import re
+from collections import namedtuple
+
+import linkathon
+from resolver import parse_coordinate
+from spatial import same_location
+from worldsim import LinkCommand, MoveCommand
+
+
+Title = namedtuple('Title', 'line text')
+IdEntry = namedtuple('IdEntry', 'line name id')
+FieldRequest = namedtuple('FieldRequest', 'line portals id comment')
+LinkRequest = namedtuple(
+    'LinkRequest', 'line portal_from portal_to id comment'
+)
+CaptureRequest = namedtuple('CaptureRequest', 'line portal id')
+DestroyRequest = namedtuple('DestroyRequest', 'line target id')
+DeployRequest = namedtuple('DeployRequest', 'line portal resonators id')
+Sequence = namedtuple('Sequence', 'line ids')
+Locate = namedtuple('Locate', 'line portal location')
+GuidEntry = namedtuple('GuidEntry', 'line portal guid')
+ParseError = namedtuple('ParseError', 'line message text')
+
+TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[^\s,"]+')
+# Inside quotes a backslash escapes the next character, as in `\"`.
+ESCAPE = re.compile(r'\\(.)')
+QUOTE_OR_ESCAPE = re.compile(r'\\.|"')
+KICKER = re.compile(r'kicker\s+for\s+(\d+)\s*-\s*(\d+)', re.IGNORECASE)
+
+
+def split_comment(text):
+    quoted = False
+    escaped = False
+    for (ix, char) in enumerate(text):
+        if escaped:
+            escaped = False
+        elif char == '\\' and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == '#' and not quoted:
+            return (text[:ix], text[ix + 1:].strip() or None)
+    return (text, None)
+
+
+def tokenize(text):
+    quotes = [m for m in QUOTE_OR_ESCAPE.findall(text) if m == '"']
+    if len(quotes) % 2:
+        raise ValueError("Unterminated quote")
+    return TOKEN.findall(text)
+
+
+def unquote(token):
+    if token.startswith('"'):
+        return ESCAPE.sub(r'\1', token[1:-1])
+    return token
+
+
+def parse_number(token):
+    if not token.isdigit():
+        raise ValueError("Expected a number, got {}".format(token))
+    return int(token)
+
+
+def pop_alias(tokens):
+    if len(tokens) >= 2 and tokens[-2].upper() == 'AS':
+        alias = parse_number(tokens[-1])
+        del tokens[-2:]
+        return alias
+    return None
+
+
+def parse_entry(number, keyword, tokens, comment):
+    alias = pop_alias(tokens)
+    if keyword == 'ID':
+        if len(tokens) != 1 or alias is None:
+            raise ValueError("ID needs a portal name and AS <id>")
+        return IdEntry(number, unquote(tokens[0]), alias)
+    if keyword == 'FIELD':
+        if len(tokens) != 3:
+            raise ValueError("FIELD needs three portals")
+        return FieldRequest(
+            number, tuple(unquote(t) for t in tokens), alias, comment
+        )
+    if keyword == 'LINK':
+        if len(tokens) == 3 and tokens[1].upper() == 'TO':
+            del tokens[1]
+        if len(tokens) != 2:
+            raise ValueError("LINK needs two portals")
+        return LinkRequest(
+            number, unquote(tokens[0]), unquote(tokens[1]), alias, comment
+        )
+    if keyword == 'CAPTURE':
+        if len(tokens) != 1:
+            raise ValueError("CAPTURE needs one portal")
+        return CaptureRequest(number, unquote(tokens[0]), alias)
+    if keyword == 'DESTROY':
+        if len(tokens) != 1:
+            raise ValueError("DESTROY needs a link id or portal")
+        return DestroyRequest(number, unquote(tokens[0]), alias)
+    if keyword == 'DEPLOY':
+        if not tokens:
+            raise ValueError("DEPLOY needs a portal")
+        return DeployRequest(
+            number, unquote(tokens[0]), tuple(tokens[1:]), alias
+        )
+    if alias is not None:
+        raise ValueError("{} does not take AS".format(keyword))
+    if keyword == 'SEQ':
+        return Sequence(number, tuple(parse_number(t) for t in tokens))
+    if keyword == 'LOCATE':
+        if len(tokens) != 4 or tokens[1].upper() != 'AT':
+            raise ValueError("LOCATE needs <portal> AT <lat> <lng>")
+        return Locate(
+            number,
+            unquote(tokens[0]),
+            (parse_coordinate(tokens[2]), parse_coordinate(tokens[3]))
+        )
+    if keyword == 'GUID':
+        if len(tokens) != 2:
+            raise ValueError("GUID needs a portal and a guid")
+        return GuidEntry(number, unquote(tokens[0]), tokens[1])
+    raise ValueError("Unknown command {}".format(keyword))
+
+
+KEYWORDS = frozenset([
+    'ID', 'FIELD', 'LINK', 'CAPTURE', 'DESTROY', 'DEPLOY',
+    'SEQ', 'LOCATE', 'GUID',
+])
+
+
+def parse(lines):
+    """
+        Parse a command file one line at a time.
+
+        Yields one typed entry per command line, in file order. Lines that
+        cannot be parsed are yielded as `ParseError` entries and parsing
+        carries on with the next line.
+    """
+    seen_command = False
+    for (number, text) in enumerate(lines, 1):
+        (body, comment) = split_comment(text)
+        body = body.strip()
+        if not body:
+            continue
+        keyword = body.split(None, 1)[0].upper()
+        if keyword not in KEYWORDS and not seen_command:
+            seen_command = True
+            yield Title(number, body)
+            continue
+        seen_command = True
+        try:
+            tokens = tokenize(body)
+            yield parse_entry(number, keyword, tokens[1:], comment)
+        except ValueError as err:
+            yield ParseError(number, str(err), text.rstrip('\n'))
+
+
+def escape(text):
+    return '"{}"'.format(text.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def quote(ref):
+    ref = str(ref)
+    if ref.isdigit():
+        return ref
+    return escape(ref)
+
+
+def format_entry(entry):
+    if isinstance(entry, Title):
+        return entry.text
+    if isinstance(entry, IdEntry):
+        return 'ID {} AS {}'.format(escape(entry.name), entry.id)
+    if isinstance(entry, Sequence):
+        return 'SEQ {}'.format(', '.join(str(id) for id in entry.ids))
+    if isinstance(entry, Locate):
+        # Always with a decimal point; bare integers read back as E6.
+        return 'LOCATE {} AT {:.6f}, {:.6f}'.format(
+            quote(entry.portal), entry.location[0], entry.location[1]
+        )
+    if isinstance(entry, GuidEntry):
+        return 'GUID {} {}'.format(quote(entry.portal), entry.guid)
+    if isinstance(entry, FieldRequest):
+        text = 'FIELD {}'.format(' '.join(quote(p) for p in entry.portals))
+    elif isinstance(entry, LinkRequest):
+        text = 'LINK {} {}'.format(
+            quote(entry.portal_from), quote(entry.portal_to)
+        )
+    else:
+        raise ValueError("Cannot format {}".format(entry))
+    if entry.id is not None:
+        text += ' AS {}'.format(entry.id)
+    if entry.comment:
+        text += ' # {}'.format(entry.comment)
+    return text
+
+
+def write(entries, stream):
+    for entry in entries:
+        stream.write(format_entry(entry) + '\n')
+
+
+def parse_file(path):
+    with open(path) as lines:
+        for entry in parse(lines):
+            yield entry
+
+
+def resolve_portal(plan, ref):
+    if ref.isdigit():
+        target = plan.ids.get(int(ref))
+        if isinstance(target, linkathon.Portal):
+            return target
+    elif ref in plan.portals:
+        return plan.portals[ref]
+    raise ValueError("Unknown portal {}".format(ref))
+
+
+def load(entries, plan=None):
+    """
+        Resolve parsed entries into `Linkathon` registries.
+
+        `entries` may be any iterable of entries, such as `parse_file`.
+        Returns the registries and a list of `ParseError`s for entries
+        that could not be parsed or resolved.
+    """
+    plan = plan or linkathon.Linkathon()
+    errors = []
+    for entry in entries:
+        if isinstance(entry, ParseError):
+            errors.append(entry)
+            continue
+        try:
+            load_entry(plan, entry)
+        except ValueError as err:
+            errors.append(ParseError(entry.line, str(err), None))
+    return (plan, errors)
+
+
+def load_entry(plan, entry):
+    if isinstance(entry, IdEntry):
+        portal = plan.portals.get(entry.name)
+        if portal is None:
+            portal = linkathon.Portal()
+            portal.name = entry.name
+            plan.portals[entry.name] = portal
+        portal.id = entry.id
+        plan.ids[entry.id] = portal
+    elif isinstance(entry, FieldRequest):
+        field = linkathon.Field(
+            *[resolve_portal(plan, ref) for ref in entry.portals]
+        )
+        register(plan, 'field', entry, field)
+    elif isinstance(entry, LinkRequest):
+        link = linkathon.Link(
+            resolve_portal(plan, entry.portal_from),
+            resolve_portal(plan, entry.portal_to)
+        )
+        register(plan, 'link', entry, link)
+    elif isinstance(entry, Sequence):
+        plan.sequences.append(entry.ids)
+    elif isinstance(entry, Locate):
+        resolve_portal(plan, entry.portal).location = entry.location
+    elif isinstance(entry, GuidEntry):
+        resolve_portal(plan, entry.portal).guid = entry.guid
+
+
+def prerequisites(comment):
+    """ Ids named by a `Kicker for A-B` comment, which must come first """
+    match = KICKER.search(comment or '')
+    if match is None:
+        return ()
+    return tuple(int(id) for id in match.groups())
+
+
+def register(plan, kind, entry, value):
+    registry = getattr(plan, kind + 's')
+    if entry.id is None:
+        registry["{}_line_{}".format(kind, entry.line)] = value
+    else:
+        registry["{}_{}".format(kind, entry.id)] = value
+        plan.ids[entry.id] = value
+        required = prerequisites(entry.comment)
+        if required:
+            plan.prerequisites[entry.id] = required
+
+
+def sequence_links(plan, sequence):
+    for id in sequence:
+        target = plan.ids.get(id)
+        if isinstance(target, linkathon.Field):
+            (p1, p2, p3) = target.portals
+            for pair in ((p1, p2), (p2, p3), (p1, p3)):
+                yield pair
+        elif isinstance(target, linkathon.Link):
+            yield target.portals
+        else:
+            raise ValueError("SEQ refers to unknown id {}".format(id))
+
+
+def world_portals(plan, world):
+    """
+        Map of plan portals to world portals, matched by GUID, then by
+        location, and added to `world` when it has neither.
+    """
+    portals = {}
+    for portal in plan.portals.itervalues():
+        match = None
+        if portal.guid is not None:
+            match = world.get_portal(portal.guid)
+        if match is None and portal.location is not None:
+            match = world.portal_at(portal.location)
+        if match is None:
+            match = world.add_portal(
+                name=portal.name,
+                guid=portal.guid,
+                location=portal.location
+            )
+        portals[portal] = match
+    return portals
+
+
+def compile_plan(plan, world, player, sequence=None):
+    """
+        Turn a sequence of field and link ids into `Player` commands.
+
+        Plan portals are matched to world portals by GUID, then by
+        location, and added to `world` when it has neither. Each link
+        becomes a `MoveCommand` to its origin, when the player is
+        elsewhere, and a `LinkCommand`. Links already thrown earlier in
+        the sequence are skipped. Returns the map of plan portals to
+        world portals.
+    """
+    if sequence is None:
+        sequence = [id for ids in plan.sequences for id in ids]
+    portals = world_portals(plan, world)
+    thrown = set()
+    location = player.location
+    for (portal_from, portal_to) in sequence_links(plan, sequence):
+        key = frozenset((portal_from, portal_to))
+        if key in thrown:
+            continue
+        thrown.add(key)
+        if not same_location(location, portal_from.location):
+            location = portal_from.location
+            player.add_command(MoveCommand(location))
+        player.add_command(LinkCommand(
+            portal1=portals[portal_from],
+            portal2=portals[portal_to]
+        ))
+    return portals
@@ -0,0 +1,186 @@
+import math
+
+import geometry
+import plan
+from spatial import orientation
+
+
+def convex_hull(portals):
+    points = sorted(portals, key=lambda p: (p.location[1], p.location[0]))
+    if len(points) < 3:
+        return points
+
+    def chain(points):
+        hull = []
+        for p in points:
+            while (len(hull) >= 2 and orientation(
+                    hull[-2].location, hull[-1].location, p.location) <= 0):
+                hull.pop()
+            hull.append(p)
+        return hull[:-1]
+
+    return chain(points) + chain(reversed(points))
+
+
+def sweep_order(anchor, portals):
+    """
+        Portals other than `anchor` ordered counter-clockwise around it.
+
+        `anchor` must be a hull vertex, so every other portal lies within
+        a half-plane; the ordering starts after the widest angular gap.
+        Ties are ordered by distance from the anchor.
+    """
+    (lat, lng) = anchor.location
+
+    def polar(portal):
+        (p_lat, p_lng) = portal.location
+        return (
+            math.atan2(p_lat - lat, p_lng - lng),
+            (p_lat - lat) ** 2 + (p_lng - lng) ** 2
+        )
+
+    keyed = sorted((polar(p), p) for p in portals if p is not anchor)
+    if len(keyed) < 2:
+        return [p for (_, p) in keyed]
+    angles = [angle for ((angle, _), _) in keyed]
+    gaps = [
+        (angles[(ix + 1) % len(angles)] - angles[ix]) % (2 * math.pi)
+        for ix in xrange(len(angles))
+    ]
+    start = (gaps.index(max(gaps)) + 1) % len(keyed)
+    return [p for (_, p) in keyed[start:] + keyed[:start]]
+
+
+class FanPlan(object):
+    """
+        Links of a sweep triangulation around one anchor portal.
+
+        Portals are visited in angular order around the anchor. Each new
+        portal links back to the previous one and to the anchor, then to
+        every chain vertex it can see, as in a Graham scan. All links
+        start at the portal being visited, which always lies outside the
+        fields made so far, and the result triangulates the convex hull.
+    """
+    def __init__(self, anchor, portals):
+        self.anchor = anchor
+        self.links = []
+        self._neighbours = dict((p, set()) for p in portals)
+        self._build(sweep_order(anchor, portals))
+
+    @property
+    def fields(self):
+        return [field for (_, _, field) in self.links if field]
+
+    @property
+    def field_area(self):
+        return sum(geometry.shared.area(*field) for field in self.fields)
+
+    def _link(self, portal_from, portal_to):
+        common = (
+            self._neighbours[portal_from] & self._neighbours[portal_to]
+        )
+        self._neighbours[portal_from].add(portal_to)
+        self._neighbours[portal_to].add(portal_from)
+        field = None
+        if common:
+            third = max(common, key=lambda p: geometry.shared.area(
+                portal_from, portal_to, p
+            ))
+            field = (portal_from, portal_to, third)
+        self.links.append((portal_from, portal_to, field))
+
+    def _build(self, ordered):
+        anchor = self.anchor.location
+        if not ordered:
+            return
+        self._link(ordered[0], self.anchor)
+        chain = [ordered[0]]
+        for portal in ordered[1:]:
+            location = portal.location
+            self._link(portal, chain[-1])
+            if orientation(anchor, chain[-1].location, location) != 0:
+                self._link(portal, self.anchor)
+            while len(chain) >= 2 and orientation(
+                    chain[-2].location, chain[-1].location, location) < 0:
+                self._link(portal, chain[-2])
+                chain.pop()
+            chain.append(portal)
+
+
+def fan_plan(portals, objective='fields'):
+    """
+        Best `FanPlan` for `portals`.
+
+        With `objective='fields'` the lowest portal anchors the fan; every
+        anchor yields a full triangulation, hence the same field count.
+        With `objective='area'` each hull vertex is tried as the anchor and
+        the plan with the largest total layered field area wins.
+    """
+    seen = set()
+    unique = []
+    for portal in portals:
+        if portal.location not in seen:
+            seen.add(portal.location)
+            unique.append(portal)
+    if objective == 'fields':
+        anchors = [min(unique, key=lambda p: p.location)]
+    elif objective == 'area':
+        anchors = convex_hull(unique)
+    else:
+        raise ValueError("Unknown objective {}".format(objective))
+    plans = [FanPlan(anchor, unique) for anchor in anchors]
+    return max(plans, key=lambda p: (len(p.fields), p.field_area))
+
+
+def plan_entries(fan, title=None):
+    """
+        `plan` entries for a `FanPlan`: ID, LOCATE and GUID lines for each
+        portal, a FIELD for every field formed, a LINK per throw and a SEQ
+        of the link ids in throw order.
+    """
+    entries = []
+    ids = {}
+    names = set()
+    if title:
+        entries.append(plan.Title(len(entries) + 1, title))
+    portals = [fan.anchor] + [p for (p, _, _) in fan.links]
+    for portal in portals:
+        if portal in ids:
+            continue
+        id = ids[portal] = len(ids) + 1
+        name = portal.name or "Portal {}".format(id)
+        if name in names:
+            name = "{} #{}".format(name, id)
+        names.add(name)
+        entries.append(plan.IdEntry(len(entries) + 1, name, id))
+        entries.append(
+            plan.Locate(len(entries) + 1, str(id), portal.location)
+        )
+        if portal.guid:
+            entries.append(
+                plan.GuidEntry(len(entries) + 1, str(id), portal.guid)
+            )
+    next_id = len(ids) + 1
+    sequence = []
+    for (portal_from, portal_to, field) in fan.links:
+        comment = None
+        if field:
+            entries.append(plan.FieldRequest(
+                len(entries) + 1,
+                tuple(str(ids[p]) for p in field),
+                next_id,
+                None
+            ))
+            comment = "Forms field {}".format(next_id)
+            next_id += 1
+        entries.append(plan.LinkRequest(
+            len(entries) + 1,
+            str(ids[portal_from]),
+            str(ids[portal_to]),
+            next_id,
+            comment
+        ))
+        sequence.append(next_id)
+        next_id += 1
+    entries.append(plan.Sequence(len(entries) + 1, tuple(sequence)))
+    return entries
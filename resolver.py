@@ -0,0 +1,163 @@
+"""
+    Lookup of portals by the references a plan may use for them: a name,
+    a GUID or a `lat,lng` pair.
+"""
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+
+WORD = re.compile(r'\w+', re.UNICODE)
+SEPARATOR = re.compile(r'[\s,]+')
+# Fewer new suffixes than the index holds over this are inserted one by
+# one; more are sorted in with the rest.
+INSERT_LIMIT = 256
+# Marks between a name's words and its item, below every character a
+# normalised name holds.
+WHOLE = '\x01'
+SUFFIX = '\x00'
+
+
+def normalise(name):
+    """ Lower case words of `name` without accents or punctuation """
+    if isinstance(name, str):
+        name = name.decode('utf-8', 'replace')
+    name = unicodedata.normalize('NFKD', name)
+    name = u''.join(c for c in name if not unicodedata.combining(c))
+    return u' '.join(WORD.findall(name.lower()))
+
+
+def parse_coordinate(token):
+    # Coordinates without a decimal point are E6 microdegrees.
+    if '.' not in token and abs(int(token)) > 180:
+        return int(token) / 1e6
+    return float(token)
+
+
+def parse_location(text):
+    """ `(lat, lng)` from a `lat,lng` reference, or None """
+    parts = SEPARATOR.split(text.strip())
+    if len(parts) != 2:
+        return None
+    try:
+        return tuple(parse_coordinate(part) for part in parts)
+    except ValueError:
+        return None
+
+
+class NameIndex(object):
+    """
+        Items by normalised name.
+
+        Every word suffix of every name is kept, UTF-8 encoded, in a
+        sorted list with the items alongside, so a prefix of any run of
+        words is a binary search. Each entry ends with a mark, one kind
+        for whole names, which are looked up the same way, and the item's
+        hash, which keeps the entries of different items apart so that
+        each is removed by bisection too. Names added are only indexed at
+        the next query: a bulk load is sorted in at once, a few names are
+        inserted one by one.
+    """
+    def __init__(self):
+        self._suffixes = []
+        self._items = []
+        self._pending = []
+        self._count = 0
+
+    def __len__(self):
+        self._update()
+        return self._count
+
+    def _entries(self, name, item, tail=None):
+        words = normalise(name).encode('utf-8').split()
+        if tail is None:
+            tail = '{:x}'.format(hash(item))
+        yield ' '.join(words) + WHOLE + tail
+        for ix in xrange(1, len(words)):
+            yield ' '.join(words[ix:]) + SUFFIX + tail
+
+    def _update(self):
+        if not self._pending:
+            return
+        (pending, self._pending) = (self._pending, [])
+        self._count += len(pending)
+        (suffixes, items) = (self._suffixes, self._items)
+        if len(pending) * INSERT_LIMIT < len(suffixes):
+            for (name, item) in pending:
+                for entry in self._entries(name, item):
+                    ix = bisect_right(suffixes, entry)
+                    suffixes.insert(ix, entry)
+                    items.insert(ix, item)
+            return
+        # Sorting the entries alone and finding their items again by the
+        # hash they end with spares a tuple per entry on a bulk load.
+        owners = {}
+        for (name, item) in pending:
+            tail = '{:x}'.format(hash(item))
+            if owners.setdefault(tail, item) != item:
+                owners = None
+                break
+        if owners is None or suffixes:
+            entries = [
+                (entry, item)
+                for (name, item) in pending
+                for entry in self._entries(name, item)
+            ]
+            entries.extend(zip(suffixes, items))
+            entries.sort(key=itemgetter(0))
+            self._suffixes = [entry for (entry, _) in entries]
+            self._items = [item for (_, item) in entries]
+            return
+        suffixes.extend(
+            entry
+            for (name, item) in pending
+            for entry in self._entries(name, item)
+        )
+        del pending
+        suffixes.sort()
+        self._items = [
+            owners[entry[max(entry.rfind(WHOLE), entry.rfind(SUFFIX)) + 1:]]
+            for entry in suffixes
+        ]
+
+    def add(self, name, item):
+        if name is not None:
+            self._pending.append((name, item))
+
+    def remove(self, name, item):
+        if name is None:
+            return
+        self._update()
+        (suffixes, items) = (self._suffixes, self._items)
+        for entry in self._entries(name, item):
+            ix = bisect_left(suffixes, entry)
+            while ix < len(suffixes) and suffixes[ix] == entry:
+                if items[ix] == item:
+                    del suffixes[ix]
+                    del items[ix]
+                    if WHOLE in entry:
+                        self._count -= 1
+                    break
+                ix += 1
+
+    def _starting(self, prefix):
+        self._update()
+        suffixes = self._suffixes
+        found = []
+        seen = set()
+        for ix in xrange(bisect_left(suffixes, prefix), len(suffixes)):
+            if not suffixes[ix].startswith(prefix):
+                break
+            item = self._items[ix]
+            if item not in seen:
+                seen.add(item)
+                found.append(item)
+        return found
+
+    def exact(self, name):
+        return self._starting(normalise(name).encode('utf-8') + WHOLE)
+
+    def prefixed(self, text):
+        """ Items with a run of words in their name starting with `text` """
+        return self._starting(normalise(text).encode('utf-8'))
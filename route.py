@@ -0,0 +1,269 @@
+"""
+    Reordering of a player's visits to shorten the walk between them.
+
+    A visit is one `MoveCommand` and the commands run where it arrives.
+    Visits are seeded nearest-first and then improved with 2-opt and
+    Or-opt moves, trying only each visit's nearest neighbours, and never
+    breaking an ordering constraint.
+"""
+from collections import deque, namedtuple
+
+import numpy
+
+from partition import link_graph
+from spatial import LocalProjection
+from worldsim import LinkCommand, MoveCommand
+
+
+Route = namedtuple('Route', 'order distance original saved')
+Visit = namedtuple('Visit', 'location commands')
+
+
+def distance_matrix(locations):
+    """
+        Metres between every pair of `(lat, lng)` locations, in single
+        precision; millimetres across a city, at half the memory.
+    """
+    projection = LocalProjection(locations[0])
+    (x, y) = numpy.array(
+        [projection.project(l) for l in locations], dtype=numpy.float32
+    ).T
+    return numpy.hypot(numpy.subtract.outer(x, x), numpy.subtract.outer(y, y))
+
+
+def path_length(matrix, order):
+    if len(order) < 2:
+        return 0.0
+    return float(matrix[order[:-1], order[1:]].sum())
+
+
+class Constraints(object):
+    """ `(i, j)` pairs of visits, where `i` must come before `j` """
+    def __init__(self, size, pairs):
+        self.after = [[] for _ in xrange(size)]
+        self.before = [[] for _ in xrange(size)]
+        for (i, j) in pairs:
+            self.after[i].append(j)
+            self.before[j].append(i)
+
+    def met(self, order):
+        position = dict((node, ix) for (ix, node) in enumerate(order))
+        return all(
+            position[i] < position[j]
+            for (i, later) in enumerate(self.after)
+            for j in later
+        )
+
+    def reversible(self, order, position, lo, hi):
+        for ix in xrange(lo, hi + 1):
+            for j in self.after[order[ix]]:
+                if lo <= position[j] <= hi:
+                    return False
+        return True
+
+    def movable(self, order, position, lo, hi, to):
+        # Moving order[lo:hi + 1] back to just after position `to`.
+        for ix in xrange(lo, hi + 1):
+            for i in self.before[order[ix]]:
+                if to < position[i] < lo:
+                    return False
+        return True
+
+
+def nearest_neighbour(matrix, constraints, first=0):
+    """ A path from `first`, always to the nearest visit that is free """
+    size = len(matrix)
+    waiting = numpy.array([len(b) for b in constraints.before])
+    free = numpy.zeros(size, dtype=bool)
+    free[waiting == 0] = True
+    free[first] = False
+    order = [first]
+    for j in constraints.after[first]:
+        waiting[j] -= 1
+        if not waiting[j]:
+            free[j] = True
+    while len(order) < size:
+        candidates = numpy.flatnonzero(free)
+        if not len(candidates):
+            raise ValueError("Ordering constraints form a cycle")
+        node = int(candidates[matrix[order[-1], candidates].argmin()])
+        order.append(node)
+        free[node] = False
+        for j in constraints.after[node]:
+            waiting[j] -= 1
+            if not waiting[j]:
+                free[j] = True
+    return order
+
+
+def improve(matrix, order, constraints, neighbours=8):
+    """
+        2-opt and Or-opt moves on the open path `order`, whose first
+        visit stays in place, until none shortens it. Only moves joining
+        a visit to one of its nearest neighbours are tried, and a visit is
+        only tried again once a move has touched it.
+    """
+    size = len(order)
+    if size < 4:
+        return order
+    k = min(neighbours, size - 1)
+    nearest = numpy.argpartition(matrix, k, axis=1)[:, :k + 1].tolist()
+    d = matrix.item
+    order = list(order)
+    position = [0] * size
+    for (ix, node) in enumerate(order):
+        position[node] = ix
+
+    def renumber(lo, hi):
+        for ix in xrange(lo, hi + 1):
+            position[order[ix]] = ix
+
+    def two_opt(a, b, i, j):
+        # Reverse order[i + 1:j + 1] so that a is followed by b.
+        if j == i + 1:
+            return None
+        (nxt, after) = (order[i + 1], order[j + 1] if j + 1 < size else None)
+        gain = d(a, nxt) - d(a, b)
+        if after is not None:
+            gain += d(b, after) - d(nxt, after)
+        if gain <= 1e-6 or not constraints.reversible(
+                order, position, i + 1, j):
+            return None
+        order[i + 1:j + 1] = order[j:i:-1]
+        renumber(i + 1, j)
+        return (a, b, nxt, after)
+
+    def or_opt(a, i, j):
+        # Move a run of up to three visits starting at j to after a.
+        if j == i + 1:
+            return None
+        nxt = order[i + 1]
+        for hi in xrange(j, min(j + 3, size)):
+            (before, first, last) = (order[j - 1], order[j], order[hi])
+            after = order[hi + 1] if hi + 1 < size else None
+            gain = d(before, first) + d(a, nxt) - d(a, first) - d(last, nxt)
+            if after is not None:
+                gain += d(last, after) - d(before, after)
+            if gain <= 1e-6 or not constraints.movable(
+                    order, position, j, hi, i):
+                continue
+            run = order[j:hi + 1]
+            del order[j:hi + 1]
+            order[i + 1:i + 1] = run
+            renumber(i + 1, hi)
+            return (a, nxt, before, after, first, last)
+        return None
+
+    queue = deque(xrange(size))
+    queued = [True] * size
+    while queue:
+        node = queue.popleft()
+        queued[node] = False
+        for other in nearest[node]:
+            (a, b) = (node, other)
+            (i, j) = (position[a], position[b])
+            if i == j:
+                continue
+            if i > j:
+                (a, b, i, j) = (b, a, j, i)
+            touched = two_opt(a, b, i, j) or or_opt(a, i, j)
+            if touched:
+                for visit in touched:
+                    if visit is not None and not queued[visit]:
+                        queued[visit] = True
+                        queue.append(visit)
+                break
+    return order
+
+
+def optimise(locations, before=(), start=None, neighbours=8):
+    """
+        Order for visiting `locations` that shortens the walk from
+        `start`, or from the first location when `start` is None, while
+        keeping each `(i, j)` of `before` with `i` ahead of `j`.
+    """
+    offset = 0 if start is None else 1
+    points = list(locations) if start is None else [start] + list(locations)
+    pairs = [(i + offset, j + offset) for (i, j) in before]
+    if start is None:
+        pairs += [(0, j) for j in xrange(1, len(points))]
+    constraints = Constraints(len(points), pairs)
+    matrix = distance_matrix(points)
+    original = range(len(points))
+    order = nearest_neighbour(matrix, constraints)
+    order = improve(matrix, order, constraints, neighbours)
+    (distance, was) = (
+        path_length(matrix, order),
+        path_length(matrix, original)
+    )
+    if distance > was:
+        (order, distance) = (original, was)
+    order = [node - offset for node in order[offset:]]
+    return Route(order, distance, was, was - distance)
+
+
+def split_visits(commands):
+    """ Commands as visits, one per `MoveCommand`, after any leading ones """
+    (leading, visits) = ([], [])
+    for command in commands:
+        if isinstance(command, MoveCommand):
+            visits.append(Visit(command.location, [command]))
+        elif visits:
+            visits[-1].commands.append(command)
+        else:
+            leading.append(command)
+    return (leading, visits)
+
+
+def field_constraints(commands):
+    """
+        `(a, b)` pairs of link commands that keep every link closing a
+        field after the two links it closes the field with, and every
+        link from inside a field before the link closing that field, as
+        `partition.link_graph` has them.
+    """
+    (links, seen) = ([], set())
+    for command in commands:
+        if not isinstance(command, LinkCommand):
+            continue
+        key = frozenset((command.portal1, command.portal2))
+        if key not in seen:
+            seen.add(key)
+            links.append(command)
+    graph = link_graph([(c.portal1, c.portal2) for c in links])
+    return [
+        (links[j], links[ix])
+        for (ix, required) in sorted(graph.items())
+        for j in sorted(required)
+    ]
+
+
+def reorder(commands, start=None, before=None, **kwargs):
+    """
+        `commands` with their visits reordered to shorten the walk from
+        `start`, and the `Route` taken. `before` holds `(a, b)` pairs of
+        commands where `a` must still run before `b`; by default those of
+        `field_constraints`, so every field is still made and no link
+        starts under a field.
+    """
+    if before is None:
+        before = field_constraints(commands)
+    (leading, visits) = split_visits(commands)
+    if not visits:
+        return (list(commands), Route([], 0.0, 0.0, 0.0))
+    visit_of = dict(
+        (command, ix)
+        for (ix, visit) in enumerate(visits)
+        for command in visit.commands
+    )
+    pairs = set(
+        (visit_of[a], visit_of[b]) for (a, b) in before
+        if a in visit_of and b in visit_of and visit_of[a] != visit_of[b]
+    )
+    route = optimise(
+        [visit.location for visit in visits], sorted(pairs), start, **kwargs
+    )
+    return (
+        leading + [c for ix in route.order for c in visits[ix].commands],
+        route
+    )
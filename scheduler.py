@@ -0,0 +1,107 @@
+import heapq
+import itertools
+
+from spatial import distance
+from worldsim import MoveCommand
+
+
+WALKING_SPEED = 1.4
+LINK_TIME = 10.0
+
+
+class Simulation(object):
+    """
+        Discrete-event run of every player's commands on a shared clock.
+
+        Each player works through its own command list. A `MoveCommand`
+        takes the walking time from the player's location, any other
+        command takes `link_time` seconds, and each command takes effect
+        in the world when it completes. `require` holds a command back
+        until commands of other players have completed.
+    """
+    def __init__(self, world, speed=WALKING_SPEED, link_time=LINK_TIME):
+        self.world = world
+        self.speed = speed
+        self.link_time = link_time
+        self.now = 0.0
+        self.finished = {}
+        self.log = []
+        self._speeds = {}
+        self._queue = []
+        self._order = itertools.count()
+        self._next = {}
+        self._pending = {}
+        self._dependents = {}
+        self._blocked = {}
+        self._done = set()
+
+    def set_speed(self, player, speed):
+        self._speeds[player] = speed
+
+    def require(self, command, *prerequisites):
+        for prerequisite in prerequisites:
+            if prerequisite in self._done:
+                continue
+            self._pending[command] = self._pending.get(command, 0) + 1
+            self._dependents.setdefault(prerequisite, []).append(command)
+
+    def duration(self, player, command):
+        if isinstance(command, MoveCommand):
+            if player.location is None or command.location is None:
+                return 0.0
+            return (
+                distance(player.location, command.location) /
+                self._speeds.get(player, self.speed)
+            )
+        return self.link_time
+
+    def _advance(self, player):
+        commands = player.commands
+        ix = self._next[player]
+        if ix >= len(commands):
+            self.finished[player] = self.now
+            return
+        command = commands[ix]
+        if self._pending.get(command):
+            self._blocked[command] = player
+            return
+        self._next[player] = ix + 1
+        end = self.now + self.duration(player, command)
+        heapq.heappush(
+            self._queue,
+            (end, next(self._order), self.now, player, command)
+        )
+
+    def _complete(self, command):
+        self._done.add(command)
+        for dependent in self._dependents.pop(command, ()):
+            self._pending[dependent] -= 1
+            if not self._pending[dependent]:
+                del self._pending[dependent]
+                player = self._blocked.pop(dependent, None)
+                if player is not None:
+                    self._advance(player)
+
+    def run(self, players=None):
+        """
+            Run until every player has finished; returns the time at which
+            the last one did.
+        """
+        players = players or self.world.players
+        for player in players:
+            self._next.setdefault(player, 0)
+            self._advance(player)
+        while self._queue:
+            (end, _, start, player, command) = heapq.heappop(self._queue)
+            self.now = end
+            command()
+            self.log.append((start, end, player, command))
+            self._complete(command)
+            self._advance(player)
+        if self._blocked:
+            raise ValueError(
+                "{} players are waiting on commands that never run".format(
+                    len(self._blocked)
+                )
+            )
+        return max(self.finished.itervalues()) if self.finished else 0.0
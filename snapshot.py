@@ -0,0 +1,278 @@
+"""
+    Binary snapshots of a world, loaded through a memory map.
+
+    A snapshot is a fixed header followed by fixed-width portal, link and
+    field records and a string table of names and GUIDs. `load` maps the
+    file read-only and reads the records in place, so it starts in
+    milliseconds, pages are only read from disk when touched and worker
+    processes loading the same file share the same pages.
+"""
+import mmap
+import struct
+from array import array
+
+import numpy
+
+from compact import (
+    CompactWorld, StringColumn, built_on_access, pair_key, triple_key
+)
+from spatial import FieldTree, GridIndex, LocalProjection, SegmentIndex
+
+
+MAGIC = 'LINKSNAP'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIIIdd')
+PORTAL = numpy.dtype([
+    ('lat', '<f8'),
+    ('lng', '<f8'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('name_start', '<u4'),
+    ('name_length', '<i4'),
+    ('guid_start', '<u4'),
+    ('guid_length', '<i4'),
+])
+LINK = numpy.dtype([('portal_from', '<i4'), ('portal_to', '<i4')])
+FIELD = numpy.dtype('<i4')
+
+
+def padding(size):
+    return -size % 8
+
+
+class StringTable(object):
+    def __init__(self):
+        self.data = bytearray()
+
+    def add(self, value):
+        start = len(self.data)
+        if value is None:
+            return (start, -1)
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        self.data.extend(value)
+        return (start, len(value))
+
+
+def save(world, path):
+    """ Write `world`'s portals, links and fields to a snapshot at `path` """
+    portals = list(world.portal)
+    ids = dict((portal, ix) for (ix, portal) in enumerate(portals))
+    strings = StringTable()
+    records = numpy.zeros(len(portals), dtype=PORTAL)
+    nan = float('nan')
+    for (ix, portal) in enumerate(portals):
+        record = records[ix]
+        (record['lat'], record['lng']) = portal.location or (nan, nan)
+        (record['x'], record['y']) = portal.xy or (nan, nan)
+        (record['name_start'], record['name_length']) = strings.add(
+            portal.name
+        )
+        (record['guid_start'], record['guid_length']) = strings.add(
+            portal.guid
+        )
+    links = numpy.array(
+        [(ids[l.portal_from], ids[l.portal_to]) for l in world.links],
+        dtype=LINK
+    )
+    fields = numpy.array(
+        [ids[p] for field in world.fields for p in field.portals],
+        dtype=FIELD
+    )
+    origin = (nan, nan)
+    if world.projection is not None:
+        origin = world.projection.origin
+    with open(path, 'wb') as stream:
+        header = HEADER.pack(
+            MAGIC, VERSION, len(records), len(links), len(fields) // 3,
+            len(strings.data), origin[0], origin[1]
+        )
+        for data in [header] + [s.tobytes() for s in (records, links, fields)]:
+            stream.write(data + '\0' * padding(len(data)))
+        stream.write(strings.data)
+
+
+def load(path, **kwargs):
+    """ Map the snapshot at `path` as a `MappedWorld` """
+    with open(path, 'rb') as stream:
+        mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    return MappedWorld(mapped, **kwargs)
+
+
+class MappedStrings(StringColumn):
+    """ A `StringColumn` reading a mapped table, copied out on first write """
+    def __init__(self, data, start, length):
+        self._data = data
+        self._start = start
+        self._length = length
+
+    def _pack(self, value):
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray(self._data)
+            self._start = array('L', self._start.tolist())
+            self._length = array('i', self._length.tolist())
+        return super(MappedStrings, self)._pack(value)
+
+
+class MappedWorld(CompactWorld):
+    """
+        `CompactWorld` whose columns are views onto a mapped snapshot.
+
+        The lookup tables and spatial indexes are only built when first
+        used. The columns are read-only; the first change to the world
+        copies them out of the map into ordinary arrays.
+    """
+    LAZY = (
+        '_versions', '_links', '_outbound', '_inbound', '_field_index',
+        '_portal_fields', '_index', '_segments', '_field_tree',
+    )
+
+    def __init__(self, mapped, **kwargs):
+        (magic, version, portals, links, fields, size,
+         lat, lng) = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a version {} snapshot".format(VERSION))
+        super(MappedWorld, self).__init__(**kwargs)
+        for name in self.LAZY:
+            del self.__dict__[name]
+        if self.projection is None and lat == lat:
+            self.projection = LocalProjection((lat, lng))
+        self._map = mapped
+        offset = HEADER.size + padding(HEADER.size)
+        records = numpy.frombuffer(
+            mapped, dtype=PORTAL, count=portals, offset=offset
+        )
+        offset += records.nbytes + padding(records.nbytes)
+        link_records = numpy.frombuffer(
+            mapped, dtype=LINK, count=links, offset=offset
+        )
+        offset += link_records.nbytes + padding(link_records.nbytes)
+        self._field_portals = numpy.frombuffer(
+            mapped, dtype=FIELD, count=3 * fields, offset=offset
+        )
+        offset += (
+            self._field_portals.nbytes + padding(self._field_portals.nbytes)
+        )
+        self._lat = records['lat']
+        self._lng = records['lng']
+        self._x = records['x']
+        self._y = records['y']
+        self._names = MappedStrings(
+            buffer(mapped, offset, size),
+            records['name_start'],
+            records['name_length']
+        )
+        self._guids = MappedStrings(
+            buffer(mapped, offset, size),
+            records['guid_start'],
+            records['guid_length']
+        )
+        self._link_from = link_records['portal_from']
+        self._link_to = link_records['portal_to']
+        self._thawed = False
+
+    @built_on_access
+    def _versions(self):
+        return array('L', [0]) * len(self._lat)
+
+    @built_on_access
+    def _links(self):
+        return dict(
+            (pair_key(id_from, id_to), ix)
+            for (ix, (id_from, id_to)) in enumerate(
+                zip(self._link_from.tolist(), self._link_to.tolist())
+            )
+        )
+
+    def _adjacency(self, keys, values):
+        adjacency = {}
+        for (key, value) in zip(keys.tolist(), values.tolist()):
+            adjacency.setdefault(key, array('i')).append(value)
+        return adjacency
+
+    @built_on_access
+    def _outbound(self):
+        return self._adjacency(self._link_from, self._link_to)
+
+    @built_on_access
+    def _inbound(self):
+        return self._adjacency(self._link_to, self._link_from)
+
+    @built_on_access
+    def _field_index(self):
+        ids = self._field_portals.tolist()
+        return dict(
+            (triple_key(*ids[start:start + 3]), start // 3)
+            for start in xrange(0, len(ids), 3)
+        )
+
+    @built_on_access
+    def _portal_fields(self):
+        return self._adjacency(
+            self._field_portals,
+            numpy.arange(len(self._field_portals)) // 3
+        )
+
+    @built_on_access
+    def _index(self):
+        index = GridIndex(location=self._location, bucket=lambda: array('i'))
+        for id in numpy.flatnonzero(self._lat == self._lat).tolist():
+            index.insert(id)
+        return index
+
+    @built_on_access
+    def _segments(self):
+        def endpoints(ix):
+            return (
+                self._location(self._link_from[ix]),
+                self._location(self._link_to[ix])
+            )
+
+        segments = SegmentIndex(endpoints=endpoints)
+        for ix in xrange(len(self._link_from)):
+            if None not in endpoints(ix):
+                segments.insert(ix)
+        return segments
+
+    @built_on_access
+    def _field_tree(self):
+        tree = FieldTree(
+            corners=lambda field: [p.location for p in field.portals]
+        )
+        for field in self.fields:
+            tree.insert(field)
+        return tree
+
+    def _thaw(self):
+        if self._thawed:
+            return
+        for name in self.LAZY:
+            getattr(self, name)
+        for (name, typecode) in [('_lat', 'd'), ('_lng', 'd'), ('_x', 'd'),
+                                 ('_y', 'd'), ('_link_from', 'i'),
+                                 ('_link_to', 'i'),
+                                 ('_field_portals', 'i')]:
+            setattr(self, name, array(typecode, getattr(self, name).tolist()))
+        self._thawed = True
+
+    def add_portal(self, name=None, guid=None, location=None):
+        self._thaw()
+        return super(MappedWorld, self).add_portal(name, guid, location)
+
+    def add_portals(self, records):
+        self._thaw()
+        return super(MappedWorld, self).add_portals(records)
+
+    def _move(self, id, location):
+        self._thaw()
+        super(MappedWorld, self)._move(id, location)
+
+    def _add_link(self, portal_one, portal_two):
+        self._thaw()
+        return super(MappedWorld, self)._add_link(portal_one, portal_two)
+
+    def create_field(self, portal1, portal2, portal3):
+        self._thaw()
+        return super(MappedWorld, self).create_field(
+            portal1, portal2, portal3
+        )
@@ -0,0 +1,513 @@
+import math
+from array import array
+from collections import deque
+
+import numpy
+
+import exact
+import geometry
+from linkathon import point_in_triangle, points_in_triangles
+
+
+EARTH_RADIUS = 6371008.8
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+# About a centimetre; coordinates closer than this are the same place.
+LOCATION_EPSILON = 1e-7
+
+
+def distance(location1, location2):
+    (lat1, lng1) = [math.radians(v) for v in location1]
+    (lat2, lng2) = [math.radians(v) for v in location2]
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2 +
+        math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1, math.sqrt(h)))
+
+
+def same_location(location1, location2):
+    if location1 is None or location2 is None:
+        return location1 is location2
+    return (
+        abs(location1[0] - location2[0]) <= LOCATION_EPSILON and
+        abs(location1[1] - location2[1]) <= LOCATION_EPSILON
+    )
+
+
+class LocalProjection(object):
+    """
+        Equirectangular projection onto a plane tangent at `origin`.
+
+        Maps (lat, lng) to (east, north) metres; accurate to well under a
+        percent across a city.
+    """
+    def __init__(self, origin):
+        self.origin = origin
+        self._scale_east = METRES_PER_DEGREE * math.cos(
+            math.radians(origin[0])
+        )
+
+    def project(self, location):
+        return (
+            (location[1] - self.origin[1]) * self._scale_east,
+            (location[0] - self.origin[0]) * METRES_PER_DEGREE
+        )
+
+
+def orientation(p, q, r):
+    """
+        Twice the signed area of p, q, r with lng as x and lat as y;
+        positive when the turn is counter-clockwise.
+    """
+    if geometry.EXACT:
+        # Exact in sign, scaled back to the units given.
+        points = [exact.to_e6(l) for l in (p, q, r)]
+        return exact.orientation(*points) / float(exact.SCALE ** 2)
+    return (
+        (q[1] - p[1]) * (r[0] - p[0]) -
+        (q[0] - p[0]) * (r[1] - p[1])
+    )
+
+
+def segments_cross(a, b, c, d):
+    """
+        True when segments a-b and c-d cross at a point interior to both.
+        Segments sharing an endpoint never cross.
+    """
+    if a == c or a == d or b == c or b == d:
+        return False
+    if geometry.EXACT:
+        return exact.segments_cross(*[exact.to_e6(p) for p in (a, b, c, d)])
+    return (
+        orientation(a, b, c) * orientation(a, b, d) < 0 and
+        orientation(c, d, a) * orientation(c, d, b) < 0
+    )
+
+
+class GridIndex(object):
+    """
+        Uniform lat/lng grid of items keyed on their location.
+
+        Each cell holds the items whose location falls in it, so a query
+        only visits the cells overlapping its bounding box.
+    """
+    def __init__(self, cell_size=0.005, location=None, bucket=list):
+        self._cell_size = float(cell_size)
+        self._location = location or (lambda item: item.location)
+        self._bucket = bucket
+        self._cells = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def cell(self, location):
+        (lat, lng) = location
+        return (
+            int(math.floor(lat / self._cell_size)),
+            int(math.floor(lng / self._cell_size))
+        )
+
+    def bucket(self, cell):
+        return self._cells.get(cell, ())
+
+    def insert(self, item):
+        key = self.cell(self._location(item))
+        bucket = self._cells.get(key)
+        if bucket is None:
+            bucket = self._cells[key] = self._bucket()
+        bucket.append(item)
+        self._count += 1
+
+    def extend(self, items):
+        """ `insert` each of `items`, filling each cell in one go """
+        added = {}
+        for item in items:
+            added.setdefault(self.cell(self._location(item)), []).append(item)
+        for (key, filed) in added.iteritems():
+            bucket = self._cells.get(key)
+            if bucket is None:
+                bucket = self._cells[key] = self._bucket()
+            bucket.extend(filed)
+            self._count += len(filed)
+
+    def remove(self, item, location=None):
+        key = self.cell(location or self._location(item))
+        bucket = self._cells.get(key, [])
+        if item in bucket:
+            bucket.remove(item)
+            self._count -= 1
+            if not bucket:
+                del self._cells[key]
+
+    def _candidates(self, min_lat, min_lng, max_lat, max_lng):
+        (lo_x, lo_y) = self.cell((min_lat, min_lng))
+        (hi_x, hi_y) = self.cell((max_lat, max_lng))
+        if (hi_x - lo_x + 1) * (hi_y - lo_y + 1) > len(self._cells):
+            for ((x, y), bucket) in self._cells.iteritems():
+                if lo_x <= x <= hi_x and lo_y <= y <= hi_y:
+                    for item in bucket:
+                        yield item
+        else:
+            for x in xrange(lo_x, hi_x + 1):
+                for y in xrange(lo_y, hi_y + 1):
+                    for item in self._cells.get((x, y), ()):
+                        yield item
+
+    def bbox(self, min_lat, min_lng, max_lat, max_lng):
+        for item in self._candidates(min_lat, min_lng, max_lat, max_lng):
+            (lat, lng) = self._location(item)
+            if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                yield item
+
+    def radius(self, location, metres):
+        (lat, lng) = location
+        d_lat = metres / METRES_PER_DEGREE
+        d_lng = d_lat / max(math.cos(math.radians(lat)), 1e-12)
+        for item in self.bbox(lat - d_lat, lng - d_lng,
+                              lat + d_lat, lng + d_lng):
+            if distance(location, self._location(item)) <= metres:
+                yield item
+
+    def triangle(self, p1, p2, p3):
+        lats = [p1[0], p2[0], p3[0]]
+        lngs = [p1[1], p2[1], p3[1]]
+        candidates = list(
+            self.bbox(min(lats), min(lngs), max(lats), max(lngs))
+        )
+        if not candidates:
+            return []
+        inside = points_in_triangles(
+            [self._location(item) for item in candidates],
+            [[p1, p2, p3]]
+        )[:, 0]
+        return [item for (item, hit) in zip(candidates, inside) if hit]
+
+
+class SegmentIndex(object):
+    """
+        Uniform lat/lng grid of segments.
+
+        A segment is stored in every cell its line passes through, found
+        by walking the grid from one end to the other. Cells hold slots
+        into an array of endpoints, so a query gathers the segments
+        sharing a cell with it and tests them together in numpy.
+    """
+    def __init__(self, cell_size=0.005, endpoints=None):
+        self._cell_size = float(cell_size)
+        self._endpoints = endpoints or (lambda item: item)
+        self._cells = {}
+        self._slots = {}
+        self._items = []
+        self._free = []
+        self._ends = numpy.empty((64, 4))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def cells(self, a, b):
+        (x0, y0) = (a[0] / self._cell_size, a[1] / self._cell_size)
+        (x1, y1) = (b[0] / self._cell_size, b[1] / self._cell_size)
+        (cx, cy) = (int(math.floor(x0)), int(math.floor(y0)))
+        (ex, ey) = (int(math.floor(x1)), int(math.floor(y1)))
+        yield (cx, cy)
+        (dx, dy) = (x1 - x0, y1 - y0)
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        inf = float('inf')
+        if dx:
+            t_x = (cx + (step_x > 0) - x0) / dx
+            delta_x = abs(1 / dx)
+        else:
+            (t_x, delta_x) = (inf, inf)
+        if dy:
+            t_y = (cy + (step_y > 0) - y0) / dy
+            delta_y = abs(1 / dy)
+        else:
+            (t_y, delta_y) = (inf, inf)
+        for _ in xrange(abs(ex - cx) + abs(ey - cy)):
+            if t_x < t_y:
+                cx += step_x
+                t_x += delta_x
+            else:
+                cy += step_y
+                t_y += delta_y
+            yield (cx, cy)
+        if (cx, cy) != (ex, ey):
+            yield (ex, ey)
+
+    def insert(self, item):
+        (a, b) = self._endpoints(item)
+        if self._free:
+            slot = self._free.pop()
+            self._items[slot] = item
+        else:
+            slot = len(self._items)
+            self._items.append(item)
+            if slot == len(self._ends):
+                self._ends = numpy.concatenate(
+                    [self._ends, numpy.empty_like(self._ends)]
+                )
+        self._ends[slot] = (a[0], a[1], b[0], b[1])
+        self._slots[item] = slot
+        for key in self.cells(a, b):
+            bucket = self._cells.get(key)
+            if bucket is None:
+                bucket = self._cells[key] = array('i')
+            bucket.append(slot)
+
+    def remove(self, item):
+        slot = self._slots.pop(item, None)
+        if slot is None:
+            return
+        (a0, a1, b0, b1) = self._ends[slot].tolist()
+        for key in self.cells((a0, a1), (b0, b1)):
+            bucket = self._cells.get(key)
+            if bucket is not None and slot in bucket:
+                bucket.remove(slot)
+                if not bucket:
+                    del self._cells[key]
+        self._items[slot] = None
+        self._free.append(slot)
+
+    def crossing(self, a, b):
+        """ The segments crossing a-b, as `segments_cross` decides """
+        buckets = [
+            self._cells[key] for key in self.cells(a, b) if key in self._cells
+        ]
+        if not buckets:
+            return
+        slots = numpy.unique(numpy.concatenate([
+            numpy.frombuffer(bucket, dtype=numpy.intc) for bucket in buckets
+        ]))
+        if geometry.EXACT:
+            for slot in slots.tolist():
+                item = self._items[slot]
+                if segments_cross(a, b, *self._endpoints(item)):
+                    yield item
+            return
+        (px, py, qx, qy) = self._ends[slots].T
+        (a0, a1, b0, b1) = (a[0], a[1], b[0], b[1])
+        shared = (
+            ((px == a0) & (py == a1)) | ((px == b0) & (py == b1)) |
+            ((qx == a0) & (qy == a1)) | ((qx == b0) & (qy == b1))
+        )
+        # `orientation` of each end against the other segment.
+        c = (b1 - a1) * (px - a0) - (b0 - a0) * (py - a1)
+        d = (b1 - a1) * (qx - a0) - (b0 - a0) * (qy - a1)
+        e = (qy - py) * (a0 - px) - (qx - px) * (a1 - py)
+        f = (qy - py) * (b0 - px) - (qx - px) * (b1 - py)
+        crossed = (c * d < 0) & (e * f < 0) & ~shared
+        for slot in slots[crossed].tolist():
+            yield self._items[slot]
+
+
+class BoxIndex(object):
+    """
+        Bounding boxes on a stack of grids, the cells of each level twice
+        the size of the level below, level 0 having `cell_size` cells.
+
+        A box is filed at the lowest level whose cells are at least as
+        large as it, so it lands in at most four cells, shared only with
+        boxes of about its size, and a point looks in one cell per level.
+    """
+    def __init__(self, cell_size=0.005):
+        self._cell_size = float(cell_size)
+        self._levels = {}
+        self._filed = {}
+
+    def __len__(self):
+        return len(self._filed)
+
+    def __iter__(self):
+        return iter(self._filed)
+
+    def _size(self, level):
+        return self._cell_size * 2 ** level
+
+    def _cells(self, size, bbox):
+        (min_lat, min_lng, max_lat, max_lng) = bbox
+        (lo_x, lo_y) = (int(math.floor(min_lat / size)),
+                        int(math.floor(min_lng / size)))
+        (hi_x, hi_y) = (int(math.floor(max_lat / size)),
+                        int(math.floor(max_lng / size)))
+        return (lo_x, lo_y, hi_x, hi_y)
+
+    def insert(self, item, bbox):
+        extent = max(bbox[2] - bbox[0], bbox[3] - bbox[1])
+        level = 0
+        while self._size(level) < extent:
+            level += 1
+        while extent and self._size(level - 1) >= extent:
+            level -= 1
+        (lo_x, lo_y, hi_x, hi_y) = self._cells(self._size(level), bbox)
+        keys = [
+            (x, y) for x in xrange(lo_x, hi_x + 1)
+            for y in xrange(lo_y, hi_y + 1)
+        ]
+        cells = self._levels.setdefault(level, {})
+        for key in keys:
+            cells.setdefault(key, []).append(item)
+        self._filed[item] = (level, keys)
+
+    def remove(self, item):
+        (level, keys) = self._filed.pop(item)
+        cells = self._levels[level]
+        for key in keys:
+            bucket = cells[key]
+            bucket.remove(item)
+            if not bucket:
+                del cells[key]
+        if not cells:
+            del self._levels[level]
+
+    def at(self, location):
+        """ Items whose cell holds `location`, a superset of the boxes """
+        for (level, cells) in self._levels.iteritems():
+            size = self._size(level)
+            key = (int(math.floor(location[0] / size)),
+                   int(math.floor(location[1] / size)))
+            for item in cells.get(key, ()):
+                yield item
+
+    def overlapping(self, bbox):
+        """ Items whose cells meet `bbox`, a superset of the boxes """
+        seen = set()
+        for (level, cells) in self._levels.iteritems():
+            (lo_x, lo_y, hi_x, hi_y) = self._cells(self._size(level), bbox)
+            if (hi_x - lo_x + 1) * (hi_y - lo_y + 1) > len(cells):
+                buckets = [
+                    bucket for ((x, y), bucket) in cells.iteritems()
+                    if lo_x <= x <= hi_x and lo_y <= y <= hi_y
+                ]
+            else:
+                buckets = [
+                    cells[(x, y)] for x in xrange(lo_x, hi_x + 1)
+                    for y in xrange(lo_y, hi_y + 1) if (x, y) in cells
+                ]
+            for bucket in buckets:
+                for item in bucket:
+                    if item not in seen:
+                        seen.add(item)
+                        yield item
+
+
+class FieldNode(object):
+    __slots__ = ('item', 'corners', 'bbox', 'parent', 'children')
+
+    def __init__(self, item, corners):
+        self.item = item
+        self.corners = corners
+        (lats, lngs) = zip(*corners)
+        self.bbox = (min(lats), min(lngs), max(lats), max(lngs))
+        self.parent = None
+        self.children = BoxIndex()
+
+    def covers(self, location):
+        (min_lat, min_lng, max_lat, max_lng) = self.bbox
+        return (
+            min_lat <= location[0] <= max_lat and
+            min_lng <= location[1] <= max_lng and
+            point_in_triangle(location, *self.corners)
+        )
+
+    def encloses(self, other):
+        (min_lat, min_lng, max_lat, max_lng) = self.bbox
+        bbox = other.bbox
+        if bbox[0] < min_lat or bbox[1] < min_lng or \
+                bbox[2] > max_lat or bbox[3] > max_lng:
+            return False
+        return all(
+            point_in_triangle(corner, *self.corners)
+            for corner in other.corners
+        )
+
+
+class FieldTree(object):
+    """
+        Containment hierarchy of triangles.
+
+        A triangle's children are the largest triangles inside it. Fields
+        never cross, so any two are nested or apart, and finding those
+        covering a point follows the few branches holding it instead of
+        testing every field. The triangles of each level are kept in a
+        `BoxIndex`, so many fields side by side are not scanned in turn.
+        Triangles with an unknown corner are left out.
+    """
+    def __init__(self, corners=None):
+        self._corners = corners or (lambda item: item)
+        self._nodes = {}
+        self._roots = BoxIndex()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, item):
+        return item in self._nodes
+
+    def insert(self, item):
+        corners = [tuple(c) if c is not None else None
+                   for c in self._corners(item)]
+        if None in corners or item in self._nodes:
+            return
+        node = self._nodes[item] = FieldNode(item, corners)
+        siblings = self._roots
+        descended = True
+        while descended:
+            descended = False
+            for other in siblings.at(corners[0]):
+                if other.encloses(node):
+                    (node.parent, siblings) = (other, other.children)
+                    descended = True
+                    break
+        for other in [s for s in siblings.overlapping(node.bbox)
+                      if node.encloses(s)]:
+            siblings.remove(other)
+            other.parent = node
+            node.children.insert(other, other.bbox)
+        siblings.insert(node, node.bbox)
+
+    def remove(self, item):
+        node = self._nodes.pop(item, None)
+        if node is None:
+            return
+        siblings = self._roots if node.parent is None else \
+            node.parent.children
+        siblings.remove(node)
+        for child in node.children:
+            child.parent = node.parent
+            siblings.insert(child, child.bbox)
+
+    def covering(self, location):
+        """ Items whose triangle holds `location`, outermost first """
+        if location is None:
+            return []
+        found = []
+        queue = deque(self._roots.at(location))
+        while queue:
+            node = queue.popleft()
+            if node.covers(location):
+                found.append(node.item)
+                queue.extend(node.children.at(location))
+        return found
+
+    def depth(self, item):
+        node = self._nodes[item]
+        depth = 0
+        while node.parent is not None:
+            (node, depth) = (node.parent, depth + 1)
+        return depth
+
+
+def find_crossings(segments, cell_size=0.005):
+    """
+        All pairs `(i, j)`, i < j, of crossing segments in `segments`, a
+        sequence of endpoint pairs. Each segment is checked against those
+        before it through a `SegmentIndex`, then added to it.
+    """
+    index = SegmentIndex(cell_size, endpoints=lambda ix: segments[ix])
+    found = []
+    for (ix, (a, b)) in enumerate(segments):
+        found.extend((j, ix) for j in index.crossing(a, b))
+        index.insert(ix)
+    return sorted(found)
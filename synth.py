@@ -0,0 +1,137 @@
+import math
+import random
+
+from spatial import METRES_PER_DEGREE, GridIndex, SegmentIndex
+
+
+CENTRE = (51.26, -1.08)
+
+
+def make_guid(rng):
+    return "{:032x}.16".format(rng.getrandbits(128))
+
+
+def records(locations, rng):
+    return [
+        ("Synthetic {}".format(ix), make_guid(rng), location)
+        for (ix, location) in enumerate(locations)
+    ]
+
+
+def scatter(rng, centre, radius):
+    (lat, lng) = centre
+    return (
+        lat + rng.uniform(-radius, radius),
+        lng + rng.uniform(-radius, radius)
+    )
+
+
+def uniform(count, seed=0, centre=CENTRE, radius=0.05):
+    """ `count` portal records spread evenly over a square """
+    rng = random.Random(seed)
+    return records(
+        [scatter(rng, centre, radius) for _ in xrange(count)],
+        rng
+    )
+
+
+def clustered(count, seed=0, centre=CENTRE, radius=0.05, clusters=20,
+              spread=0.002):
+    """ Portal records in Gaussian clumps around random cluster centres """
+    rng = random.Random(seed)
+    centres = [scatter(rng, centre, radius) for _ in xrange(clusters)]
+    locations = []
+    for _ in xrange(count):
+        (c_lat, c_lng) = rng.choice(centres)
+        locations.append(
+            (rng.gauss(c_lat, spread), rng.gauss(c_lng, spread))
+        )
+    return records(locations, rng)
+
+
+def city(count, seed=0, centre=CENTRE, radius=0.05, streets=8):
+    """
+        Portal records shaped like a town: a dense centre, ribbons along
+        radial streets thinning with distance, and a sparse background.
+    """
+    rng = random.Random(seed)
+    (lat, lng) = centre
+    headings = [rng.uniform(0, 2 * math.pi) for _ in xrange(streets)]
+    locations = []
+    for _ in xrange(count):
+        kind = rng.random()
+        if kind < 0.5:
+            location = (
+                rng.gauss(lat, radius / 8),
+                rng.gauss(lng, radius / 8)
+            )
+        elif kind < 0.9:
+            heading = rng.choice(headings)
+            reach = min(rng.expovariate(3.0 / radius), radius)
+            location = (
+                lat + reach * math.sin(heading) + rng.gauss(0, radius / 200),
+                lng + reach * math.cos(heading) + rng.gauss(0, radius / 200)
+            )
+        else:
+            location = scatter(rng, centre, radius)
+        locations.append(location)
+    return records(locations, rng)
+
+
+DISTRIBUTIONS = {
+    'uniform': uniform,
+    'clustered': clustered,
+    'city': city,
+}
+
+
+def populate(world, portal_records):
+    return world.add_portals(portal_records)
+
+
+def random_link_plan(portals, count, seed=0, reach=None):
+    """
+        Up to `count` random links between nearby portals, none crossing
+        another, as `(portal_from, portal_to)` pairs in throw order.
+
+        Each link goes to a random portal in the grid cells around its
+        origin, cells being `reach` metres across; by default a few times
+        the mean spacing of the portals.
+    """
+    rng = random.Random(seed)
+    located = [p for p in portals if p.location is not None]
+    if len(located) < 2:
+        return []
+    if reach is None:
+        lats = [p.location[0] for p in located]
+        lngs = [p.location[1] for p in located]
+        extent = max(max(lats) - min(lats), max(lngs) - min(lngs), 1e-6)
+        reach = 3 * extent * METRES_PER_DEGREE / math.sqrt(len(located))
+    grid = GridIndex(cell_size=reach / METRES_PER_DEGREE)
+    for portal in located:
+        grid.insert(portal)
+    segments = SegmentIndex(
+        cell_size=reach / METRES_PER_DEGREE,
+        endpoints=lambda pair: (pair[0].location, pair[1].location)
+    )
+    links = []
+    seen = set()
+    for _ in xrange(count * 20):
+        if len(links) >= count:
+            break
+        portal_from = rng.choice(located)
+        (x, y) = grid.cell(portal_from.location)
+        nearby = grid.bucket((x + rng.randint(-1, 1), y + rng.randint(-1, 1)))
+        if not nearby:
+            continue
+        portal_to = rng.choice(nearby)
+        key = frozenset((portal_from, portal_to))
+        if portal_to is portal_from or key in seen:
+            continue
+        if any(segments.crossing(portal_from.location, portal_to.location)):
+            continue
+        seen.add(key)
+        pair = (portal_from, portal_to)
+        segments.insert(pair)
+        links.append(pair)
+    return links
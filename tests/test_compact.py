@@ -0,0 +1,145 @@
+# test_compact.py
+import gc
+import os
+import random
+from unittest import TestCase
+import test_worldsim
+from compact import CompactWorld, PortalView, StringColumn
+
+
+class TestCompactWorld(test_worldsim.TestWorldsim):
+    """ The worldsim behaviour must hold on top of compact storage """
+    def setUp(self):
+        self.world = CompactWorld()
+
+    def test_readded_portal_gets_fresh_geometry(self):
+        (a, b) = [
+            self.world.add_portal(location=location)
+            for location in [(51.25, -1.08), (51.25, -1.07)]
+        ]
+        start = self.world.checkpoint()
+        c = self.world.add_portal(location=(51.255, -1.08))
+        small = self.world.area_of_field(a, b, c)
+        self.world.rollback(start)
+        d = self.world.add_portal(location=(51.27, -1.08))
+        self.assertEqual(d, c)
+        self.assertAlmostEqual(
+            self.world.area_of_field(a, b, d), 4 * small, delta=small * 1e-3
+        )
+
+    def test_field_lookup(self):
+        portals = self.create_portals()
+        field = self.world.create_field(portals[0], portals[1], portals[2])
+        other = self.world.create_field(portals[0], portals[2], portals[3])
+        self.assertEqual(
+            self.world.create_field(portals[2], portals[0], portals[1]),
+            field
+        )
+        self.assertEqual(len(self.world.fields), 2)
+        self.assertEqual(
+            self.world.get_field(portals[1], portals[2], portals[0]),
+            field
+        )
+        self.assertEqual(self.world.fields_on(portals[0]), [field, other])
+        self.assertEqual(
+            self.world.fields[1].portals,
+            [portals[0], portals[2], portals[3]]
+        )
+
+    def test_portals_are_views(self):
+        portals = self.create_portals()
+        self.assertIsInstance(portals[0], PortalView)
+        self.assertEqual(self.world.portal[16], portals[16])
+        self.assertEqual(portals[16].name, "Ivy & George White Plaque")
+        portals[16].name = "Renamed"
+        self.assertEqual(self.world.portal[-1].name, "Renamed")
+
+    def test_moving_portal_updates_index(self):
+        portals = self.create_portals()
+        portals[0].location = (10.0, 10.0)
+        self.assertEqual(
+            self.world.portals_within((10.0, 10.0), 1),
+            [portals[0]]
+        )
+        self.assertNotIn(
+            portals[0],
+            self.world.portals_within((51.258472, -1.076191), 1)
+        )
+
+    def test_non_ascii_names_match_world(self):
+        world = test_worldsim.World()
+        for target in (world, self.world):
+            target.add_portal(name=u"Caf\xe9 Fountain", guid="cafe.1",
+                              location=(51.25, -1.08))
+        self.assertEqual(
+            self.world.portal[0].name,
+            world.portal[0].name
+        )
+        for ref in (u"Caf\xe9 Fountain", u"caf\xe9", "Cafe"):
+            self.assertEqual(
+                self.world.resolve(ref).name,
+                world.resolve(ref).name
+            )
+
+
+class TestStringColumn(TestCase):
+    def test_round_trip(self):
+        column = StringColumn()
+        for value in ["Torch", None, "", u"Caf\xe9"]:
+            column.append(value)
+        self.assertEqual(len(column), 4)
+        self.assertEqual(
+            [column[ix] for ix in range(4)],
+            ["Torch", None, "", u"Caf\xe9"]
+        )
+        self.assertIsInstance(column[0], str)
+        self.assertIsInstance(column[3], unicode)
+        column[1] = "Filled"
+        self.assertEqual(column[1], "Filled")
+        self.assertEqual(column[2], "")
+
+    def test_pop(self):
+        column = StringColumn()
+        for value in ["Torch", "Hare", None]:
+            column.append(value)
+        column[0] = "Renamed"
+        column.pop()
+        column.pop()
+        self.assertEqual(len(column), 1)
+        self.assertEqual(column[0], "Renamed")
+        column.append("Bounty")
+        self.assertEqual(column[1], "Bounty")
+
+
+def resident_mb():
+    with open('/proc/self/statm') as stream:
+        pages = int(stream.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / float(1 << 20)
+
+
+class TestCompactMemory(TestCase):
+    def setUp(self):
+        if not os.path.exists('/proc/self/statm'):
+            self.skipTest("Needs /proc to measure memory")
+
+    def test_memory_ceiling(self):
+        rng = random.Random(9)
+        gc.collect()
+        before = resident_mb()
+        world = CompactWorld()
+        for start in xrange(0, 50000, 1000):
+            world.add_portals([
+                ("Portal {} by the old mill".format(ix),
+                 "{:032x}.16".format(rng.getrandbits(128)),
+                 (51.2 + rng.random() * 0.1, -1.1 + rng.random() * 0.1))
+                for ix in xrange(start, start + 1000)
+            ])
+        gc.collect()
+        # Columns only: the lookups wait for their first use.
+        self.assertNotIn('_name_index', world.__dict__)
+        self.assertNotIn('_guid_index', world.__dict__)
+        self.assertLess(resident_mb() - before, 16)
+        self.assertEqual(len(world.find_portals("portal 4999 by")), 1)
+        self.assertIsNotNone(world.get_portal(world.portal[7].guid))
+        gc.collect()
+        self.assertLess(resident_mb() - before, 64)
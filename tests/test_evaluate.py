@@ -0,0 +1,83 @@
+# test_evaluate.py
+import os
+from unittest import TestCase
+import numpy as np
+import evaluate
+import mu
+import plan
+from worldsim import World, Player, LinkCommand, MoveCommand
+
+PLAN_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'wm_linkathon.cmd'
+)
+
+
+class TestEvaluate(TestCase):
+    def setUp(self):
+        (self.plan, errors) = plan.load(plan.parse_file(PLAN_FILE))
+        self.world = World()
+        self.player = Player()
+        self.world.add_player(self.player)
+        plan.compile_plan(self.plan, self.world, self.player, [])
+
+    def scenario(self, sequence):
+        player = Player()
+        self.world.add_player(player)
+        for id in sequence:
+            for (portal_from, portal_to) in plan.sequence_links(
+                    self.plan, [id]):
+                player.add_command(MoveCommand(
+                    portal_from.location
+                ))
+                player.add_command(LinkCommand(
+                    portal1=self.world_portal(portal_from),
+                    portal2=self.world_portal(portal_to)
+                ))
+        return evaluate.scenario_from_commands(self.world, player.commands)
+
+    def world_portal(self, plan_portal):
+        for portal in self.world.portal:
+            if portal.name == plan_portal.name:
+                return portal
+
+    def test_evaluate_scenario(self):
+        records = evaluate.portal_records(self.world)
+        metrics = evaluate.evaluate_scenario(records, self.scenario([20]))
+        self.assertEqual(metrics.fields, 1)
+        self.assertEqual(metrics.failed_links, 0)
+        self.assertGreater(metrics.field_area, 0)
+        self.assertGreater(metrics.walk_distance, 0)
+
+    def test_mu_from_density_raster(self):
+        records = evaluate.portal_records(self.world)
+        raster = mu.DensityRaster(
+            np.ones((1000, 1000)), 51.2, -1.2, 51.3, -1.0
+        )
+        scenario = self.scenario([20])
+        self.assertIsNone(evaluate.evaluate_scenario(records, scenario).mu)
+        metrics = evaluate.evaluate_scenario(records, scenario, raster)
+        self.assertEqual(metrics.fields, 1)
+        self.assertGreater(metrics.mu, 0)
+
+    def test_failed_links_are_counted(self):
+        records = evaluate.portal_records(self.world)
+        metrics = evaluate.evaluate_scenario(
+            records,
+            [('move', records[0][2]), ('link', 1, 2)]
+        )
+        self.assertEqual(metrics.failed_links, 1)
+        self.assertEqual(metrics.walk_distance, 0)
+
+    def test_pool_matches_in_process(self):
+        records = evaluate.portal_records(self.world)
+        scenarios = [
+            self.scenario([28, 20, 101]),
+            self.scenario([20, 28, 101]),
+            self.scenario([21, 50, 51]),
+        ]
+        with evaluate.Evaluator(self.world, processes=2) as evaluator:
+            results = evaluator.evaluate(scenarios)
+        self.assertEqual(
+            results,
+            [evaluate.evaluate_scenario(records, s) for s in scenarios]
+        )
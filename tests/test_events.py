@@ -0,0 +1,80 @@
+# test_events.py
+import json
+from StringIO import StringIO
+from unittest import TestCase
+import events
+from worldsim import World, Player, LinkCommand, MoveCommand
+
+
+class TestEvents(TestCase):
+    def run_triangle(self, sink):
+        world = World(events=sink)
+        player = Player(name="agent")
+        world.add_player(player)
+        (a, b, c) = [
+            world.add_portal(name=name, location=location)
+            for (name, location) in [
+                ("A", (0.0, 0.0)),
+                ("B", (0.0, 1.0)),
+                ("C", (1.0, 0.0)),
+            ]
+        ]
+        player.add_command(MoveCommand(a.location))
+        player.add_command(LinkCommand(portal1=a, portal2=b))
+        player.add_command(LinkCommand(portal1=b, portal2=c))
+        player.add_command(LinkCommand(portal1=a, portal2=c))
+        player.add_command(MoveCommand(b.location))
+        player.add_command(LinkCommand(portal1=b, portal2=c))
+        for command in player.commands:
+            command()
+        return (a, b, c)
+
+    def test_default_sink_is_null(self):
+        self.assertIsInstance(World().events, events.NullSink)
+
+    def test_ring_buffer(self):
+        sink = events.RingBufferSink()
+        (a, b, c) = self.run_triangle(sink)
+        self.assertEqual(
+            [event[0] for event in sink.events],
+            [
+                events.MOVE,
+                events.LINK_CREATED,
+                events.LINK_FAILED,
+                events.LINK_CREATED,
+                events.MOVE,
+                events.LINK_CREATED,
+                events.FIELD_CREATED,
+            ]
+        )
+        self.assertEqual(
+            sink.of_kind(events.FIELD_CREATED),
+            [(events.FIELD_CREATED, (b, c, a))]
+        )
+
+    def test_ring_buffer_is_bounded(self):
+        sink = events.RingBufferSink(size=2)
+        self.run_triangle(sink)
+        self.assertEqual(len(sink.events), 2)
+
+    def test_json_lines(self):
+        stream = StringIO()
+        sink = events.JsonLinesSink(stream, buffer_size=100)
+        self.run_triangle(sink)
+        self.assertEqual(stream.getvalue(), '')
+        sink.flush()
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(records), 7)
+        self.assertEqual(
+            records[2],
+            {
+                'event': 'link-failed',
+                'player': 'agent',
+                'portal_from': 'B',
+                'portal_to': 'C',
+            }
+        )
+        self.assertEqual(
+            records[-1],
+            {'event': 'field-created', 'portals': ['B', 'C', 'A']}
+        )
@@ -0,0 +1,132 @@
+# test_exact.py
+from unittest import TestCase
+import numpy as np
+import compact
+import exact
+import geometry
+import linkathon
+import spatial
+import worldsim
+
+# Collinear on the E6 grid, though not in floating point.
+COLLINEAR = [
+    (51.258472, -1.076191),
+    (51.258473, -1.07619),
+    (51.258474, -1.076189),
+]
+TRIANGLE = [(51.25, -1.08), (51.27, -1.08), (51.25, -1.06)]
+
+
+class TestExact(TestCase):
+    def test_round_trip(self):
+        point = exact.to_e6((51.258472, -1.076191))
+        self.assertEqual(point, (51258472, -1076191))
+        self.assertEqual(exact.from_e6(point), (51.258472, -1.076191))
+
+    def test_orientation(self):
+        points = [exact.to_e6(l) for l in COLLINEAR]
+        self.assertEqual(exact.turn(*points), 0)
+        self.assertEqual(exact.doubled_area(*points), 0)
+        (a, b, c) = [exact.to_e6(l) for l in TRIANGLE]
+        self.assertEqual(exact.turn(a, b, c), -1)
+        self.assertEqual(exact.turn(a, c, b), 1)
+        self.assertEqual(exact.doubled_area(a, b, c), 20000 ** 2)
+
+    def test_contains(self):
+        (a, b, c) = [exact.to_e6(l) for l in TRIANGLE]
+        self.assertTrue(exact.contains(a, b, c, (51255000, -1075000)))
+        self.assertTrue(exact.contains(a, b, c, (51260000, -1070000)))
+        self.assertTrue(exact.contains(a, b, c, a))
+        self.assertFalse(exact.contains(a, b, c, (51260001, -1070000)))
+        points = [exact.to_e6(l) for l in COLLINEAR]
+        self.assertFalse(exact.contains(*(points + [points[1]])))
+
+    def test_segments(self):
+        (a, b, c, d) = ((0, 0), (2, 2), (0, 2), (2, 0))
+        self.assertTrue(exact.segments_cross(a, b, c, d))
+        self.assertTrue(exact.segments_intersect(a, b, c, d))
+        self.assertFalse(exact.segments_cross(a, b, b, d))
+        self.assertTrue(exact.segments_intersect(a, b, b, d))
+        self.assertFalse(exact.segments_cross(a, (1, 1), (1, 1), (3, 3)))
+        self.assertTrue(exact.segments_intersect(a, b, (1, 1), (3, 3)))
+        self.assertFalse(exact.segments_intersect(a, (1, 1), (2, 2), (3, 3)))
+
+    def test_half_units_round_alike(self):
+        triangle = [(0.0, 0.0), (0.0, 1e-5), (1e-5, 0.0)]
+        point = (4.5e-6, 5.5e-6)
+        self.assertEqual(
+            exact.points_in_triangles([point], [triangle])[0, 0],
+            exact.contains(*[exact.to_e6(l) for l in triangle + [point]])
+        )
+        values = (np.arange(-1000, 1000) + 0.5) / 1e6
+        self.assertEqual(
+            exact.array_to_e6(values).tolist(),
+            [exact.to_e6((v, v))[0] for v in values]
+        )
+
+    def test_batch_matches_scalar(self):
+        rng = np.random.RandomState(3)
+        corners = rng.randint(0, 20, size=(30, 3, 2)) / 1e6 + 51.25
+        points = rng.randint(0, 20, size=(50, 2)) / 1e6 + 51.25
+        self.check_batch(points, corners)
+        # Half way between grid points, where rounding rules differ.
+        corners = (rng.randint(-20, 20, size=(30, 3, 2)) + 0.5) / 1e6
+        points = (rng.randint(-20, 20, size=(50, 2)) + 0.5) / 1e6
+        self.check_batch(points, corners)
+
+    def check_batch(self, points, corners):
+        inside = exact.points_in_triangles(points, corners)
+        for (ix, point) in enumerate(points):
+            for (jx, triangle) in enumerate(corners):
+                self.assertEqual(
+                    inside[ix, jx],
+                    exact.contains(*[
+                        exact.to_e6(l) for l in list(triangle) + [point]
+                    ])
+                )
+
+
+class TestUseExact(TestCase):
+    def setUp(self):
+        geometry.use_exact()
+        self.addCleanup(geometry.use_exact, False)
+
+    def test_point_on_edge(self):
+        middle = (51.26, -1.07)
+        self.assertTrue(linkathon.point_in_triangle(middle, *TRIANGLE))
+        self.assertTrue(linkathon.points_in_triangles([middle], [TRIANGLE]))
+        self.assertFalse(
+            linkathon.point_in_triangle(COLLINEAR[1], *COLLINEAR)
+        )
+
+    def test_crossing_and_area(self):
+        self.assertFalse(spatial.segments_cross(
+            COLLINEAR[0], COLLINEAR[2], COLLINEAR[1], (51.258474, -1.076193)
+        ))
+        self.assertEqual(worldsim.area_of_triangle(*COLLINEAR), 0)
+        self.assertAlmostEqual(
+            worldsim.area_of_triangle(*TRIANGLE), 0.0002
+        )
+        self.assertEqual(spatial.orientation(*COLLINEAR), 0)
+        self.assertLess(spatial.orientation(*TRIANGLE), 0)
+
+    def test_portals_cache_e6(self):
+        for world in (worldsim.World(), compact.CompactWorld()):
+            portal = world.add_portal(location=COLLINEAR[0])
+            self.assertEqual(portal.e6, (51258472, -1076191))
+            world.move_portal(portal, TRIANGLE[0])
+            self.assertEqual(portal.e6, (51250000, -1080000))
+            self.assertEqual(geometry.e6(portal), portal.e6)
+
+    def test_cache_orientation(self):
+        portals = [worldsim.Portal("P{}".format(ix), location=l)
+                   for (ix, l) in enumerate(COLLINEAR)]
+        cache = geometry.GeometryCache()
+        self.assertEqual(cache.orientation(*portals), 0)
+        self.assertEqual(cache.area(*portals), 0)
+        self.assertFalse(cache.contains(*(portals + [portals[1]])))
+        geometry.use_exact(False)
+        self.assertEqual(len(cache), 3)
+        cache.orientation(*portals)
+        self.assertEqual(len(cache), 4)
+        self.assertNotEqual(cache.area(*portals), 0)
@@ -0,0 +1,127 @@
+# test_geometry.py
+import gc
+import weakref
+from unittest import TestCase
+import geometry
+import linkathon
+from compact import CompactWorld
+from planner import FanPlan
+from worldsim import World
+
+
+class TestGeometryCache(TestCase):
+    def setUp(self):
+        self.cache = geometry.GeometryCache(size=8)
+        self.world = World(origin=(0.0, 0.0), geometry_cache=self.cache)
+        (self.a, self.b, self.c, self.d) = [
+            self.world.add_portal(name=name, location=location)
+            for (name, location) in [
+                ("A", (0.0, 0.0)),
+                ("B", (0.0, 0.001)),
+                ("C", (0.001, 0.0)),
+                ("D", (0.0002, 0.0002)),
+            ]
+        ]
+
+    def test_area_is_cached_in_any_order(self):
+        area = self.world.area_of_field(self.a, self.b, self.c)
+        self.assertAlmostEqual(area, 111.2 * 111.2 / 2, delta=10)
+        self.assertEqual(
+            self.world.area_of_field(self.c, self.a, self.b),
+            area
+        )
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_canonical_breaks_ties_on_guid_and_name(self):
+        portals = [
+            self.world.add_portal(name=name, guid=guid, location=(0.0, 0.0))
+            for (name, guid) in [("Y", "g2"), ("X", "g2"), ("Z", "g1")]
+        ]
+        for order in (portals, portals[::-1]):
+            self.assertEqual(
+                [p.name for p in geometry.canonical(order)],
+                ["Z", "X", "Y"]
+            )
+
+    def test_orientation_follows_argument_order(self):
+        turn = self.cache.orientation(self.a, self.b, self.c)
+        self.assertEqual(turn, 1)
+        self.assertEqual(self.cache.orientation(self.b, self.a, self.c), -1)
+        self.assertEqual(self.cache.orientation(self.b, self.c, self.a), 1)
+        self.assertEqual(self.cache.orientation(self.a, self.c, self.b), -1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_contains(self):
+        self.assertTrue(self.cache.contains(self.a, self.b, self.c, self.d))
+        self.assertFalse(self.cache.contains(self.a, self.b, self.d, self.c))
+
+    def test_moving_a_portal_invalidates(self):
+        before = self.world.area_of_field(self.a, self.b, self.c)
+        self.c.location = (0.002, 0.0)
+        after = self.world.area_of_field(self.a, self.b, self.c)
+        self.assertAlmostEqual(after, 2 * before, delta=1)
+        self.assertFalse(self.cache.contains(self.a, self.b, self.d, self.c))
+        self.d.location = (0.0, 0.0005)
+        self.assertTrue(self.cache.contains(self.a, self.b, self.c, self.d))
+
+    def test_lru_is_bounded(self):
+        portals = [
+            self.world.add_portal(location=(0.0001 * ix, 0.0))
+            for ix in range(12)
+        ]
+        for ix in range(len(portals) - 1):
+            self.world.distance(portals[ix], portals[ix + 1])
+        self.assertEqual(len(self.cache), 8)
+        self.world.distance(portals[-2], portals[-1])
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_linkathon_field(self):
+        portals = []
+        for location in [(0, 0), (0, 4), (4, 0), (1, 1)]:
+            portal = linkathon.Portal()
+            portal.location = location
+            portals.append(portal)
+        field = linkathon.Field(*portals[:3])
+        self.assertTrue(field.portal_inside_field(portals[3]))
+        portals[3].location = (5, 5)
+        self.assertFalse(field.portal_inside_field(portals[3]))
+
+    def test_planner_and_world_share_the_cache(self):
+        world = World()
+        self.assertIs(world.geometry, geometry.shared)
+        anchor = world.add_portal(location=(0.0, 0.0))
+        portals = [
+            world.add_portal(location=location)
+            for location in [(0.0, 0.001), (0.001, 0.001), (0.001, 0.0)]
+        ]
+        plan = FanPlan(anchor, [anchor] + portals)
+        self.assertGreater(plan.field_area, 0)
+        hits = geometry.shared.hits
+        for field in plan.fields:
+            world.area_of_field(*field)
+        self.assertEqual(geometry.shared.hits, hits + len(plan.fields))
+
+    def test_runs_share_the_cache(self):
+        hits = []
+        for _ in range(2):
+            world = World()
+            portals = [
+                world.add_portal(location=location)
+                for location in [(0.0, 0.0), (0.0, 0.002), (0.002, 0.0)]
+            ]
+            world.area_of_field(*portals)
+            hits.append(geometry.shared.hits)
+        self.assertEqual(hits[1], hits[0] + 1)
+
+    def test_shared_cache_keeps_no_world_alive(self):
+        world = CompactWorld()
+        (a, b, c) = [
+            world.add_portal(location=location)
+            for location in [(0.0, 0.0), (0.0, 0.001), (0.001, 0.0)]
+        ]
+        self.assertGreater(world.area_of_field(a, b, c), 0)
+        self.assertIs(world.geometry, geometry.shared)
+        collected = weakref.ref(world)
+        del (world, a, b, c)
+        gc.collect()
+        self.assertIsNone(collected())
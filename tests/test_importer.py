@@ -0,0 +1,107 @@
+# test_importer.py
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase
+import importer
+from compact import CompactWorld
+from worldsim import World
+
+
+GUID = "47db8ce5d774463f9a8e7aef948e8093.16"
+OTHER = "7d2c6ea6b74d40d18147ee73dbcd802f.16"
+
+CSV = """name,guid,lat,lng
+Southern Entrance To War Memorial,{0},51.258472,-1.076191
+South Bounty,{1},51.258623,-1.081081
+No Guid,,51.26,-1.08
+Broken,c7c1ca91df9145b0bc3b894033d1ea4f.11,north,west
+""".format(GUID, OTHER)
+
+JSONL = """{{"title": "War Memorial", "guid": "{0}", "latE6": 51258472, \
+"lngE6": -1076191}}
+
+not json
+{{"title": "South Bounty", "guid": "{1}", "lat": 51.26, "lng": -1.08}}
+""".format(GUID, OTHER)
+
+
+class TestImporter(TestCase):
+    def setUp(self):
+        self.world = World()
+
+    def test_portal_record(self):
+        self.assertEqual(
+            importer.portal_record({'Title': 'Torch', 'GUID': GUID,
+                                    'latE6': '51258472', 'lngE6': '-1076191'}),
+            ('Torch', GUID, (51.258472, -1.076191))
+        )
+        self.assertEqual(
+            importer.portal_record({'name': 'Torch', 'guid': GUID}),
+            ('Torch', GUID, None)
+        )
+        self.assertIsNone(importer.portal_record({'name': 'Torch'}))
+
+    def test_insert(self):
+        report = importer.Importer(self.world, batch_size=1).run(
+            importer.read_csv(StringIO(CSV))
+        )
+        self.assertEqual(report, importer.ImportReport(2, 0, 2))
+        portal = self.world.get_portal(OTHER)
+        self.assertEqual(portal.name, "South Bounty")
+        self.assertEqual(portal.location, (51.258623, -1.081081))
+        self.assertEqual(
+            self.world.portals_within((51.258623, -1.081081), 1),
+            [portal]
+        )
+
+    def test_update(self):
+        importer.Importer(self.world).run(importer.read_csv(StringIO(CSV)))
+        portal = self.world.get_portal(OTHER)
+        report = importer.Importer(self.world).run(
+            importer.read_jsonl(StringIO(JSONL))
+        )
+        self.assertEqual(report, importer.ImportReport(0, 2, 1))
+        self.assertEqual(len(self.world.portal), 2)
+        self.assertEqual(self.world.get_portal(GUID).name, "War Memorial")
+        self.assertEqual(portal.location, (51.26, -1.08))
+        self.assertEqual(
+            self.world.portals_within((51.26, -1.08), 1),
+            [portal]
+        )
+        self.assertEqual(
+            self.world.portals_within((51.258623, -1.081081), 1),
+            []
+        )
+
+    def test_duplicates_within_batch(self):
+        for world in (self.world, CompactWorld()):
+            report = importer.Importer(world).run([
+                ("Torch", GUID, None),
+                (None, GUID, (51.26, -1.08)),
+                ("South Bounty", OTHER, (51.258623, -1.081081)),
+                ("Torch", GUID, None),
+            ])
+            self.assertEqual(report, importer.ImportReport(2, 0, 2))
+            self.assertEqual(len(world.portal), 2)
+            portal = world.get_portal(GUID)
+            self.assertEqual(portal.location, (51.26, -1.08))
+            self.assertEqual(world.portals_within((51.26, -1.08), 1), [portal])
+            self.assertEqual(world.resolve("south b"), world.get_portal(OTHER))
+
+    def test_import_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'portals.csv')
+            with open(path, 'w') as stream:
+                stream.write(CSV)
+            world = CompactWorld()
+            report = importer.import_file(world, path)
+            self.assertEqual(report.inserted, 2)
+            self.assertEqual(world.get_portal(GUID).name,
+                             "Southern Entrance To War Memorial")
+            with self.assertRaises(ValueError):
+                importer.import_file(world, path + '.txt')
+        finally:
+            shutil.rmtree(directory)
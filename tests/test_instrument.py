@@ -0,0 +1,98 @@
+# test_instrument.py
+import json
+from StringIO import StringIO
+from unittest import TestCase
+import instrument
+import linkathon
+import spatial
+import worldsim
+from worldsim import World, Player, LinkCommand, MoveCommand
+
+
+class TestInstrument(TestCase):
+    def setUp(self):
+        instrument.reset()
+        self.world = World()
+        (self.a, self.b, self.c) = [
+            self.world.add_portal(name=name, location=location)
+            for (name, location) in [
+                ("A", (0.0, 0.0)),
+                ("B", (0.001, 0.0)),
+                ("C", (0.0, 0.001)),
+            ]
+        ]
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_disabled_by_default(self):
+        self.assertFalse(instrument.enabled())
+        self.world.link_exists(self.a, self.b)
+        self.assertEqual(instrument.snapshot(), {})
+
+    def test_restores_originals(self):
+        original = worldsim.World.__dict__['create_link']
+        instrument.enable()
+        self.assertIsNot(worldsim.World.__dict__['create_link'], original)
+        instrument.disable()
+        self.assertIs(worldsim.World.__dict__['create_link'], original)
+
+    def test_counts_calls(self):
+        instrument.enable()
+        instrument.enable()
+        player = Player()
+        self.world.add_player(player)
+        player.location = self.a.location
+        player.add_command(LinkCommand(portal1=self.a, portal2=self.b))
+        player.add_command(LinkCommand(portal1=self.a, portal2=self.c))
+        player.add_command(MoveCommand(self.b.location))
+        player.add_command(LinkCommand(portal1=self.b, portal2=self.c))
+        for command in player.commands:
+            command()
+        self.world.link_exists(self.a, self.b)
+        stats = instrument.snapshot()
+        self.assertEqual(stats['LinkCommand.__call__']['calls'], 3)
+        self.assertEqual(stats['World.create_link']['calls'], 3)
+        self.assertEqual(stats['World.link_exists']['calls'], 1)
+        self.assertEqual(stats['MoveCommand.__call__']['calls'], 1)
+        self.assertEqual(stats['World.create_field']['calls'], 1)
+        self.assertIn('GeometryCache.area', stats)
+        entry = stats['World.create_link']
+        self.assertTrue(0 <= entry['p50'] <= entry['p99'] <= entry['total'])
+
+    def test_counts_imported_functions(self):
+        original = linkathon.point_in_triangle
+        self.assertIs(spatial.point_in_triangle, original)
+        instrument.enable()
+        self.assertIs(spatial.point_in_triangle, linkathon.point_in_triangle)
+        self.assertIsNot(spatial.point_in_triangle, original)
+        self.world.create_link(self.a, self.b)
+        self.world.create_link(self.b, self.c)
+        self.world.create_link(self.c, self.a)
+        instrument.reset()
+        self.world.fields_at((0.0001, 0.0001))
+        stats = instrument.snapshot()
+        self.assertEqual(
+            stats['linkathon.point_in_triangle']['calls'], 1
+        )
+        instrument.disable()
+        self.assertIs(spatial.point_in_triangle, original)
+
+    def test_reservoir_is_bounded(self):
+        stat = instrument.Stat(samples=10)
+        for ix in xrange(1000):
+            stat.record(float(ix), 0)
+        self.assertEqual(stat.calls, 1000)
+        self.assertEqual(len(stat._samples), 10)
+        self.assertEqual(stat.snapshot()['mean'], 499.5)
+
+    def test_dumper(self):
+        instrument.enable()
+        self.world.link_exists(self.a, self.b)
+        stream = StringIO()
+        dumper = instrument.Dumper(stream, interval=60)
+        dumper.start()
+        dumper.stop()
+        dumped = json.loads(stream.getvalue())
+        self.assertEqual(dumped['World.link_exists']['calls'], 1)
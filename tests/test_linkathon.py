@@ -106,3 +106,62 @@ class TestLinkathon(TestCase):
         self.assertTrue(field.portal_inside_field(portal))
         portal = self.l.portal["Tree Planting Ceremony Plaque"]
         self.assertFalse(field.portal_inside_field(portal))
+
+    def test_portals_inside_field_batch(self):
+        field = self.l.field['field_23']
+        portals = [
+            self.l.portal['Winnie White Memorial Bench'],
+            self.l.portal['Tree Planting Ceremony Plaque'],
+        ]
+        self.assertEqual(field.portals_inside_field(portals), [True, False])
+
+    def test_batch_matches_point_in_triangle(self):
+        names = sorted(self.l.fields)
+        fields = [self.l.field[name] for name in names]
+        portals = list(self.l.portals.itervalues())
+        inside = linkathon.portals_inside_fields(portals, fields)
+        self.assertEqual(inside.shape, (len(portals), len(fields)))
+        for (i, portal) in enumerate(portals):
+            for (j, field) in enumerate(fields):
+                self.assertEqual(
+                    inside[i, j],
+                    field.portal_inside_field(portal)
+                )
+
+    def test_bary(self):
+        (a, b, c) = linkathon.bary((0, 0), (0, 4), (4, 0), (1, 2))
+        self.assertAlmostEqual(a, 0.25)
+        self.assertAlmostEqual(b, 0.5)
+        self.assertAlmostEqual(c, 0.25)
+        self.assertRaises(
+            ValueError,
+            linkathon.bary, (0, 0), (1, 1), (2, 2), (1, 1)
+        )
+
+    def test_degenerate_triangle_contains_nothing(self):
+        triangles = [
+            [(0, 0), (1, 1), (2, 2)],
+            [(0, 0), (0, 4), (4, 0)],
+        ]
+        points = [(1, 1), (1, 2), (5, 5)]
+        inside = linkathon.points_in_triangles(points, triangles)
+        self.assertEqual(
+            inside.tolist(),
+            [[False, True], [False, True], [False, False]]
+        )
+
+    def test_triangle_hits(self):
+        triangles = [
+            [(0, 0), (0, 4), (4, 0)],
+            [(0, 0), (0, 2), (2, 0)],
+        ]
+        points = [(1, 1), (3, 0.5), (5, 5)]
+        (point_ix, triangle_ix) = linkathon.triangle_hits(
+            points,
+            triangles,
+            chunk_size=2
+        )
+        self.assertEqual(
+            sorted(zip(point_ix.tolist(), triangle_ix.tolist())),
+            [(0, 0), (0, 1), (1, 0)]
+        )
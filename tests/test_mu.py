@@ -0,0 +1,144 @@
+# test_mu.py
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+import numpy as np
+import mu
+from geometry import triangle_contains
+from worldsim import World
+
+
+def brute_force(raster, triangle):
+    (south, west, north, east) = raster.bounds
+    total = 0.0
+    for row in range(raster.rows):
+        lat = north - (row + 0.5) * raster.cell_lat
+        for col in range(raster.cols):
+            lng = west + (col + 0.5) * raster.cell_lng
+            if triangle_contains(*(list(triangle) + [(lat, lng)])):
+                total += raster.density[row, col]
+    return total
+
+
+class TestDensityRaster(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(7)
+        self.raster = mu.DensityRaster(
+            rng.randint(0, 50, size=(40, 60)), 51.2, -1.2, 51.3, -1.0
+        )
+
+    def test_matches_brute_force(self):
+        rng = np.random.RandomState(8)
+        for _ in range(40):
+            triangle = [
+                (rng.uniform(51.18, 51.32), rng.uniform(-1.22, -0.98))
+                for _ in range(3)
+            ]
+            self.assertAlmostEqual(
+                self.raster.triangle_sum(*triangle),
+                brute_force(self.raster, triangle)
+            )
+
+    def test_level_edge_and_whole_raster(self):
+        raster = mu.DensityRaster(np.ones((10, 10)), 0.0, 0.0, 1.0, 1.0)
+        self.assertEqual(
+            raster.triangle_sum((-1.0, -1.0), (-1.0, 3.0), (3.0, -1.0)), 100
+        )
+        level = [(0.02, 0.01), (0.02, 0.97), (0.93, 0.3)]
+        self.assertEqual(
+            raster.triangle_sum(*level), brute_force(raster, level)
+        )
+
+    def test_outside_and_degenerate(self):
+        self.assertEqual(
+            self.raster.triangle_sum((52.0, 0.0), (52.1, 0.0), (52.0, 0.1)),
+            0.0
+        )
+        self.assertEqual(
+            self.raster.triangle_sum(
+                (51.21, -1.19), (51.25, -1.1), (51.29, -1.01)
+            ),
+            0.0
+        )
+
+    def test_bad_raster(self):
+        with self.assertRaises(ValueError):
+            mu.DensityRaster(np.ones(5), 0, 0, 1, 1)
+        with self.assertRaises(ValueError):
+            mu.DensityRaster(np.ones((5, 5)), 1, 0, 1, 1)
+
+
+class TestLoad(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.raster = mu.DensityRaster(
+            np.arange(12.0).reshape(3, 4), 51.2, -1.2, 51.3, -1.0
+        )
+
+    def test_npz_round_trip(self):
+        path = os.path.join(self.directory, 'density.npz')
+        mu.save(self.raster, path)
+        loaded = mu.load(path)
+        self.assertEqual(loaded.bounds, self.raster.bounds)
+        self.assertEqual(loaded.density.tolist(), self.raster.density.tolist())
+
+    def test_npy_needs_bounds(self):
+        path = os.path.join(self.directory, 'density.npy')
+        np.save(path, self.raster.density)
+        with self.assertRaises(ValueError):
+            mu.load(path)
+        loaded = mu.load(path, self.raster.bounds)
+        self.assertEqual(loaded.prefix[2, 4], 8 + 9 + 10 + 11)
+        with self.assertRaises(ValueError):
+            mu.load(os.path.join(self.directory, 'density.tif'))
+
+
+class TestMUEstimator(TestCase):
+    def setUp(self):
+        # Dense to the south, empty to the north.
+        density = np.zeros((10, 10))
+        density[5:, :] = 100
+        raster = mu.DensityRaster(density, 51.2, -1.2, 51.3, -1.0)
+        self.estimator = mu.MUEstimator(raster)
+        self.world = World(field_score=self.estimator.mu)
+        (self.west, self.east, self.north, self.south) = [
+            self.world.add_portal(name=name, location=location)
+            for (name, location) in [
+                ("West", (51.25, -1.19)), ("East", (51.25, -1.01)),
+                ("North", (51.299, -1.1)), ("South", (51.23, -1.1)),
+            ]
+        ]
+
+    def test_link_keeps_field_worth_most_mu(self):
+        for portal in (self.north, self.south):
+            self.world.create_link(self.west, portal)
+            self.world.create_link(self.east, portal)
+        self.world.create_link(self.west, self.east)
+        self.assertTrue(
+            self.world.field_exists(self.west, self.east, self.south)
+        )
+        self.assertFalse(
+            self.world.field_exists(self.west, self.east, self.north)
+        )
+        self.assertGreater(
+            self.world.area_of_field(self.west, self.east, self.north),
+            self.world.area_of_field(self.west, self.east, self.south)
+        )
+
+    def test_cached_per_field(self):
+        first = self.estimator.mu(self.west, self.east, self.south)
+        self.assertGreater(first, 0)
+        self.assertEqual(
+            self.estimator.mu(self.south, self.west, self.east), first
+        )
+        self.assertEqual(self.estimator.hits, 1)
+        self.assertEqual(
+            self.estimator.mu(self.west, self.east, self.north), 0.0
+        )
+        self.world.move_portal(self.south, (51.21, -1.1))
+        self.assertGreater(
+            self.estimator.mu(self.west, self.east, self.south), first
+        )
+        self.assertEqual(self.estimator.misses, 3)
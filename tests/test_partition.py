@@ -0,0 +1,77 @@
+# test_partition.py
+from unittest import TestCase
+import partition
+import plan
+from scheduler import Simulation
+from test_plan import PLAN_FILE
+from worldsim import LinkCommand, Player, World
+
+INSIDE = [
+    'Inside\n',
+    'ID "A" AS 1\n',
+    'ID "B" AS 2\n',
+    'ID "C" AS 3\n',
+    'ID "D" AS 4\n',
+    'LOCATE 1 AT 0.0, 0.0\n',
+    'LOCATE 2 AT 0.0, 0.01\n',
+    'LOCATE 3 AT 0.01, 0.0\n',
+    'LOCATE 4 AT 0.002, 0.002\n',
+    'LINK 4 1 AS 11\n',
+    'FIELD 1 2 3 AS 10\n',
+    'LINK 4 2 AS 12 # Kicker for 10-11\n',
+    'SEQ 11, 10, 12\n',
+]
+
+
+class TestPartition(TestCase):
+    def setUp(self):
+        (self.plan, errors) = plan.load(plan.parse_file(PLAN_FILE))
+
+    def run_players(self, count):
+        world = World()
+        players = []
+        for _ in range(count):
+            player = Player()
+            world.add_player(player)
+            players.append(player)
+        result = partition.partition(self.plan, world, players)
+        simulation = Simulation(world)
+        partition.synchronise(simulation, result)
+        return (world, result, simulation.run())
+
+    def test_task_graph(self):
+        (entries, errors) = plan.load(plan.parse(INSIDE))
+        (links, owners) = partition.link_tasks(entries)
+        self.assertEqual(
+            [(p.name, q.name) for (p, q) in links],
+            [("D", "A"), ("A", "B"), ("B", "C"), ("A", "C"), ("D", "B")]
+        )
+        self.assertEqual(owners, {11: [0], 10: [1, 2, 3], 12: [4]})
+        graph = partition.task_graph(entries, links, owners)
+        self.assertEqual(graph[3], set([0, 1, 2]))
+        self.assertEqual(graph[4], set([0, 1, 2, 3]))
+        self.assertEqual(graph[0], set())
+
+    def test_players_share_the_plan(self):
+        (alone, single, makespan) = self.run_players(1)
+        (world, shared, parallel) = self.run_players(3)
+        self.assertEqual(len(world.fields), len(alone.fields))
+        self.assertEqual(len(world.links), len(alone.links))
+        self.assertLess(parallel, makespan)
+        self.assertAlmostEqual(parallel, shared.makespan, delta=1.0)
+        self.assertAlmostEqual(makespan, single.makespan, delta=1.0)
+        self.assertEqual(single.syncs, [])
+        self.assertTrue(all(len(p.commands) for p in shared.players))
+
+    def test_syncs_wait_on_other_players(self):
+        (world, result, makespan) = self.run_players(4)
+        self.assertTrue(result.syncs)
+        for sync in result.syncs:
+            self.assertIsInstance(sync.command, LinkCommand)
+            self.assertIn(sync.command, sync.player.commands)
+            for command in sync.waits_for:
+                self.assertNotIn(command, sync.player.commands)
+
+    def test_needs_players(self):
+        with self.assertRaises(ValueError):
+            partition.partition(self.plan, World(), [])
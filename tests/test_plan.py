@@ -0,0 +1,134 @@
+# test_plan.py
+import os
+from StringIO import StringIO
+from unittest import TestCase
+import plan
+from worldsim import World, Player
+
+PLAN_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'wm_linkathon.cmd'
+)
+
+
+class TestPlan(TestCase):
+    def test_parse_entries(self):
+        entries = list(plan.parse([
+            'My Plan\n',
+            'ID "Torch" AS 7\n',
+            'LINK 2 TO 12      AS 101 # Kicker for 20-28\n',
+            'FIELD 1 3 "Torch" AS 20\n',
+            'SEQ 28, 20, 101\n',
+            'LOCATE 10 AT 51261324\t-1083513\n',
+        ]))
+        self.assertEqual(entries, [
+            plan.Title(1, 'My Plan'),
+            plan.IdEntry(2, 'Torch', 7),
+            plan.LinkRequest(3, '2', '12', 101, 'Kicker for 20-28'),
+            plan.FieldRequest(4, ('1', '3', 'Torch'), 20, None),
+            plan.Sequence(5, (28, 20, 101)),
+            plan.Locate(6, '10', (51.261324, -1.083513)),
+        ])
+
+    def test_write_round_trip(self):
+        entries = [
+            plan.Title(1, 'My Plan'),
+            plan.IdEntry(2, 'The "Golden" Tree \\ Engraving', 7),
+            plan.Locate(3, 'The "Golden" Tree \\ Engraving', (45, -1)),
+            plan.Locate(4, '7', (51.261324, -1.083513)),
+            plan.LinkRequest(
+                5, '7', 'Say "Hi" # here', 101, 'Kicker for 20-28'
+            ),
+        ]
+        stream = StringIO()
+        plan.write(entries, stream)
+        self.assertEqual(
+            list(plan.parse(stream.getvalue().splitlines(True))),
+            [
+                entries[0], entries[1],
+                plan.Locate(3, entries[2].portal, (45.0, -1.0)),
+                entries[3], entries[4],
+            ]
+        )
+
+    def test_errors_do_not_abort(self):
+        entries = list(plan.parse([
+            'ID "Torch" AS 7\n',
+            'FIELD 1 2\n',
+            'SEQ 1, x\n',
+            'ID "Unterminated AS 8\n',
+            'LINK 7 7\n',
+        ]))
+        self.assertEqual(
+            [(e.line, type(e).__name__) for e in entries],
+            [
+                (1, 'IdEntry'),
+                (2, 'ParseError'),
+                (3, 'ParseError'),
+                (4, 'ParseError'),
+                (5, 'LinkRequest'),
+            ]
+        )
+        (linkathon, errors) = plan.load(entries)
+        self.assertEqual([error.line for error in errors], [2, 3, 4])
+        self.assertEqual(len(linkathon.links), 1)
+
+    def test_unknown_portal_reported_with_line(self):
+        (linkathon, errors) = plan.load(plan.parse([
+            'ID "Torch" AS 7\n',
+            'LINK 7 "Nowhere"\n',
+        ]))
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].line, 2)
+        self.assertIn("Nowhere", errors[0].message)
+
+    def test_load_plan_file(self):
+        (linkathon, errors) = plan.load(plan.parse_file(PLAN_FILE))
+        self.assertEqual(errors, [])
+        self.assertEqual(len(linkathon.portals), 17)
+        self.assertEqual(
+            linkathon.ids[10].location,
+            (51.261324, -1.083513)
+        )
+        self.assertEqual(
+            linkathon.ids[1].guid,
+            "47db8ce5d774463f9a8e7aef948e8093.16"
+        )
+        self.assertEqual(
+            [p.id for p in linkathon.field['field_23'].portals],
+            [1, 3, 17]
+        )
+        self.assertEqual(
+            [p.id for p in linkathon.link['link_101'].portals],
+            [2, 12]
+        )
+        self.assertEqual(linkathon.sequences[0][:3], (28, 20, 101))
+
+    def test_compile_plan(self):
+        (linkathon, errors) = plan.load(plan.parse_file(PLAN_FILE))
+        world = World()
+        player = Player()
+        world.add_player(player)
+        portals = plan.compile_plan(linkathon, world, player, [20])
+        self.assertEqual(
+            [type(c).__name__ for c in player.commands],
+            [
+                'MoveCommand', 'LinkCommand',
+                'MoveCommand', 'LinkCommand',
+                'MoveCommand', 'LinkCommand',
+            ]
+        )
+        for command in player.commands:
+            command()
+        (p1, p2, p3) = [portals[linkathon.ids[id]] for id in (1, 2, 3)]
+        self.assertTrue(world.field_exists(p1, p2, p3))
+
+    def test_compile_plan_reuses_world_portals(self):
+        (linkathon, errors) = plan.load(plan.parse_file(PLAN_FILE))
+        world = World()
+        player = Player()
+        world.add_player(player)
+        first = plan.compile_plan(linkathon, world, player, [20])
+        count = len(world.portal)
+        second = plan.compile_plan(linkathon, world, player, [20])
+        self.assertEqual(len(world.portal), count)
+        self.assertEqual(first, second)
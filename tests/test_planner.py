@@ -0,0 +1,81 @@
+# test_planner.py
+import random
+from StringIO import StringIO
+from unittest import TestCase
+import plan
+import planner
+from linkathon import point_in_triangle
+from worldsim import World, Player
+
+
+def crosses(a, b, c, d):
+    if len(set([a, b, c, d])) < 4:
+        return False
+    o = planner.orientation
+    return (
+        o(a, b, c) * o(a, b, d) < 0 and
+        o(c, d, a) * o(c, d, b) < 0
+    )
+
+
+class TestPlanner(TestCase):
+    def setUp(self):
+        rand = random.Random(7)
+        self.world = World()
+        self.portals = [
+            self.world.add_portal(
+                name="P{}".format(ix),
+                location=(
+                    51.26 + rand.random() * 0.01,
+                    -1.08 + rand.random() * 0.01
+                )
+            )
+            for ix in range(60)
+        ]
+
+    def test_fan_is_a_triangulation(self):
+        fan = planner.fan_plan(self.portals)
+        hull = len(planner.convex_hull(self.portals))
+        n = len(self.portals)
+        self.assertEqual(len(fan.links), 3 * n - 3 - hull)
+        self.assertEqual(len(fan.fields), 2 * n - 2 - hull)
+
+    def test_links_are_valid_when_thrown(self):
+        fan = planner.fan_plan(self.portals, objective='area')
+        thrown = []
+        fields = []
+        for (portal_from, portal_to, field) in fan.links:
+            (a, b) = (portal_from.location, portal_to.location)
+            for (c, d) in thrown:
+                self.assertFalse(crosses(a, b, c, d))
+            for corners in fields:
+                if portal_from not in corners:
+                    self.assertFalse(point_in_triangle(
+                        a, *[p.location for p in corners]
+                    ))
+            thrown.append((a, b))
+            if field:
+                fields.append(field)
+
+    def test_area_objective_tries_hull_anchors(self):
+        by_fields = planner.fan_plan(self.portals)
+        by_area = planner.fan_plan(self.portals, objective='area')
+        self.assertGreaterEqual(by_area.field_area, by_fields.field_area)
+        self.assertEqual(len(by_area.fields), len(by_fields.fields))
+
+    def test_plan_replays_in_world(self):
+        fan = planner.fan_plan(self.portals)
+        stream = StringIO()
+        plan.write(planner.plan_entries(fan, title="Generated"), stream)
+        stream.seek(0)
+        (linkathon, errors) = plan.load(plan.parse(stream))
+        self.assertEqual(errors, [])
+        self.assertEqual(len(linkathon.fields), len(fan.fields))
+        world = World()
+        player = Player()
+        world.add_player(player)
+        plan.compile_plan(linkathon, world, player)
+        for command in player.commands:
+            command()
+        self.assertEqual(len(world.links), len(fan.links))
+        self.assertEqual(len(world.fields), len(fan.fields))
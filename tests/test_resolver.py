@@ -0,0 +1,83 @@
+# test_resolver.py
+import random
+from unittest import TestCase
+from resolver import NameIndex, normalise, parse_location
+
+
+class TestResolver(TestCase):
+    def test_normalise(self):
+        self.assertEqual(
+            normalise("Ivy & George  White Plaque"),
+            u"ivy george white plaque"
+        )
+        self.assertEqual(normalise(u"Caf\xe9 Ros\xe9"), u"cafe rose")
+        self.assertEqual(normalise("Caf\xc3\xa9"), u"cafe")
+
+    def test_parse_location(self):
+        self.assertEqual(parse_location("51.26, -1.08"), (51.26, -1.08))
+        self.assertEqual(
+            parse_location("51258472 -1076191"),
+            (51.258472, -1.076191)
+        )
+        self.assertIsNone(parse_location("Torch"))
+        self.assertIsNone(parse_location("War Memorial"))
+
+    def test_name_index(self):
+        index = NameIndex()
+        index.add("War Memorial Park", 1)
+        index.add("War Memorial Playground", 2)
+        index.add("Memorial Park Aviary", 3)
+        index.add(None, 4)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.exact("war  memorial park"), [1])
+        self.assertEqual(index.prefixed("war memorial p"), [1, 2])
+        self.assertEqual(sorted(index.prefixed("memorial park")), [1, 3])
+        self.assertEqual(index.prefixed("avi"), [3])
+        self.assertEqual(index.prefixed("zebra"), [])
+        index.remove("War Memorial Park", 1)
+        self.assertEqual(index.exact("War Memorial Park"), [])
+        self.assertEqual(index.prefixed("memorial park"), [3])
+
+    def test_name_index_edits_match_rebuild(self):
+        rand = random.Random(5)
+        words = ["war", "memorial", "park", "church", "old", "mill"]
+        names = {}
+        index = NameIndex()
+        for item in range(3000):
+            names[item] = ' '.join(rand.sample(words, 3))
+            index.add(names[item], item)
+        for _ in range(300):
+            item = rand.randrange(3000)
+            index.remove(names[item], item)
+            names[item] = ' '.join(rand.sample(words, 2))
+            index.add(names[item], item)
+            index.remove("no such name", item)
+        rebuilt = NameIndex()
+        for (item, name) in names.iteritems():
+            rebuilt.add(name, item)
+        self.assertEqual(len(index), 3000)
+        for text in ["war", "memorial p", "old mill", "mill war", "x"]:
+            self.assertEqual(
+                sorted(index.prefixed(text)), sorted(rebuilt.prefixed(text))
+            )
+            self.assertEqual(
+                sorted(index.exact(text)), sorted(rebuilt.exact(text))
+            )
+
+    def test_name_index_items_sharing_a_hash(self):
+        class Item(object):
+            def __init__(self, name):
+                self.name = name
+
+            def __hash__(self):
+                return 7
+
+        items = [Item("Torch"), Item("Torch Hill"), Item("Hill")]
+        index = NameIndex()
+        for item in items:
+            index.add(item.name, item)
+        self.assertEqual(index.prefixed("torch"), items[:2])
+        self.assertEqual(index.exact("hill"), items[2:])
+        index.remove("Torch", items[0])
+        self.assertEqual(index.prefixed("torch"), items[1:2])
+        self.assertEqual(len(index), 2)
@@ -0,0 +1,91 @@
+# test_route.py
+import random
+from unittest import TestCase
+import plan
+import route
+import synth
+from test_plan import PLAN_FILE
+from worldsim import World, Player, LinkCommand, MoveCommand
+
+
+class TestRoute(TestCase):
+    def test_line_is_walked_in_order(self):
+        locations = [(51.26, -1.08 + 0.001 * ix) for ix in (3, 1, 4, 0, 2)]
+        result = route.optimise(locations, start=(51.26, -1.081))
+        self.assertEqual(
+            [locations[ix] for ix in result.order],
+            sorted(locations)
+        )
+        self.assertGreater(result.saved, 0)
+        self.assertAlmostEqual(
+            result.distance, result.original - result.saved, places=3
+        )
+
+    def test_constraints_are_kept(self):
+        locations = [r[2] for r in synth.city(500, seed=3)]
+        rng = random.Random(3)
+        before = [
+            tuple(sorted(rng.sample(xrange(500), 2))) for _ in xrange(100)
+        ]
+        result = route.optimise(locations, before)
+        self.assertEqual(sorted(result.order), range(500))
+        self.assertEqual(result.order[0], 0)
+        self.assertTrue(route.Constraints(500, before).met(result.order))
+        self.assertLess(result.distance, result.original / 2)
+
+    def test_cycle(self):
+        with self.assertRaises(ValueError):
+            route.optimise(
+                [(0.0, 0.0), (0.0, 0.001), (0.0, 0.002)],
+                [(1, 2), (2, 1)]
+            )
+
+    def run_plan(self, reorder):
+        (linkathon, errors) = plan.load(plan.parse_file(PLAN_FILE))
+        world = World()
+        player = Player()
+        world.add_player(player)
+        player.location = (51.2590, -1.0800)
+        plan.compile_plan(linkathon, world, player)
+        result = None
+        if reorder:
+            (commands, result) = route.reorder(
+                player.commands, player.location
+            )
+            player.commands[:] = commands
+        covered = []
+        for command in player.commands:
+            if isinstance(command, LinkCommand) and \
+                    world.fields_over(command.portal1):
+                covered.append(command)
+            command()
+        fields = set(
+            frozenset(p.name for p in field.portals) for field in world.fields
+        )
+        return (fields, covered, result)
+
+    def test_reordered_plan_makes_the_same_fields(self):
+        (fields, covered, _) = self.run_plan(False)
+        self.assertEqual(covered, [])
+        (reordered, covered, result) = self.run_plan(True)
+        self.assertEqual(reordered, fields)
+        self.assertEqual(covered, [])
+        self.assertGreaterEqual(result.saved, 0)
+
+    def test_split_visits(self):
+        (a, b) = (World().add_portal(), World().add_portal())
+        commands = [
+            LinkCommand(portal1=a, portal2=b),
+            MoveCommand((0.0, 0.0)),
+            LinkCommand(portal1=a, portal2=b),
+            MoveCommand((0.0, 1.0)),
+        ]
+        (leading, visits) = route.split_visits(commands)
+        self.assertEqual(leading, commands[:1])
+        self.assertEqual(
+            visits,
+            [
+                route.Visit((0.0, 0.0), commands[1:3]),
+                route.Visit((0.0, 1.0), commands[3:]),
+            ]
+        )
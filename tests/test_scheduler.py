@@ -0,0 +1,78 @@
+# test_scheduler.py
+from unittest import TestCase
+from scheduler import Simulation
+from spatial import distance
+from worldsim import World, Player, LinkCommand, MoveCommand
+
+
+class TestScheduler(TestCase):
+    def setUp(self):
+        self.world = World()
+        (self.a, self.b, self.c) = [
+            self.world.add_portal(name=name, location=location)
+            for (name, location) in [
+                ("A", (0.0, 0.0)),
+                ("B", (0.001, 0.0)),
+                ("C", (0.0, 0.001)),
+            ]
+        ]
+        self.metres = distance(self.a.location, self.b.location)
+
+    def add_player(self, location, commands):
+        player = Player()
+        self.world.add_player(player)
+        player.location = location
+        for command in commands:
+            player.add_command(command)
+        return player
+
+    def test_travel_time(self):
+        self.add_player(self.a.location, [
+            LinkCommand(portal1=self.a, portal2=self.b),
+            MoveCommand(self.b.location),
+            LinkCommand(portal1=self.b, portal2=self.c),
+        ])
+        simulation = Simulation(self.world, speed=2.0, link_time=5.0)
+        self.assertAlmostEqual(simulation.run(), 10.0 + self.metres / 2.0)
+        self.assertTrue(self.world.link_exists(self.b, self.c))
+
+    def test_players_run_concurrently(self):
+        self.add_player(self.a.location, [
+            LinkCommand(portal1=self.a, portal2=self.b),
+        ])
+        self.add_player(self.b.location, [
+            LinkCommand(portal1=self.b, portal2=self.c),
+        ])
+        simulation = Simulation(self.world, link_time=5.0)
+        self.assertEqual(simulation.run(), 5.0)
+        self.assertEqual(len(self.world.links), 2)
+
+    def test_cross_player_dependency(self):
+        """
+            The field closing link waits for the other player's links,
+            so the field is formed even though that player starts late.
+        """
+        last = LinkCommand(portal1=self.b, portal2=self.c)
+        self.add_player(self.b.location, [last])
+        first = LinkCommand(portal1=self.a, portal2=self.b)
+        second = LinkCommand(portal1=self.a, portal2=self.c)
+        self.add_player(self.b.location, [
+            MoveCommand(self.a.location), first, second
+        ])
+        simulation = Simulation(self.world, speed=1.0, link_time=5.0)
+        simulation.require(last, first, second)
+        makespan = simulation.run()
+        self.assertAlmostEqual(makespan, self.metres + 15.0)
+        self.assertTrue(self.world.field_exists(self.a, self.b, self.c))
+        self.assertEqual(
+            [command for (_, _, _, command) in simulation.log][-1],
+            last
+        )
+
+    def test_unmet_dependency(self):
+        orphan = LinkCommand(portal1=self.c, portal2=self.a)
+        command = LinkCommand(portal1=self.a, portal2=self.b)
+        self.add_player(self.a.location, [command])
+        simulation = Simulation(self.world)
+        simulation.require(command, orphan)
+        self.assertRaises(ValueError, simulation.run)
@@ -0,0 +1,124 @@
+# test_snapshot.py
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+import test_compact
+import snapshot
+from compact import CompactWorld
+from worldsim import World
+
+
+class SnapshotCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'world.snap')
+        super(SnapshotCase, self).setUp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestMappedWorld(SnapshotCase, test_compact.TestCompactWorld):
+    """ A world loaded from an empty snapshot behaves like any other """
+    def setUp(self):
+        super(TestMappedWorld, self).setUp()
+        snapshot.save(World(), self.path)
+        self.world = snapshot.load(self.path)
+
+
+class TestSnapshot(SnapshotCase):
+    def build(self, world):
+        self.locations = [
+            (51.258472, -1.076191),
+            (51.258623, -1.081081),
+            (51.260184, -1.088666),
+            (51.260287, -1.083540),
+            (51.259231, -1.084654),
+        ]
+        portals = [
+            world.add_portal(
+                name="Portal {}".format(ix),
+                guid="{:032x}.16".format(ix),
+                location=location
+            )
+            for (ix, location) in enumerate(self.locations)
+        ]
+        portals.append(world.add_portal(name=u"Caf\xe9"))
+        world.create_link(portals[0], portals[1])
+        world.create_link(portals[1], portals[2])
+        world.create_link(portals[0], portals[2])
+        snapshot.save(world, self.path)
+        return snapshot.load(self.path)
+
+    def check(self, loaded):
+        portals = list(loaded.portal)
+        self.assertEqual(len(portals), 6)
+        self.assertEqual(
+            [p.location for p in portals[:5]],
+            self.locations
+        )
+        self.assertIsNone(portals[5].location)
+        self.assertEqual(portals[2].name, "Portal 2")
+        self.assertEqual(portals[5].name, u"Caf\xe9")
+        self.assertEqual(portals[3].guid, "{:032x}.16".format(3))
+        self.assertIsNone(portals[5].guid)
+        self.assertEqual(len(loaded.links), 3)
+        self.assertTrue(loaded.link_exists(portals[1], portals[0]))
+        self.assertTrue(portals[0].is_linked_to(portals[1]))
+        self.assertFalse(loaded.link_exists(portals[3], portals[4]))
+        self.assertTrue(
+            loaded.field_exists(portals[2], portals[0], portals[1])
+        )
+        self.assertEqual(len(loaded.fields_on(portals[0])), 1)
+        self.assertEqual(
+            loaded.portals_within(self.locations[3], 1),
+            [portals[3]]
+        )
+        self.assertEqual(
+            loaded.crossing_link(portals[2], portals[3]),
+            None
+        )
+        self.assertIsNotNone(loaded.crossing_link(portals[1], portals[3]))
+        self.assertEqual(
+            loaded.projection.origin,
+            self.locations[0]
+        )
+
+    def test_round_trip_world(self):
+        self.check(self.build(World()))
+
+    def test_round_trip_compact_world(self):
+        self.check(self.build(CompactWorld()))
+
+    def test_columns_are_mapped(self):
+        loaded = self.build(World())
+        self.assertFalse(loaded._lat.flags.writeable)
+        self.assertNotIn('_index', vars(loaded))
+        loaded.portals_within(self.locations[0], 1)
+        self.assertIn('_index', vars(loaded))
+
+    def test_changes_after_load(self):
+        loaded = self.build(World())
+        portals = list(loaded.portal)
+        loaded.create_link(portals[3], portals[2])
+        loaded.create_link(portals[0], portals[3])
+        self.assertTrue(loaded.link_exists(portals[2], portals[3]))
+        self.assertEqual(len(loaded.fields), 2)
+        portals[4].name = "Renamed"
+        self.assertEqual(portals[4].name, "Renamed")
+        self.assertEqual(portals[3].name, "Portal 3")
+        portals[4].location = (10.0, 10.0)
+        self.assertEqual(loaded.portals_within((10.0, 10.0), 1), [portals[4]])
+        new = loaded.add_portal(name="New", location=(51.259, -1.08))
+        self.assertEqual(loaded.portal[-1], new)
+        self.assertEqual(
+            snapshot.load(self.path).portal[4].location,
+            self.locations[4]
+        )
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as stream:
+            stream.write('\0' * snapshot.HEADER.size)
+        with self.assertRaises(ValueError):
+            snapshot.load(self.path)
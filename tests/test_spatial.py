@@ -0,0 +1,249 @@
+# test_spatial.py
+import random
+from unittest import TestCase
+import planner
+from linkathon import point_in_triangle
+import spatial
+from spatial import (
+    FieldTree, GridIndex, LocalProjection, SegmentIndex, distance,
+    find_crossings, segments_cross
+)
+from worldsim import World
+
+
+class Item(object):
+    def __init__(self, location):
+        self.location = location
+
+
+class TestGridIndex(TestCase):
+    def setUp(self):
+        self.index = GridIndex(cell_size=1)
+        self.items = [
+            Item((x * 0.5, y * 0.5)) for x in range(-10, 10)
+            for y in range(-10, 10)
+        ]
+        for item in self.items:
+            self.index.insert(item)
+
+    def test_bbox_matches_linear_scan(self):
+        found = set(self.index.bbox(-1.2, 0.3, 2.0, 3.1))
+        expected = set(
+            item for item in self.items
+            if -1.2 <= item.location[0] <= 2.0 and
+            0.3 <= item.location[1] <= 3.1
+        )
+        self.assertEqual(found, expected)
+
+    def test_radius_matches_linear_scan(self):
+        metres = 120000
+        found = set(self.index.radius((0.1, 0.1), metres))
+        expected = set(
+            item for item in self.items
+            if distance((0.1, 0.1), item.location) <= metres
+        )
+        self.assertTrue(expected)
+        self.assertEqual(found, expected)
+
+    def test_triangle(self):
+        triangle = ((-0.2, -0.2), (-0.2, 1.3), (1.3, -0.2))
+        found = set(
+            item.location for item in self.index.triangle(*triangle)
+        )
+        self.assertEqual(
+            found,
+            set([(0, 0), (0, 0.5), (0, 1.0), (0.5, 0), (1.0, 0), (0.5, 0.5)])
+        )
+
+    def test_remove(self):
+        item = self.items[0]
+        self.index.remove(item)
+        self.assertEqual(len(self.index), len(self.items) - 1)
+        self.assertNotIn(item, set(self.index.bbox(-10, -10, 10, 10)))
+
+
+class TestLocalProjection(TestCase):
+    def test_project_matches_great_circle(self):
+        origin = (51.258472, -1.076191)
+        projection = LocalProjection(origin)
+        self.assertEqual(projection.project(origin), (0, 0))
+        for location in [(51.262180, -1.082827), (51.25, -1.06)]:
+            (east, north) = projection.project(location)
+            self.assertAlmostEqual(
+                (east ** 2 + north ** 2) ** 0.5,
+                distance(origin, location),
+                delta=distance(origin, location) * 1e-3
+            )
+
+
+class TestSegments(TestCase):
+    def setUp(self):
+        rand = random.Random(11)
+        self.segments = [
+            (
+                (rand.uniform(0, 5), rand.uniform(0, 5)),
+                (rand.uniform(0, 5), rand.uniform(0, 5))
+            )
+            for _ in range(80)
+        ]
+
+    def brute_force(self):
+        return [
+            (i, j)
+            for i in range(len(self.segments))
+            for j in range(i + 1, len(self.segments))
+            if segments_cross(*(self.segments[i] + self.segments[j]))
+        ]
+
+    def test_segments_cross(self):
+        self.assertTrue(segments_cross((0, 0), (2, 2), (0, 2), (2, 0)))
+        self.assertFalse(segments_cross((0, 0), (1, 1), (0, 2), (2, 0)))
+        self.assertFalse(segments_cross((0, 0), (2, 2), (2, 2), (2, 0)))
+
+    def test_index_matches_brute_force(self):
+        index = SegmentIndex(cell_size=0.7)
+        for segment in self.segments[1:]:
+            index.insert(segment)
+        self.assertEqual(
+            set(index.crossing(*self.segments[0])),
+            set(
+                segment for segment in self.segments[1:]
+                if segments_cross(*(self.segments[0] + segment))
+            )
+        )
+
+    def test_find_crossings(self):
+        self.assertEqual(
+            find_crossings(self.segments, cell_size=0.3),
+            self.brute_force()
+        )
+
+    def test_remove(self):
+        index = SegmentIndex(cell_size=0.7)
+        for segment in self.segments:
+            index.insert(segment)
+        for segment in self.segments[1::2]:
+            index.remove(segment)
+        index.insert(self.segments[1])
+        self.assertEqual(len(index), 41)
+        kept = self.segments[2::2] + [self.segments[1]]
+        self.assertEqual(
+            set(index.crossing(*self.segments[0])),
+            set(
+                segment for segment in kept
+                if segments_cross(*(self.segments[0] + segment))
+            )
+        )
+
+    def test_fan_plan(self):
+        # Long links through one hub, every cell of the grid shared.
+        rand = random.Random(12)
+        world = World()
+        portals = [
+            world.add_portal(location=(
+                51.25 + rand.uniform(0, 0.05), -1.1 + rand.uniform(0, 0.08)
+            ))
+            for _ in range(1500)
+        ]
+        segments = [
+            (one.location, two.location)
+            for (one, two, _) in planner.fan_plan(portals).links
+        ]
+        self.assertGreater(len(segments), 4000)
+        self.assertEqual(find_crossings(segments), [])
+        crossing = ((51.25, -1.1), (51.3, -1.02))
+        found = find_crossings(segments + [crossing])
+        self.assertTrue(found)
+        self.assertEqual(
+            found,
+            [
+                (ix, len(segments)) for (ix, segment) in enumerate(segments)
+                if segments_cross(*(segment + crossing))
+            ]
+        )
+
+
+class TestFieldTree(TestCase):
+    def setUp(self):
+        # Layers of fields on a shared base, as in a layered plan.
+        self.base = ((0.0, 0.0), (0.0, 8.0))
+        self.layers = [
+            self.base + ((float(n), 4.0),) for n in range(8, 0, -1)
+        ]
+        self.apart = ((-1.0, 0.0), (-1.0, 8.0), (-5.0, 4.0))
+        self.tree = FieldTree()
+        for triangle in [self.apart] + self.layers[::-1]:
+            self.tree.insert(triangle)
+
+    def test_nesting(self):
+        self.assertEqual(len(self.tree), 9)
+        self.assertEqual(
+            [self.tree.depth(t) for t in self.layers], range(8)
+        )
+        self.assertEqual(self.tree.depth(self.apart), 0)
+
+    def test_covering(self):
+        self.assertEqual(self.tree.covering((0.5, 4.0)), self.layers)
+        self.assertEqual(self.tree.covering((4.5, 4.0)), self.layers[:4])
+        self.assertEqual(self.tree.covering((-2.0, 4.0)), [self.apart])
+        self.assertEqual(self.tree.covering((9.0, 4.0)), [])
+        self.assertEqual(self.tree.covering(None), [])
+
+    def test_remove(self):
+        self.tree.remove(self.layers[3])
+        self.assertEqual(self.tree.depth(self.layers[4]), 3)
+        self.assertEqual(
+            self.tree.covering((0.5, 4.0)),
+            self.layers[:3] + self.layers[4:]
+        )
+        self.tree.remove(self.layers[3])
+        self.assertNotIn(self.layers[3], self.tree)
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(5)
+        for _ in range(200):
+            point = (rng.uniform(-6, 9), rng.uniform(-1, 9))
+            self.assertEqual(
+                self.tree.covering(point),
+                [t for t in [self.apart] + self.layers
+                 if point_in_triangle(point, *t)]
+            )
+
+    def test_many_disjoint_fields(self):
+        # A grid of small fields side by side, under one large field.
+        tree = FieldTree()
+        triangles = []
+        for x in range(60):
+            for y in range(60):
+                (lat, lng) = (51.0 + 0.001 * x, -1.0 + 0.001 * y)
+                triangles.append(
+                    ((lat, lng), (lat, lng + 0.0009), (lat + 0.0009, lng))
+                )
+        outer = ((50.9, -1.1), (50.9, -0.8), (51.2, -1.1))
+        for triangle in triangles[:1800] + [outer] + triangles[1800:]:
+            tree.insert(triangle)
+        self.assertEqual(tree.depth(triangles[0]), 1)
+        tests = []
+        covers = spatial.FieldNode.covers
+
+        def counted(node, location):
+            tests.append(node)
+            return covers(node, location)
+
+        spatial.FieldNode.covers = counted
+        self.addCleanup(setattr, spatial.FieldNode, 'covers', covers)
+        rng = random.Random(6)
+        for _ in range(50):
+            point = (rng.uniform(51.0, 51.06), rng.uniform(-1.0, -0.94))
+            del tests[:]
+            self.assertEqual(
+                tree.covering(point),
+                [t for t in [outer] + triangles
+                 if point_in_triangle(point, *t)]
+            )
+            self.assertLess(len(tests), 10)
+        tree.remove(outer)
+        self.assertEqual(tree.depth(triangles[0]), 0)
+        self.assertEqual(
+            tree.covering((51.0001, -0.9999)), [triangles[0]]
+        )
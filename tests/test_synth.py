@@ -0,0 +1,61 @@
+# test_synth.py
+from unittest import TestCase
+import bench
+import synth
+from events import LINK_BLOCKED, RingBufferSink
+from spatial import find_crossings
+from worldsim import World
+
+
+class TestSynth(TestCase):
+    def test_generators_are_seeded(self):
+        for (name, generate) in synth.DISTRIBUTIONS.items():
+            records = generate(500, seed=3)
+            self.assertEqual(len(records), 500)
+            self.assertEqual(records, generate(500, seed=3))
+            self.assertNotEqual(records, generate(500, seed=4))
+            self.assertEqual(len(set(r[1] for r in records)), 500)
+
+    def test_random_link_plan_is_valid(self):
+        sink = RingBufferSink()
+        world = World(events=sink)
+        portals = synth.populate(world, synth.city(2000, seed=1))
+        links = synth.random_link_plan(portals, 500, seed=1)
+        self.assertEqual(len(links), 500)
+        self.assertEqual(
+            find_crossings([(a.location, b.location) for (a, b) in links]),
+            []
+        )
+        for (portal_from, portal_to) in links:
+            world.create_link(portal_from, portal_to)
+        self.assertEqual(sink.of_kind(LINK_BLOCKED), [])
+        self.assertEqual(len(world.links), 500)
+
+
+class TestBench(TestCase):
+    def test_run_size(self):
+        results = bench.run_size('clustered', 300, seed=0, queries=200)
+        self.assertEqual(
+            [r['case'] for r in results],
+            [
+                'add_portal', 'create_link', 'link_exists',
+                'field_exists', 'point_in_triangle', 'triangle_hits',
+            ]
+        )
+        for result in results:
+            self.assertGreater(result['ops_per_sec'], 0)
+            self.assertGreater(result['peak_rss_kb'], 0)
+
+    def test_compare(self):
+        def report(rate):
+            return {'results': [{
+                'distribution': 'uniform',
+                'size': 10,
+                'case': 'link_exists',
+                'ops_per_sec': rate,
+            }]}
+        self.assertEqual(bench.compare(report(100), report(90)), [])
+        self.assertEqual(
+            bench.compare(report(100), report(50)),
+            [('uniform', 10, 'link_exists', 100, 50)]
+        )
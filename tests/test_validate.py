@@ -0,0 +1,106 @@
+# test_validate.py
+from unittest import TestCase
+import plan
+import validate
+from test_plan import PLAN_FILE
+
+
+class TestValidate(TestCase):
+    def setUp(self):
+        (self.plan, errors) = plan.load(plan.parse_file(PLAN_FILE))
+
+    def test_kicker_prerequisites(self):
+        self.assertEqual(self.plan.prerequisites[101], (20, 28))
+        self.assertEqual(plan.prerequisites("Kicker for 26-54"), (26, 54))
+        self.assertEqual(plan.prerequisites("just a comment"), ())
+
+    def test_plan_file_is_valid(self):
+        validator = validate.Validator(self.plan)
+        self.assertTrue(validator.valid)
+        self.assertEqual(validate.validate(self.plan), [])
+
+    def test_unmet_prerequisite(self):
+        validator = validate.Validator(self.plan)
+        validator.remove(2)
+        validator.insert(0, 101)
+        self.assertEqual(validator.problems, [
+            validate.Problem(0, 101, "Needs 20 first"),
+            validate.Problem(0, 101, "Needs 28 first"),
+        ])
+        validator.remove(0)
+        validator.insert(2, 101)
+        self.assertTrue(validator.valid)
+
+    def test_duplicates(self):
+        validator = validate.Validator(self.plan)
+        validator.append(101)
+        validator.append(99)
+        self.assertEqual(validator.problems, [
+            validate.Problem(24, 101, "Already in the sequence"),
+            validate.Problem(24, 101, "Link already thrown"),
+            validate.Problem(25, 99, "Unknown field or link"),
+        ])
+
+    def test_link_from_inside_field(self):
+        (entries, errors) = plan.load(plan.parse([
+            'Inside\n',
+            'ID "A" AS 1\n',
+            'ID "B" AS 2\n',
+            'ID "C" AS 3\n',
+            'ID "D" AS 4\n',
+            'LOCATE 1 AT 0.0, 0.0\n',
+            'LOCATE 2 AT 0.0, 0.01\n',
+            'LOCATE 3 AT 0.01, 0.0\n',
+            'LOCATE 4 AT 0.002, 0.002\n',
+            'FIELD 1 2 3 AS 10\n',
+            'LINK 4 1 AS 11\n',
+            'LINK 1 4 AS 12\n',
+            'SEQ 10, 11, 12\n',
+        ]))
+        self.assertEqual(errors, [])
+        problems = validate.validate(entries)
+        self.assertEqual(len(problems), 2)
+        self.assertEqual(problems[0].id, 11)
+        self.assertIn("starts inside field A B C", problems[0].message)
+        self.assertEqual(
+            problems[1],
+            validate.Problem(2, 12, "Link already thrown")
+        )
+
+    def test_edits_only_recheck_the_suffix(self):
+        validator = validate.Validator(self.plan)
+        checked = []
+        step = validator._step
+        validator._step = lambda ix: (checked.append(ix), step(ix))
+        validator.replace(22, 111)
+        self.assertEqual(checked, [22, 23])
+        self.assertEqual(validator.problems, [
+            validate.Problem(23, 111, "Already in the sequence"),
+            validate.Problem(23, 111, "Link already thrown"),
+        ])
+        validator.require(27, 111)
+        self.assertEqual(checked, [22, 23, 21, 22, 23])
+        self.assertEqual(
+            validator.problems[0],
+            validate.Problem(21, 27, "Needs 111 first")
+        )
+
+    def test_topological_order(self):
+        order = validate.topological_order(
+            validate.dependency_graph(self.plan)
+        )
+        for (id, required) in self.plan.prerequisites.items():
+            for prerequisite in required:
+                self.assertLess(order.index(prerequisite), order.index(id))
+        with self.assertRaises(ValueError):
+            validate.topological_order({1: set([2]), 2: set([1])})
+
+    def test_cycle(self):
+        self.plan.prerequisites[20] = (101,)
+        problems = validate.validate(self.plan)
+        self.assertEqual(
+            problems[-1],
+            validate.Problem(
+                None, None, "Dependency cycle between [20, 101]"
+            )
+        )
@@ -1,5 +1,6 @@
 # test_worldsim.py
 from unittest import TestCase
+from spatial import distance
 from worldsim import World, Player, LinkCommand, MoveCommand
 
 
@@ -146,6 +147,52 @@ class TestWorldsim(TestCase):
         player.command[0]()
         self.assertTrue(self.world.link_exists(portals[0], portals[1]))
 
+    def test_player_location_tolerates_float_noise(self):
+        player = self.add_player_to_world()
+        portals = self.create_two_portals()
+        (lat, lng) = portals[0].location
+        player.location = (lat + 1e-9, lng - 1e-9)
+        self.assertTrue(player.is_at(portals[0]))
+        player.add_command(
+            LinkCommand(portal1=portals[0], portal2=portals[1])
+        )
+        player.command[0]()
+        self.assertTrue(self.world.link_exists(portals[0], portals[1]))
+
+    def test_resolve_portal_references(self):
+        portals = self.create_portals()
+        self.assertEqual(
+            self.world.resolve("47db8ce5d774463f9a8e7aef948e8093.16"),
+            portals[0]
+        )
+        self.assertEqual(
+            self.world.resolve("51.2584720001, -1.076191"),
+            portals[0]
+        )
+        self.assertEqual(self.world.resolve("51258472 -1076191"), portals[0])
+        self.assertEqual(self.world.resolve("TORCH"), portals[6])
+        self.assertEqual(self.world.resolve("ivy & george"), portals[16])
+        self.assertEqual(self.world.resolve("golden tree"), portals[11])
+        self.assertIsNone(self.world.resolve("Nowhere"))
+        self.assertIsNone(self.world.resolve("10.0, 10.0"))
+        with self.assertRaises(ValueError):
+            self.world.resolve("War Memorial")
+        self.assertEqual(
+            self.world.portals_named("war memorial playground"),
+            [portals[5]]
+        )
+        self.assertEqual(
+            set(self.world.find_portals("plaque")),
+            set([portals[4], portals[10], portals[15], portals[16]])
+        )
+
+    def test_rename_portal(self):
+        portals = self.create_portals()
+        self.world.rename_portal(portals[6], "Beacon")
+        self.assertEqual(portals[6].name, "Beacon")
+        self.assertEqual(self.world.resolve("beacon"), portals[6])
+        self.assertIsNone(self.world.resolve("torch"))
+
     def test_player_cannot_link_from_afar(self):
         """
             A player cannot execute a command to link a portal
@@ -281,3 +328,226 @@ class TestWorldsim(TestCase):
             portals[1],
             portals[3]
         ))
+
+    def test_portals_within_radius(self):
+        portals = self.create_portals()
+        found = self.world.portals_within(portals[0].location, 400)
+        self.assertIn(portals[0], found)
+        self.assertIn(portals[1], found)
+        self.assertNotIn(portals[2], found)
+
+    def test_portals_in_bbox(self):
+        portals = self.create_portals()
+        found = self.world.portals_in_bbox(51.2605, -1.0840, 51.2625, -1.0820)
+        self.assertEqual(
+            set(p.name for p in found),
+            set([
+                "Torch",
+                "Civic Centre War Memorial",
+                "War Memorial Park",
+                "Memorial Park Aviary",
+                "Shelter Dedication Plaque",
+                "Memorial Band Stand",
+            ])
+        )
+
+    def test_portals_in_field(self):
+        portals = self.create_portals()
+        (south, bounty, ivy) = (portals[0], portals[2], portals[16])
+        found = self.world.portals_in_field(south, bounty, ivy)
+        self.assertIn(portals[14], found)
+        self.assertNotIn(portals[15], found)
+        self.assertNotIn(south, found)
+
+    def test_relinking_does_not_duplicate(self):
+        """
+            Linking an already linked pair, in either direction,
+            registers no new link and forms no new field.
+        """
+        portals = self.create_portals()
+        self.world.create_link(portals[0], portals[1])
+        self.world.create_link(portals[1], portals[2])
+        self.world.create_link(portals[0], portals[2])
+        self.world.create_link(portals[2], portals[0])
+        self.assertEqual(len(self.world.links), 3)
+        self.assertEqual(len(self.world.fields), 1)
+        self.assertEqual(
+            self.world.neighbours(portals[0]),
+            set([portals[1], portals[2]])
+        )
+        link = self.world.get_link(portals[2], portals[0])
+        self.assertEqual(link.portal_from, portals[0])
+        self.assertEqual(link.portal_to, portals[2])
+
+    def test_field_lookup(self):
+        """
+            Fields can be retrieved by their portals in any order,
+            and listed per anchoring portal.
+        """
+        portals = self.create_portals()
+        field = self.world.create_field(portals[0], portals[1], portals[2])
+        other = self.world.create_field(portals[0], portals[2], portals[3])
+        self.assertIs(
+            self.world.create_field(portals[2], portals[0], portals[1]),
+            field
+        )
+        self.assertEqual(len(self.world.fields), 2)
+        self.assertIs(
+            self.world.get_field(portals[1], portals[2], portals[0]),
+            field
+        )
+        self.assertIsNone(
+            self.world.get_field(portals[1], portals[2], portals[3])
+        )
+        self.assertEqual(self.world.fields_on(portals[0]), [field, other])
+        self.assertEqual(self.world.fields_on(portals[1]), [field])
+        self.assertEqual(self.world.fields_on(portals[4]), [])
+
+    def test_crossing_link_is_blocked(self):
+        """
+            A link that would cross an existing link is not created.
+        """
+        portals = self.create_portals()
+        (south, bounty, hare, diana) = (
+            portals[0], portals[2], portals[3], portals[4]
+        )
+        self.world.create_link(south, bounty)
+        self.assertEqual(
+            self.world.crossing_link(hare, diana).portal_from,
+            south
+        )
+        self.world.create_link(hare, diana)
+        self.assertFalse(self.world.link_exists(hare, diana))
+        self.assertIsNone(self.world.crossing_link(south, hare))
+        self.assertEqual(
+            self.world.find_crossings([(south, bounty), (hare, diana)]),
+            [(0, 1)]
+        )
+
+    def test_move_portal_updates_indexes(self):
+        portals = self.create_portals()
+        (south, bounty, hare, diana) = (
+            portals[0], portals[2], portals[3], portals[4]
+        )
+        self.world.create_link(south, bounty)
+        self.world.move_portal(bounty, (51.2585, -1.0770))
+        self.assertIsNone(self.world.crossing_link(hare, diana))
+        self.assertEqual(
+            self.world.portals_within((51.2585, -1.0770), 1),
+            [bounty]
+        )
+        self.assertNotIn(
+            bounty,
+            self.world.portals_within((51.260184, -1.088666), 1)
+        )
+        self.assertEqual(self.world.get_portal(bounty.guid), bounty)
+
+    def test_assigning_location_moves_portal(self):
+        (south, oaten, bounty, hare, diana) = self.create_portals()[:5]
+        self.world.create_link(south, bounty)
+        self.world.create_field(south, oaten, bounty)
+        start = self.world.checkpoint()
+        bounty.location = (51.2585, -1.0770)
+        self.assertIsNone(self.world.crossing_link(hare, diana))
+        self.assertEqual(
+            self.world.fields_at(bounty.location),
+            self.world.fields_on(bounty)
+        )
+        self.world.rollback(start)
+        self.assertEqual(
+            self.world.crossing_link(hare, diana),
+            self.world.get_link(south, bounty)
+        )
+
+    def test_rollback_to_checkpoint(self):
+        portals = self.create_portals()
+        (south, oaten, bounty, hare, diana) = portals[:5]
+        self.world.create_link(south, oaten)
+        start = self.world.checkpoint()
+        self.world.create_link(oaten, bounty)
+        self.world.create_link(south, bounty)
+        middle = self.world.checkpoint()
+        self.world.move_portal(hare, (51.26, -1.07))
+        self.world.rename_portal(diana, "Renamed")
+        extra = self.world.add_portal(name="Extra", guid="extra.16",
+                                      location=(51.259, -1.08))
+        self.world.create_link(extra, south)
+        self.assertEqual(len(self.world.fields), 1)
+        self.world.rollback(middle)
+        self.assertEqual(len(self.world.portal), len(portals))
+        self.assertIsNone(self.world.get_portal("extra.16"))
+        self.assertEqual(hare.location, (51.260287, -1.083540))
+        self.assertEqual(
+            self.world.portals_within((51.260287, -1.083540), 1),
+            [hare]
+        )
+        self.assertEqual(diana.name, "Diana Stanley Memorial Plaque")
+        self.assertEqual(self.world.resolve("diana stanley"), diana)
+        self.assertEqual(len(self.world.links), 3)
+        self.world.rollback(start)
+        self.assertEqual(len(self.world.links), 1)
+        self.assertEqual(len(self.world.fields), 0)
+        self.assertFalse(self.world.link_exists(oaten, bounty))
+        self.assertFalse(self.world.field_exists(south, oaten, bounty))
+        self.assertEqual(self.world.fields_on(south), [])
+        self.assertFalse(oaten.is_linked(bounty))
+        self.assertTrue(south.is_linked_to(oaten))
+        self.assertIsNone(self.world.crossing_link(hare, diana))
+        self.world.create_link(south, bounty)
+        self.assertEqual(
+            self.world.crossing_link(hare, diana).portal_from,
+            south
+        )
+        self.world.commit()
+        with self.assertRaises(ValueError):
+            self.world.rollback(start)
+
+    def test_fields_covering_location(self):
+        (a, b, c, d) = [
+            self.world.add_portal(name=name, location=location)
+            for (name, location) in [
+                ("A", (51.25, -1.08)), ("B", (51.27, -1.08)),
+                ("C", (51.25, -1.06)), ("D", (51.255, -1.075)),
+            ]
+        ]
+        inner = self.world.create_field(a, b, d)
+        start = self.world.checkpoint()
+        outer = self.world.create_field(a, b, c)
+        point = (51.254, -1.078)
+        self.assertEqual(self.world.fields_at(point), [outer, inner])
+        self.assertEqual(self.world.layers(point), 2)
+        self.assertEqual(self.world.layers((51.26, -1.07)), 1)
+        self.assertEqual(self.world.layers((51.26, -1.09)), 0)
+        self.assertEqual(self.world.fields_over(d), [outer])
+        self.assertEqual(self.world.fields_over(a), [])
+        self.world.move_portal(d, (51.26, -1.09))
+        self.assertEqual(self.world.fields_at(point), [outer])
+        self.assertEqual(self.world.fields_at((51.26, -1.085)), [inner])
+        self.world.rollback(start)
+        self.assertEqual(self.world.fields_at(point), [inner])
+
+    def test_area_and_distance_in_metres(self):
+        """
+            Portals are projected once into local metres, so areas are
+            square metres and distances agree with the great circle.
+        """
+        portals = self.create_portals()
+        (south, oaten, bounty) = (portals[0], portals[1], portals[2])
+        self.assertAlmostEqual(
+            self.world.distance(south, oaten),
+            distance(south.location, oaten.location),
+            delta=0.5
+        )
+        a = self.world.distance(south, oaten)
+        b = self.world.distance(oaten, bounty)
+        c = self.world.distance(south, bounty)
+        s = (a + b + c) / 2
+        heron = (s * (s - a) * (s - b) * (s - c)) ** 0.5
+        self.assertAlmostEqual(
+            self.world.area_of_field(south, oaten, bounty),
+            heron,
+            delta=heron * 1e-6
+        )
+        field = self.world.create_field(south, bounty, portals[16])
+        self.assertTrue(self.world.portal_inside_field(portals[14], field))
+        self.assertFalse(self.world.portal_inside_field(portals[15], field))
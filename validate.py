@@ -0,0 +1,205 @@
+"""
+    Checks of a plan's SEQ order against the dependencies between its
+    fields and links.
+"""
+from collections import deque, namedtuple
+
+import linkathon
+
+
+Problem = namedtuple('Problem', 'position id message')
+
+
+def dependency_graph(plan):
+    """ Map of every field and link id to the set of ids it must follow """
+    graph = dict(
+        (id, set()) for (id, target) in plan.ids.iteritems()
+        if isinstance(target, (linkathon.Field, linkathon.Link))
+    )
+    for (id, required) in plan.prerequisites.iteritems():
+        graph.setdefault(id, set()).update(required)
+    return graph
+
+
+def topological_order(graph):
+    """
+        The ids of `graph` with every id after those it must follow;
+        ValueError when the dependencies form a cycle.
+    """
+    waiting = dict((id, len(required)) for (id, required) in graph.items())
+    dependents = {}
+    for (id, required) in graph.iteritems():
+        for prerequisite in required:
+            waiting.setdefault(prerequisite, 0)
+            dependents.setdefault(prerequisite, []).append(id)
+    ready = deque(
+        sorted(id for (id, count) in waiting.iteritems() if not count)
+    )
+    order = []
+    while ready:
+        id = ready.popleft()
+        order.append(id)
+        for dependent in dependents.get(id, ()):
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                ready.append(dependent)
+    if len(order) < len(waiting):
+        raise ValueError("Dependency cycle between {}".format(
+            sorted(id for (id, count) in waiting.iteritems() if count)
+        ))
+    return order
+
+
+def located(portal):
+    return portal.location is not None and None not in portal.location
+
+
+class Validator(object):
+    """
+        Walks a plan's sequences as one run of ids and reports, per
+        position, ids that are unknown or repeated, prerequisites not yet
+        met, links already thrown and links that start inside a field
+        built earlier in the run.
+
+        Edits replay the run only from the edited position: the state
+        after each position is kept as an undo record, so the prefix
+        before an edit is never checked again.
+    """
+    def __init__(self, plan, sequence=None):
+        self.plan = plan
+        self.sequence = []
+        self._problems = []
+        self._undo = []
+        self._thrown = set()
+        self._fields = []
+        self._done = {}
+        if sequence is None:
+            sequence = [id for ids in plan.sequences for id in ids]
+        self.extend(sequence)
+
+    @property
+    def problems(self):
+        return [problem for found in self._problems for problem in found]
+
+    @property
+    def valid(self):
+        return not any(self._problems)
+
+    def extend(self, ids):
+        start = len(self.sequence)
+        self.sequence.extend(ids)
+        self._replay(start)
+
+    def append(self, id):
+        self.extend([id])
+
+    def insert(self, position, id):
+        self._rewind(position)
+        self.sequence.insert(position, id)
+        self._replay(position)
+
+    def remove(self, position):
+        self._rewind(position)
+        del self.sequence[position]
+        self._replay(position)
+
+    def replace(self, position, id):
+        self._rewind(position)
+        self.sequence[position] = id
+        self._replay(position)
+
+    def require(self, id, *prerequisites):
+        """ Add prerequisites of `id` and recheck from its first use """
+        self.plan.prerequisites[id] = (
+            tuple(self.plan.prerequisites.get(id, ())) + prerequisites
+        )
+        if id in self._done:
+            position = self.sequence.index(id)
+            self._rewind(position)
+            self._replay(position)
+
+    def _rewind(self, position):
+        while len(self._undo) > position:
+            (id, thrown, field) = self._undo.pop()
+            self._problems.pop()
+            self._thrown.difference_update(thrown)
+            if field is not None:
+                self._fields.pop()
+            if id in self._done:
+                self._done[id] -= 1
+                if not self._done[id]:
+                    del self._done[id]
+
+    def _replay(self, position):
+        for ix in xrange(position, len(self.sequence)):
+            self._step(ix)
+
+    def _step(self, ix):
+        id = self.sequence[ix]
+        target = self.plan.ids.get(id)
+        problems = []
+        thrown = []
+        field = None
+        if isinstance(target, linkathon.Field):
+            (p1, p2, p3) = target.portals
+            pairs = [(p1, p2), (p2, p3), (p1, p3)]
+            field = target
+        elif isinstance(target, linkathon.Link):
+            pairs = [target.portals]
+        else:
+            problems.append(Problem(ix, id, "Unknown field or link"))
+            self._problems.append(problems)
+            self._undo.append((id, thrown, field))
+            return
+        if id in self._done:
+            problems.append(Problem(ix, id, "Already in the sequence"))
+        for prerequisite in self.plan.prerequisites.get(id, ()):
+            if prerequisite not in self._done:
+                problems.append(Problem(
+                    ix, id, "Needs {} first".format(prerequisite)
+                ))
+        for (portal_from, portal_to) in pairs:
+            key = frozenset((portal_from, portal_to))
+            if key in self._thrown or key in thrown:
+                if field is None:
+                    problems.append(Problem(ix, id, "Link already thrown"))
+                continue
+            covering = self._covering(portal_from)
+            if covering is not None:
+                problems.append(Problem(
+                    ix, id, "Link from {} starts inside field {}".format(
+                        portal_from.name,
+                        ' '.join(p.name for p in covering.portals)
+                    )
+                ))
+            thrown.append(key)
+        self._thrown.update(thrown)
+        if field is not None:
+            self._fields.append(field)
+        self._done[id] = self._done.get(id, 0) + 1
+        self._problems.append(problems)
+        self._undo.append((id, thrown, field))
+
+    def _covering(self, portal):
+        if not located(portal):
+            return None
+        for field in self._fields:
+            if portal in field.portals:
+                continue
+            if all(located(p) for p in field.portals) and \
+                    field.portal_inside_field(portal):
+                return field
+        return None
+
+
+def validate(plan):
+    """
+        Every `Problem` with the plan's sequences, in order, then one with
+        no position or id if its prerequisites form a cycle.
+    """
+    problems = Validator(plan).problems
+    try:
+        topological_order(dependency_graph(plan))
+    except ValueError as err:
+        problems.append(Problem(None, None, str(err)))
+    return problems
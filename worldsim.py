@@ -1,9 +1,35 @@
 import functools
 
+import exact
+import geometry
+from events import (
+    FIELD_CREATED, LINK_BLOCKED, LINK_CREATED, LINK_FAILED, MOVE, NullSink
+)
+from resolver import NameIndex, parse_location
+from spatial import (
+    FieldTree, GridIndex, LocalProjection, SegmentIndex, distance,
+    find_crossings, same_location
+)
+
+
+LOCATION_TOLERANCE = 1.0
+
 
 def area_of_triangle(point1, point2, point3):
+    if geometry.EXACT:
+        # Exact on the 1e-6 grid, scaled back to the units given.
+        points = [exact.to_e6(p) for p in (point1, point2, point3)]
+        return exact.doubled_area(*points) / (2.0 * exact.SCALE ** 2)
     (x1, y1, x2, y2, x3, y3) = (point1 + point2 + point3)
-    return abs((x1 - x2) * (y1 - y3) - (y1 - y2) * (x1 - x3))
+    return abs((x1 - x2) * (y1 - y3) - (y1 - y2) * (x1 - x3)) / 2.0
+
+
+def link_key(portal_one, portal_two):
+    return frozenset((portal_one, portal_two))
+
+
+def field_key(portal1, portal2, portal3):
+    return frozenset((portal1, portal2, portal3))
 
 
 class Command(object):
@@ -37,17 +63,27 @@ class LinkCommand(Command):
         self._portal1 = portal1
         self._portal2 = portal2
 
+    @property
+    def portal1(self):
+        return self._portal1
+
+    @property
+    def portal2(self):
+        return self._portal2
+
     def __call__(self):
         # print "Creating Link from {} to {}".format(
             # self._portal1.name,
             # self._portal2.name
         # )
-        if self.player.location == self._portal1.location:
+        if self.player.is_at(self._portal1):
             self._world.create_link(self._portal1, self._portal2)
         else:
-            print "Link failed - player not within range of {} ({})".format(
-                self._portal1.name,
-                self._portal1.location
+            self._world.events.emit(
+                LINK_FAILED,
+                self.player,
+                self._portal1,
+                self._portal2
             )
 
 
@@ -63,14 +99,20 @@ class MoveCommand(Command):
             self._player
         )
 
+    @property
+    def location(self):
+        return self._location
+
     def __call__(self):
         # print "Setting player location to {}".format(self._location)
         self.player.location = self._location
+        self._world.events.emit(MOVE, self.player, self._location)
 
 
 class Player(object):
-    def __init__(self, world=None, commands=None):
+    def __init__(self, world=None, commands=None, name=None):
         self._world = world
+        self.name = name
         self._command_list = commands or []
         self.location = None
 
@@ -91,16 +133,52 @@ class Player(object):
         world.create_link(portal_from, portal_to)
 
     def is_at(self, portal):
-        return self.location == portal.location
+        return same_location(self.location, portal.location)
 
 
 class Portal(object):
-    def __init__(self, name=None, guid=None, location=None):
+    __slots__ = (
+        'name', 'guid', '_location', '_projection', 'xy', '_e6', 'version',
+        'outbound_links', 'inbound_links', 'neighbours', '_world',
+    )
+
+    def __init__(self, name=None, guid=None, location=None, projection=None):
         self.name = name
         self.guid = guid
-        self.location = location
-        self.outbound_links = []
-        self.inbound_links = []
+        self._projection = projection
+        self._world = None
+        self.version = 0
+        self._place(location)
+        self.outbound_links = set()
+        self.inbound_links = set()
+        self.neighbours = set()
+
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, val):
+        # A portal in a world moves through it, so its indexes follow.
+        if self._world is None:
+            self._place(val)
+        else:
+            self._world.move_portal(self, val)
+
+    def _place(self, val):
+        self._location = val
+        self.version += 1
+        self._e6 = None
+        if val is None or self._projection is None:
+            self.xy = None
+        else:
+            self.xy = self._projection.project(val)
+
+    @property
+    def e6(self):
+        if self._e6 is None and self._location is not None:
+            self._e6 = exact.to_e6(self._location)
+        return self._e6
 
     def is_linked_to(self, portal):
         return portal in self.outbound_links
@@ -108,19 +186,36 @@ class Portal(object):
     def is_linked_from(self, portal):
         return portal in self.inbound_links
 
+    def is_linked(self, portal):
+        return portal in self.neighbours
+
     def add_link(self, portal):
-        if (not self.is_linked_to(portal) and not self.is_linked_from(portal)):
-            self.outbound_links.append(portal)
-            portal.inbound_links.append(self)
+        if not self.is_linked(portal):
+            self.outbound_links.add(portal)
+            self.neighbours.add(portal)
+            portal.inbound_links.add(self)
+            portal.neighbours.add(self)
 
 
 class Link(object):
+    __slots__ = ('_from', '_to')
+
     def __init__(self, portal_from=None, portal_to=None):
         self._from = portal_from
         self._to = portal_to
 
+    @property
+    def portal_from(self):
+        return self._from
+
+    @property
+    def portal_to(self):
+        return self._to
+
 
 class Field(object):
+    __slots__ = ('_portals',)
+
     def __init__(self, portals=[]):
         self._portals = portals
 
@@ -130,11 +225,34 @@ class Field(object):
 
 
 class World(object):
-    def __init__(self):
+    def __init__(self, events=None, origin=None, geometry_cache=None,
+                 field_score=None):
+        self.events = events or NullSink()
+        self.field_score = field_score
+        if geometry_cache is None:
+            geometry_cache = geometry.shared
+        self.geometry = geometry_cache
+        self.projection = origin and LocalProjection(origin)
         self._players = []
         self._portals = []
-        self._links = []
+        self._links = {}
+        self._portal_set = set()
+        self._guid_index = {}
+        self._name_index = NameIndex()
         self._fields = []
+        self._field_index = {}
+        self._portal_fields = {}
+        self._field_tree = FieldTree(
+            corners=lambda field: [p.location for p in field.portals]
+        )
+        self._journal = None
+        self._index = GridIndex()
+        self._segments = SegmentIndex(
+            endpoints=lambda link: (
+                link.portal_from.location,
+                link.portal_to.location
+            )
+        )
 
     @property
     def portal(self):
@@ -152,78 +270,383 @@ class World(object):
     def fields(self):
         return self._fields
 
+    @property
+    def links(self):
+        return self._links.values()
+
+    def get_link(self, portal_one, portal_two):
+        return self._links.get(link_key(portal_one, portal_two))
+
+    def neighbours(self, portal):
+        return portal.neighbours
+
+    def has_portal(self, portal):
+        return portal in self._portal_set
+
+    def _portal_key(self, portal):
+        return portal
+
+    def _portal_of(self, key):
+        return key
+
+    def _register(self, portal):
+        key = self._portal_key(portal)
+        if portal.guid is not None and self._built('_guid_index'):
+            self._guid_index.setdefault(portal.guid, key)
+        if self._built('_name_index'):
+            self._name_index.add(portal.name, key)
+
+    def _built(self, lookup):
+        # Compact worlds build their lookups on first use, from the
+        # portals they hold by then; until that they are left alone.
+        return lookup in self.__dict__
+
+    def _register_records(self, keys, records):
+        """ `_register` portals straight from their records """
+        if self._built('_guid_index'):
+            guids = self._guid_index
+            for (key, (_, guid, _)) in zip(keys, records):
+                if guid is not None:
+                    guids.setdefault(guid, key)
+        if self._built('_name_index'):
+            names = self._name_index
+            for (key, (name, _, _)) in zip(keys, records):
+                names.add(name, key)
+        if self._journal is not None:
+            self._journal.extend(
+                ('portal', self._portal_of(key)) for key in keys
+            )
+
+    def _unregister(self, portal):
+        key = self._portal_key(portal)
+        if self._built('_guid_index') and \
+                self._guid_index.get(portal.guid) == key:
+            del self._guid_index[portal.guid]
+        if self._built('_name_index'):
+            self._name_index.remove(portal.name, key)
+
+    def get_portal(self, guid):
+        key = self._guid_index.get(guid)
+        if key is None:
+            return None
+        return self._portal_of(key)
+
+    def portals_named(self, name):
+        """ Portals whose name matches `name` once normalised """
+        return [self._portal_of(key) for key in self._name_index.exact(name)]
+
+    def find_portals(self, text):
+        """ Portals with a run of words in their name starting `text` """
+        return [
+            self._portal_of(key) for key in self._name_index.prefixed(text)
+        ]
+
+    def portal_at(self, location, tolerance=LOCATION_TOLERANCE):
+        """ The nearest portal within `tolerance` metres, or None """
+        nearby = self.portals_within(location, tolerance)
+        if not nearby:
+            return None
+        return min(nearby, key=lambda p: distance(location, p.location))
+
+    def resolve(self, ref, tolerance=LOCATION_TOLERANCE):
+        """
+            The portal a plan reference names: a GUID, a `lat,lng` pair,
+            a name or an unambiguous prefix of one. None when nothing
+            matches; ValueError when several portals do.
+        """
+        portal = self.get_portal(ref)
+        if portal is not None:
+            return portal
+        location = parse_location(ref)
+        if location is not None:
+            return self.portal_at(location, tolerance)
+        for candidates in (self.portals_named, self.find_portals):
+            portals = candidates(ref)
+            if len(portals) > 1:
+                raise ValueError(
+                    "{} portals match {}".format(len(portals), ref)
+                )
+            if portals:
+                return portals[0]
+        return None
+
+    def rename_portal(self, portal, name):
+        self._record('rename', portal, portal.name)
+        key = self._portal_key(portal)
+        built = self._built('_name_index')
+        if built:
+            self._name_index.remove(portal.name, key)
+        portal.name = name
+        if built:
+            self._name_index.add(name, key)
+
     def add_portal(self, name=None, guid=None, location=None):
+        if self.projection is None and location is not None:
+            self.projection = LocalProjection(location)
         portal = Portal(
             name=name,
             guid=guid,
-            location=location
+            location=location,
+            projection=self.projection
         )
+        portal._world = self
         self._portals.append(portal)
+        self._portal_set.add(portal)
+        self._register(portal)
+        if location is not None:
+            self._index.insert(portal)
+        self._record('portal', portal)
         return portal
 
+    def add_portals(self, records):
+        """ Add `(name, guid, location)` records, returning the portals """
+        records = list(records)
+        if self.projection is None:
+            for (_, _, location) in records:
+                if location is not None:
+                    self.projection = LocalProjection(location)
+                    break
+        portals = [
+            Portal(name=name, guid=guid, location=location,
+                   projection=self.projection)
+            for (name, guid, location) in records
+        ]
+        for portal in portals:
+            portal._world = self
+        self._portals.extend(portals)
+        self._portal_set.update(portals)
+        self._register_records(portals, records)
+        self._index.extend(p for p in portals if p.location is not None)
+        return portals
+
+    def _located_links(self, portal):
+        if portal.location is None:
+            return []
+        return [
+            self.get_link(portal, other)
+            for other in portal.neighbours
+            if other.location is not None
+        ]
+
+    def move_portal(self, portal, location):
+        """ Move `portal`, keeping the spatial indexes up to date """
+        self._record('move', portal, portal.location)
+        links = self._located_links(portal)
+        for link in links:
+            self._segments.remove(link)
+        fields = self.fields_on(portal)
+        for field in fields:
+            self._field_tree.remove(field)
+        if portal.location is not None:
+            self._index.remove(portal)
+        portal._place(location)
+        if location is not None:
+            self._index.insert(portal)
+        for link in self._located_links(portal):
+            self._segments.insert(link)
+        for field in fields:
+            self._field_tree.insert(field)
+
+    def portals_in_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        return list(self._index.bbox(min_lat, min_lng, max_lat, max_lng))
+
+    def portals_within(self, location, metres):
+        return list(self._index.radius(location, metres))
+
+    def portals_in_field(self, portal1, portal2, portal3):
+        corners = (portal1, portal2, portal3)
+        return [
+            portal for portal in self._index.triangle(
+                *[p.location for p in corners]
+            ) if portal not in corners
+        ]
+
     def field_exists(self, portal1, portal2, portal3):
-        expected_portals = set([portal1, portal2, portal3])
-        for field in self.fields:
-            if set(field.portals) == expected_portals:
-                return True
-        return False
+        return field_key(portal1, portal2, portal3) in self._field_index
+
+    def get_field(self, portal1, portal2, portal3):
+        return self._field_index.get(field_key(portal1, portal2, portal3))
+
+    def fields_on(self, portal):
+        return self._portal_fields.get(portal, [])
+
+    def fields_at(self, location):
+        """ Fields covering `location`, edges included, outermost first """
+        return self._field_tree.covering(location)
+
+    def fields_over(self, portal):
+        """ Fields covering `portal`, other than those it anchors """
+        return [
+            field for field in self.fields_at(portal.location)
+            if portal not in field.portals
+        ]
+
+    def layers(self, location):
+        return len(self.fields_at(location))
 
     def link_exists(self, portal_one, portal_two):
-        assert portal_one in self._portals, (
+        assert self.has_portal(portal_one), (
             "Unknown portal, {}".format(portal_one)
         )
-        assert portal_two in self._portals, (
+        assert self.has_portal(portal_two), (
             "Unknown portal, {}".format(portal_two)
         )
-        return (
-            portal_one.is_linked_to(portal_two) or
-            portal_two.is_linked_to(portal_one)
-        )
+        return link_key(portal_one, portal_two) in self._links
 
     def area_of_field(self, portal1, portal2, portal3):
-        return area_of_triangle(
-            portal1.location,
-            portal2.location,
-            portal3.location
-        )
+        return self.geometry.area(portal1, portal2, portal3)
+
+    def score_field(self, portal1, portal2, portal3):
+        """
+            What `create_link` maximises: the area, or `field_score` with
+            ties going to the larger area.
+        """
+        area = self.area_of_field(portal1, portal2, portal3)
+        if self.field_score is None:
+            return area
+        return (self.field_score(portal1, portal2, portal3), area)
+
+    def distance(self, portal_one, portal_two):
+        return self.geometry.distance(portal_one, portal_two)
+
+    def portal_inside_field(self, portal, field):
+        return self.geometry.contains(*(list(field.portals) + [portal]))
 
     def create_field(self, portal1, portal2, portal3):
-        self.fields.append(Field([portal1, portal2, portal3]))
+        key = field_key(portal1, portal2, portal3)
+        if key in self._field_index:
+            return self._field_index[key]
+        field = Field([portal1, portal2, portal3])
+        self.fields.append(field)
+        self._field_index[key] = field
+        for portal in (portal1, portal2, portal3):
+            self._portal_fields.setdefault(portal, []).append(field)
+        self._field_tree.insert(field)
+        self._record('field', portal1, portal2, portal3)
+        return field
+
+    def _add_link(self, portal_one, portal_two):
+        key = link_key(portal_one, portal_two)
+        if key in self._links:
+            return False
+        portal_one.add_link(portal_two)
+        link = self._links[key] = Link(portal_one, portal_two)
+        if None not in (portal_one.location, portal_two.location):
+            self._segments.insert(link)
+        self._record('link', portal_one, portal_two)
+        return True
+
+    def crossing_link(self, portal_one, portal_two):
+        if portal_one.location is None or portal_two.location is None:
+            return None
+        for link in self._segments.crossing(
+                portal_one.location, portal_two.location):
+            return link
+        return None
+
+    def find_crossings(self, pairs):
+        return find_crossings([
+            (portal_one.location, portal_two.location)
+            for (portal_one, portal_two) in pairs
+        ])
 
     def create_link(self, portal_one, portal_two):
-        assert portal_one in self._portals, (
+        assert self.has_portal(portal_one), (
             "Unknown portal, {}".format(portal_one)
         )
-        assert portal_two in self._portals, (
+        assert self.has_portal(portal_two), (
             "Unknown portal, {}".format(portal_two)
         )
-        print "\nLinking {} to {}".format(portal_one.name, portal_two.name)
-        portal_one.add_link(portal_two)
-        print "outbound_links for {}: {}".format(
-            portal_one.name,
-            ",".join(p.name for p in portal_one.outbound_links)
-        )
-        print "outbound_links for {}: {}".format(
-            portal_two.name,
-            ",".join(p.name for p in portal_two.outbound_links)
-        )
+        crossing = self.crossing_link(portal_one, portal_two)
+        if crossing is not None:
+            self.events.emit(LINK_BLOCKED, portal_one, portal_two, crossing)
+            return
+        if not self._add_link(portal_one, portal_two):
+            return
+        self.events.emit(LINK_CREATED, portal_one, portal_two)
         # Are there any common linked portals for portal_one and portal_two
         potential_field_portals = (
-            (set(portal_one.outbound_links) | set(portal_one.inbound_links)) &
-            (set(portal_two.outbound_links) | set(portal_two.inbound_links))
-        )
-        print "potential fields created with: {}\n\n".format(
-            potential_field_portals
+            self.neighbours(portal_one) & self.neighbours(portal_two)
         )
         if potential_field_portals:
             size_key = functools.partial(
-                self.area_of_field,
+                self.score_field,
                 portal_one,
                 portal_two
             )
             max_field_portal = max(potential_field_portals, key=size_key)
-            print "max size field created to: {}".format(max_field_portal.name)
             self.create_field(portal_one, portal_two, max_field_portal)
+            self.events.emit(
+                FIELD_CREATED,
+                (portal_one, portal_two, max_field_portal)
+            )
+
+    def checkpoint(self):
+        """
+            Start journaling changes to the world, if not already, and
+            return a mark that `rollback` can return the world to.
+        """
+        if self._journal is None:
+            self._journal = []
+        return len(self._journal)
+
+    def rollback(self, checkpoint):
+        """
+            Undo, newest first, every portal, link, field, move and
+            rename since `checkpoint`. Players and emitted events are
+            left alone.
+        """
+        journal = self._journal
+        if journal is None or not 0 <= checkpoint <= len(journal):
+            raise ValueError("Unknown checkpoint {}".format(checkpoint))
+        self._journal = None
+        try:
+            while len(journal) > checkpoint:
+                entry = journal.pop()
+                getattr(self, '_undo_' + entry[0])(*entry[1:])
+        finally:
+            self._journal = journal
+
+    def commit(self):
+        """ Keep every change and stop journaling """
+        self._journal = None
+
+    def _record(self, *entry):
+        if self._journal is not None:
+            self._journal.append(entry)
+
+    def _undo_rename(self, portal, name):
+        self.rename_portal(portal, name)
+
+    def _undo_move(self, portal, location):
+        self.move_portal(portal, location)
+
+    def _undo_portal(self, portal):
+        if portal.location is not None:
+            self._index.remove(portal)
+        self._unregister(portal)
+        self._portal_set.discard(portal)
+        portal._world = None
+        assert self._portals.pop() is portal
+
+    def _undo_field(self, portal1, portal2, portal3):
+        field = self._field_index.pop(field_key(portal1, portal2, portal3))
+        assert self._fields.pop() is field
+        self._field_tree.remove(field)
+        for portal in (portal1, portal2, portal3):
+            fields = self._portal_fields[portal]
+            fields.pop()
+            if not fields:
+                del self._portal_fields[portal]
+
+    def _undo_link(self, portal_one, portal_two):
+        link = self._links.pop(link_key(portal_one, portal_two))
+        if None not in (portal_one.location, portal_two.location):
+            self._segments.remove(link)
+        portal_one.outbound_links.discard(portal_two)
+        portal_one.neighbours.discard(portal_two)
+        portal_two.inbound_links.discard(portal_one)
+        portal_two.neighbours.discard(portal_one)
 
     def add_player(self, player):
         self.players.append(player)